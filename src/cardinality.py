@@ -0,0 +1,209 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Series cardinality of a Prometheus text exposition, measured in bounded memory."""
+
+import heapq
+import re
+import typing
+
+# Counters kept per label for each of the top values reported, to make the top values exact
+# unless the value distribution is very flat.
+CAPACITY_FACTOR = 10
+LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+# Suffixes of the samples of the counter, histogram and summary families.
+SAMPLE_SUFFIXES = ("_bucket", "_count", "_sum", "_total", "_created", "_gcount", "_gsum")
+
+
+class TopK:
+    """Approximate most frequent values of a stream with the Space-Saving algorithm.
+
+    At most `capacity` values are counted. An unseen value replaces the least frequent one
+    and inherits its count, so the counts are upper bounds, exact for the values that were
+    never evicted.
+    """
+
+    def __init__(self, capacity: int):
+        """Construct.
+
+        Args:
+            capacity: The maximum number of values counted.
+        """
+        self._capacity = capacity
+        self._counts: typing.Dict[str, int] = {}
+        # Min heap of (count, value), with stale entries skipped when popping.
+        self._heap: typing.List[typing.Tuple[int, str]] = []
+
+    def add(self, value: str) -> None:
+        """Count an occurrence of a value.
+
+        Args:
+            value: The value.
+        """
+        count = self._counts.get(value)
+        if count is None:
+            count = 0
+            if len(self._counts) >= self._capacity:
+                count = self._evict()
+        self._counts[value] = count + 1
+        heapq.heappush(self._heap, (count + 1, value))
+        if len(self._heap) > 4 * self._capacity:
+            self._heap = [(count, value) for value, count in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def _evict(self) -> int:
+        """Evict the least frequent value.
+
+        Returns:
+            The count of the evicted value.
+        """
+        while True:
+            count, value = heapq.heappop(self._heap)
+            if self._counts.get(value) == count:
+                del self._counts[value]
+                return count
+
+    def top(self, k: int) -> typing.List[typing.Tuple[str, int]]:
+        """Return the most frequent values.
+
+        Args:
+            k: The number of values.
+
+        Returns:
+            The values and their counts, most frequent first.
+        """
+        return sorted(self._counts.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+class _Family:  # pylint: disable=too-few-public-methods
+    """Series counts of a metric family.
+
+    Attrs:
+        series: number of series.
+        labels: number of series having each label.
+        values: most frequent values of each label.
+    """
+
+    def __init__(self) -> None:
+        """Construct."""
+        self.series = 0
+        self.labels: typing.Dict[str, int] = {}
+        self.values: typing.Dict[str, TopK] = {}
+
+
+def _family_name(sample: str, families: typing.Dict[str, _Family]) -> str:
+    """Return the family of a sample, from the families declared by TYPE comments.
+
+    Args:
+        sample: The name of the sample.
+        families: The families declared so far.
+
+    Returns:
+        The family name.
+    """
+    if sample in families:
+        return sample
+    for suffix in SAMPLE_SUFFIXES:
+        if sample.endswith(suffix) and sample[: -len(suffix)] in families:
+            return sample[: -len(suffix)]
+    return sample
+
+
+def report(lines: typing.Iterable[str], top: int) -> typing.Dict[str, typing.Any]:
+    """Count the series of an exposition per family and per label.
+
+    The exposition is read line by line, and the memory used only depends on the number of
+    families, labels and `top`, not on the size of the exposition.
+
+    Args:
+        lines: The lines of the exposition, in the Prometheus text format.
+        top: The number of most frequent values reported per label.
+
+    Returns:
+        The total number of series, and per family its number of series and, per label, the
+        number of series having it and its most frequent values, largest families first.
+    """
+    families: typing.Dict[str, _Family] = {}
+    for line in lines:
+        if line.startswith("# TYPE "):
+            families.setdefault(line.split(" ", 3)[2], _Family())
+            continue
+        if not line.strip() or line.startswith("#"):
+            continue
+        if "{" in line:
+            name, _, labels = line.partition("{")
+            labels = labels[: labels.rfind("}")]
+        else:
+            name, labels = line.split(" ", 1)[0], ""
+        family = families.setdefault(_family_name(name, families), _Family())
+        family.series += 1
+        for label, value in LABEL_PATTERN.findall(labels):
+            family.labels[label] = family.labels.get(label, 0) + 1
+            if label not in family.values:
+                family.values[label] = TopK(top * CAPACITY_FACTOR)
+            family.values[label].add(value)
+    ordered = sorted(families.items(), key=lambda item: (-item[1].series, item[0]))
+    return {
+        "series": sum(family.series for family in families.values()),
+        "families": {
+            name: {
+                "series": family.series,
+                "labels": {
+                    label: {"series": series, "top": dict(family.values[label].top(top))}
+                    for label, series in sorted(family.labels.items())
+                },
+            }
+            for name, family in ordered
+            if family.series
+        },
+    }
+
+
+def budget_plan(result: typing.Dict[str, typing.Any], budget: int) -> typing.List[dict]:
+    """Choose the series to drop to bring an exposition within a series budget.
+
+    The largest families are reduced first. When most of the series of a family come from
+    the long tail of values of one of its labels, only the series with the most frequent
+    values of the label are kept; otherwise the whole family is dropped.
+
+    Args:
+        result: The cardinality report of the exposition.
+        budget: The maximum number of series.
+
+    Returns:
+        Per family to reduce, its name, the label whose tail is dropped, empty if the family
+        is dropped, and the values of the label kept.
+    """
+    excess = result["series"] - budget
+    plan = []
+    for name, family in result["families"].items():
+        if excess <= 0:
+            break
+        label, tail = "", 0
+        for candidate, counts in family["labels"].items():
+            candidate_tail = counts["series"] - sum(counts["top"].values())
+            if candidate_tail > tail:
+                label, tail = candidate, candidate_tail
+        if 2 * tail >= family["series"]:
+            keep = sorted(family["labels"][label]["top"])
+            plan.append({"family": name, "label": label, "keep": keep})
+            excess -= tail
+        else:
+            plan.append({"family": name, "label": "", "keep": []})
+            excess -= family["series"]
+    return plan
+
+
+def describe(plan: typing.List[dict]) -> str:
+    """Return a short description of what a budget plan drops.
+
+    Args:
+        plan: The plan returned by `budget_plan`.
+
+    Returns:
+        The families dropped, and the families and labels whose tail is dropped.
+    """
+    return ", ".join(
+        f"{entry['family']}{{{entry['label']}}}" if entry["label"] else entry["family"]
+        for entry in plan
+    )
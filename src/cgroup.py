@@ -0,0 +1,116 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Resource limits of the workload container read from its cgroup v2 interface files."""
+
+import typing
+
+import ops
+
+CGROUP_PATH = "/sys/fs/cgroup"
+
+
+class CgroupLimits(typing.NamedTuple):
+    """Resource limits of a container.
+
+    Attrs:
+        cpu: CPU quota in cores, None if unlimited.
+        memory: memory limit in bytes, None if unlimited.
+    """
+
+    cpu: typing.Optional[float]
+    memory: typing.Optional[int]
+
+
+def _read(container: ops.Container, name: str) -> typing.Optional[str]:
+    """Read a cgroup interface file through Pebble.
+
+    Args:
+        container: The container to read the file from.
+        name: The name of the interface file.
+
+    Returns:
+        The stripped content of the file, or None if it can't be read.
+    """
+    try:
+        return container.pull(f"{CGROUP_PATH}/{name}").read().strip()
+    except (ops.pebble.PathError, ops.pebble.APIError):
+        return None
+
+
+def read_limits(container: ops.Container) -> CgroupLimits:
+    """Read the CPU and memory limits of a container.
+
+    Args:
+        container: The container to read the limits of.
+
+    Returns:
+        The limits, with None for the ones that are unlimited or can't be read.
+    """
+    cpu = None
+    cpu_max = _read(container, "cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota.isdigit() and period.isdigit() and int(period):
+            cpu = int(quota) / int(period)
+    memory = None
+    memory_max = _read(container, "memory.max")
+    if memory_max and memory_max.isdigit():
+        memory = int(memory_max)
+    return CgroupLimits(cpu=cpu, memory=memory)
+
+
+class CgroupUsage(typing.NamedTuple):
+    """Resource usage of a container.
+
+    Attrs:
+        cpu_usec: CPU time consumed since the cgroup was created in microseconds, None if
+            it can't be read.
+        memory: current memory usage in bytes, None if it can't be read.
+        memory_peak: peak memory usage since the cgroup was created in bytes, None if it
+            can't be read.
+        cpu_throttled: number of periods in which the CPU quota was exhausted since the
+            cgroup was created, None if it can't be read.
+    """
+
+    cpu_usec: typing.Optional[int]
+    memory: typing.Optional[int]
+    memory_peak: typing.Optional[int]
+    cpu_throttled: typing.Optional[int] = None
+
+
+def _read_int(container: ops.Container, name: str) -> typing.Optional[int]:
+    """Read a cgroup interface file holding a single integer.
+
+    Args:
+        container: The container to read the file from.
+        name: The name of the interface file.
+
+    Returns:
+        The integer, or None if the file can't be read.
+    """
+    value = _read(container, name)
+    return int(value) if value and value.isdigit() else None
+
+
+def read_usage(container: ops.Container) -> CgroupUsage:
+    """Read the CPU and memory usage of a container.
+
+    Args:
+        container: The container to read the usage of.
+
+    Returns:
+        The usage, with None for the values that can't be read.
+    """
+    stat = {}
+    for line in (_read(container, "cpu.stat") or "").splitlines():
+        key, _, value = line.partition(" ")
+        if value.isdigit():
+            stat[key] = int(value)
+    return CgroupUsage(
+        cpu_usec=stat.get("usage_usec"),
+        memory=_read_int(container, "memory.current"),
+        # memory.peak is only available from Linux 5.19
+        memory_peak=_read_int(container, "memory.peak"),
+        cpu_throttled=stat.get("nr_throttled"),
+    )
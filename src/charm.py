@@ -5,132 +5,797 @@
 
 """Charm for GitHub Actions Exporter on kubernetes."""
 
+import contextlib
+import functools
+import itertools
+import json
 import logging
+import os
+import time
 import typing
 
 import ops
-from charms.nginx_ingress_integrator.v0.nginx_route import require_nginx_route
-from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
-from charms.traefik_k8s.v1.ingress import IngressPerAppRequirer
-from ops.charm import CharmBase, HookEvent, WorkloadEvent
-from ops.main import main
+from ops.charm import CharmBase
+from ops.framework import StoredState
 
+import cardinality
+import cgroup
+import drain
+import gateway
 import github_actions_exporter as gh_exporter
+import hook_metrics
+import hook_profiler
+import resources
+import series_budget
+import token_secrets
+import workload_storage
 from charm_state import CharmState
-from constants import GITHUB_CONTAINER_NAME, GITHUB_METRICS_PORT, GITHUB_USER, GITHUB_WEBHOOK_PORT
+from constants import (
+    CHARM_METRICS_PATH,
+    CHARM_METRICS_PORT,
+    EXPORTER_WEBHOOK_PORT,
+    GATEWAY_METRICS_PORT,
+    GITHUB_CONTAINER_NAME,
+    GITHUB_METRICS_PORT,
+    GITHUB_USER,
+    GITHUB_WEBHOOK_PORT,
+    PEER_RELATION_NAME,
+)
 from exceptions import CharmConfigInvalidError
+from hook_metrics import HookMetrics, instrumented
+from lazy_import import lazy_import
+from metrics_endpoint import ExporterMetricsEndpointProvider
+from restart_lock import RestartLock
+
+# The ingress library imports jsonschema, the most expensive import of the dispatch path, to
+# validate the data it publishes, so it is only loaded by the hooks wiring the ingress relation.
+lazy_import("charms.traefik_k8s.v1.ingress")
+
+# pylint: disable=wrong-import-order,wrong-import-position
+from charms.nginx_ingress_integrator.v0.nginx_route import require_nginx_route  # noqa: E402
+from charms.traefik_k8s.v1 import ingress as traefik_ingress  # noqa: E402
+
+# pylint: enable=wrong-import-order,wrong-import-position
 
 logger = logging.getLogger(__name__)
 
+# Values of the worst label of a family kept when the series are over budget.
+BUDGET_TOP_VALUES = 10
+# Minimum time between the samples taken on update-status, in seconds. update-status runs
+# every 5 minutes by default, so most runs take no sample at all.
+SAMPLE_INTERVALS = {
+    "metrics_probe": 15 * 60,
+    "series_measure": 60 * 60,
+    "storage_sample": 15 * 60,
+    "usage_sample": 15 * 60,
+}
+# Hooks none of the relation libraries observe. The libraries are only wired in these hooks
+# if the charm uses them, and actions never need them.
+FAST_PATH_HOOKS = frozenset(
+    {
+        "collect-metrics",
+        "data-storage-attached",
+        "data-storage-detaching",
+        "secret-changed",
+        "update-status",
+    }
+)
+
+
+def _fast_path(dispatch_path: str) -> bool:
+    """Return whether a dispatched hook or action needs no relation library observer.
+
+    Args:
+        dispatch_path: The JUJU_DISPATCH_PATH of the hook, empty outside of Juju.
+
+    Returns:
+        bool: True if the relation libraries can be wired on demand.
+    """
+    kind, _, name = dispatch_path.partition("/")
+    return kind == "actions" or (kind == "hooks" and name in FAST_PATH_HOOKS)
+
 
 class GithubActionsExporterCharm(CharmBase):
-    """Charm the service."""
+    """Charm the service.
+
+    Attrs:
+        hook_metrics: instrumentation of the charm hook handlers.
+        ingress: the ingress per app requirer, wired on first use in the fast path.
+        profiler: actions profiling the charm hooks.
+        restart_lock: lock limiting the number of units restarting at once.
+        restarts_avoided: number of replans skipped because the layer was unchanged.
+        token_secrets: tokens read from the Juju user secrets.
+    """
+
+    _stored = StoredState()
 
     def __init__(self, *args) -> None:
         """Construct."""
         super().__init__(*args)
-        try:
-            self._charm_state = CharmState.from_charm(charm=self)
-        except CharmConfigInvalidError as exc:
-            self.model.unit.status = ops.BlockedStatus(exc.msg)
-            return
-        # service-hostname is a required field so we're hardcoding to the same
-        # value as service-name. service-hostname should be set via Nginx
-        # Ingress Integrator charm config.
-        require_nginx_route(
-            charm=self,
-            service_hostname=self.app.name,
-            service_name=self.app.name,
-            service_port=GITHUB_WEBHOOK_PORT,
+        self._stored.set_default(
+            binary_identity="",
+            workload_version="",
+            usage={},
+            ready=False,
+            budget_plan=[],
+            series_budget=0,
+            metrics_ports=[GITHUB_METRICS_PORT],
+            metrics_timeout=gh_exporter.METRICS_TIMEOUT,
+            last_probe=[],
+            sampled={},
         )
-        self.ingress = IngressPerAppRequirer(
-            self,
-            port=GITHUB_WEBHOOK_PORT,
-            # We're forced to use the app's service endpoint
-            # as the ingress per app interface currently always routes to the leader.
-            # https://github.com/canonical/traefik-k8s-operator/issues/159
-            # For juju >= 3.1.1, this could be used in combination with open-port for true load
-            # balancing.
-            host=f"{self.app.name}-endpoints.{self.model.name}.svc.cluster.local",
-            strip_prefix=True,
+        self.hook_metrics = HookMetrics(self, GITHUB_CONTAINER_NAME)
+        self.restart_lock = RestartLock(self, PEER_RELATION_NAME, self._restart_limit)
+        self.profiler = hook_profiler.HookProfiler(self)
+        # Observes secret-changed before the reconciliation, to refresh the secret first.
+        self.token_secrets = token_secrets.TokenSecrets(self)
+        if _fast_path(os.environ.get("JUJU_DISPATCH_PATH", "")):
+            self.hook_metrics.work("fast_path")
+        else:
+            # service-hostname is a required field so we're hardcoding to the same
+            # value as service-name. service-hostname should be set via Nginx
+            # Ingress Integrator charm config.
+            require_nginx_route(
+                charm=self,
+                service_hostname=self.app.name,
+                service_name=self.app.name,
+                service_port=GITHUB_WEBHOOK_PORT,
+            )
+            self.hook_metrics.work("relation_wiring")
+            # Wire the other libraries now so that they observe the hook.
+            _ = self.ingress, self._metrics_endpoint
+        for event in (
+            self.on.github_actions_exporter_pebble_ready,
+            self.on.github_actions_exporter_pebble_check_failed,
+            self.on.github_actions_exporter_pebble_check_recovered,
+            self.on.config_changed,
+            self.on.upgrade_charm,
+            self.on.leader_elected,
+            self.on.ingress_relation_joined,
+            self.on.data_storage_attached,
+            self.on.secret_changed,
+            self.restart_lock.on.granted,
+        ):
+            self.framework.observe(event, self._on_reconcile_event)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(
+            self.on.cardinality_report_action, self._on_cardinality_report_action
         )
-        self._metrics_endpoint = MetricsEndpointProvider(
+
+    @functools.cached_property
+    def ingress(self) -> "traefik_ingress.IngressPerAppRequirer":
+        """Return the ingress per app requirer.
+
+        The ingress requirements are published by the leader once its exporter is ready.
+
+        Returns:
+            IngressPerAppRequirer: the requirer of the ingress relation.
+        """
+        self.hook_metrics.work("relation_wiring")
+        return traefik_ingress.IngressPerAppRequirer(self, strip_prefix=True)
+
+    @functools.cached_property
+    def _metrics_endpoint(self) -> ExporterMetricsEndpointProvider:
+        """Return the provider of the Prometheus scrape endpoint.
+
+        Returns:
+            ExporterMetricsEndpointProvider: the provider of the metrics-endpoint relation.
+        """
+        self.hook_metrics.work("relation_wiring")
+        return ExporterMetricsEndpointProvider(
             self,
-            jobs=[
-                {
-                    "static_configs": [
-                        {
-                            "targets": [
-                                f"*:{GITHUB_METRICS_PORT}",
-                            ]
-                        }
-                    ]
-                }
+            jobs=self._scrape_jobs,
+            ready=self._is_ready,
+            refresh_event=[
+                self.on.github_actions_exporter_pebble_check_failed,
+                self.on.github_actions_exporter_pebble_check_recovered,
             ],
         )
-        self.framework.observe(
-            self.on.github_actions_exporter_pebble_ready,
-            self._on_github_actions_exporter_pebble_ready,
+
+    @instrumented
+    def _on_reconcile_event(self, _: ops.EventBase) -> None:
+        """Reconcile the workload with the charm state.
+
+        Args:
+            _: Event triggering the reconciliation.
+        """
+        self.reconcile()
+
+    def reconcile(self) -> None:
+        """Bring the workload to the desired state.
+
+        This is idempotent and never defers: every event that can change the desired state
+        calls it, and it does nothing more than setting the status when the workload can't be
+        configured yet.
+        """
+        self.hook_metrics.work("reconcile")
+        self.unit.set_ports(GITHUB_WEBHOOK_PORT, GITHUB_METRICS_PORT)
+        try:
+            state = self._charm_state
+        except CharmConfigInvalidError as exc:
+            self.unit.status = ops.BlockedStatus(exc.msg)
+            return
+        if not gh_exporter.is_configuration_valid(state):
+            self.unit.status = ops.BlockedStatus("Configuration is not valid")
+            return
+        # update-status probes and measures the exporters without reading the configuration.
+        self._stored.series_budget = state.series_budget
+        self._stored.metrics_ports = gh_exporter.metrics_ports(state)
+        self._stored.metrics_timeout = state.metrics_timeout
+        if self.unit.is_leader():
+            try:
+                self._apply_resources(state)
+            except resources.ResourcePatchError as exc:
+                self.unit.status = ops.BlockedStatus(exc.msg)
+                return
+        container = self.unit.get_container(GITHUB_CONTAINER_NAME)
+        if not container.can_connect():
+            self.unit.status = ops.WaitingStatus("Waiting for pebble")
+            return
+        self.unit.status = ops.MaintenanceStatus("Configuring pod")
+        if not self._apply_layer(container):
+            self.unit.status = ops.WaitingStatus("Waiting for restart lock")
+            return
+        self.unit.set_workload_version(self.workload_version(container))
+        ready = self._is_ready()
+        self._stored.ready = ready
+        self._publish(ready)
+        if not ready:
+            self.unit.status = ops.WaitingStatus("Waiting for the exporter to be ready")
+            return
+        self.unit.status = ops.ActiveStatus(self._active_message)
+
+    @property
+    def _active_message(self) -> str:
+        """Return the status message of a ready unit.
+
+        Returns:
+            str: the Go runtime of the exporters and the series dropped over the budget.
+        """
+        message = [" ".join(f"{name}={value}" for name, value in sorted(self._go_runtime.items()))]
+        if self._budget_plan:
+            message.append(
+                f"over series budget, dropped {cardinality.describe(self._budget_plan)}"
+            )
+        return ", ".join(filter(None, message))
+
+    def _is_ready(self) -> bool:
+        """Return whether the exporter of this unit is ready to serve requests.
+
+        Returns:
+            bool: True if the exporter ready check is up and its port accepts connections.
+        """
+        container = self.unit.get_container(GITHUB_CONTAINER_NAME)
+        return container.can_connect() and gh_exporter.is_ready(
+            container, self._metrics_timeout, lambda: self._metrics_probe
         )
-        self.framework.observe(self.on.config_changed, self._on_config_changed)
 
-    def _on_github_actions_exporter_pebble_ready(self, event: WorkloadEvent):
-        """Define and start a workload using the Pebble API.
+    @functools.cached_property
+    def _metrics_probe(self) -> typing.Optional[gh_exporter.Probe]:
+        """Request the exporter metrics once per probe interval, or per restart of the exporter.
+
+        The latest successful probe is kept in the stored state and reused in between, while
+        the Pebble ready check keeps measuring the response time of the metrics. Only the
+        probes taken are recorded in the charm metrics, with the time they were taken at.
+
+        Returns:
+            Probe: the response time and size of the metrics, None if the request failed.
+        """
+        due = self._due("metrics_probe")
+        if self._stored.last_probe and not due:  # type: ignore
+            return gh_exporter.Probe(*self._stored.last_probe)  # type: ignore
+        self.hook_metrics.work("metrics_probe")
+        result = gh_exporter.probe(GITHUB_METRICS_PORT, self._metrics_timeout)
+        self._stored.last_probe = list(result) if result else []
+        if result is None:
+            self.hook_metrics.increment("exporter_probe_failures")
+        else:
+            self.hook_metrics.set_gauge("exporter_metrics_latency_seconds", result.latency)
+            self.hook_metrics.set_gauge("exporter_metrics_size_bytes", result.size)
+            self.hook_metrics.set_gauge("exporter_metrics_probe_timestamp_seconds", time.time())
+        return result
+
+    def _due(self, kind: str) -> bool:
+        """Return whether a sample is due, recording it as taken if so.
 
         Args:
-            event: Event triggering after pebble is ready.
+            kind: The kind of sample, one of `SAMPLE_INTERVALS`.
+
+        Returns:
+            bool: True if the interval of the sample elapsed since it was last taken.
         """
-        container = event.workload
-        self.unit.status = ops.MaintenanceStatus(f"Adding {container.name} layer to pebble")
-        container.add_layer(container.name, self._pebble_layer, combine=True)
-        container.replan()
-        self.unit.status = ops.ActiveStatus()
-        version = gh_exporter.version(container)
-        self.unit.set_workload_version(version)
+        now = time.time()
+        if now - self._stored.sampled.get(kind, 0) < SAMPLE_INTERVALS[kind]:  # type: ignore
+            return False
+        self._stored.sampled[kind] = now  # type: ignore
+        return True
 
-    def _on_config_changed(self, event: HookEvent) -> None:
-        """Handle changed configuration.
+    def _publish(self, ready: bool) -> None:
+        """Advertise this unit to Prometheus, and the application to the ingress, if ready.
+
+        The address of the unit is withdrawn from Prometheus when it is not ready. The
+        ingress routes to the application service, from which Kubernetes removes the pods
+        whose ready checks fail, so the route itself is kept.
 
         Args:
-            event: Event triggering after config is changed.
+            ready: Whether the exporter of this unit is ready.
         """
-        if not gh_exporter.is_configuration_valid(self._charm_state):
-            self.model.unit.status = ops.BlockedStatus("Configuration is not valid")
-            event.defer()
+        self._metrics_endpoint.set_scrape_job_spec(ready=ready)
+        if ready and self.unit.is_leader() and self.ingress.relation:
+            self.ingress.provide_ingress_requirements(
+                # The ingress per app interface always routes to the host published by the
+                # leader. https://github.com/canonical/traefik-k8s-operator/issues/159
+                # Every unit opens its ports, so the application service load balances across
+                # the units. Kubernetes only keeps the pods whose Pebble ready checks pass in
+                # it, as Juju maps the ready level health checks to the pod readiness.
+                host=f"{self.app.name}.{self.model.name}.svc.cluster.local",
+                port=GITHUB_WEBHOOK_PORT,
+            )
+
+    @instrumented
+    def _on_update_status(self, _: ops.UpdateStatusEvent) -> None:
+        """Sample the workload usage and follow the readiness and series of the exporter.
+
+        The samples are only taken once their interval elapsed. The restart lock is released
+        once the exporter is ready, and the workload is reconciled if the readiness or the
+        series dropped over the budget changed since the last reconciliation.
+
+        Args:
+            _: Event triggering the status update.
+        """
+        container = self.unit.get_container(GITHUB_CONTAINER_NAME)
+        if not container.can_connect():
             return
+        self._sample_usage(container)
+        self._probe_metrics()
+        self._sample_storage()
+        budget_changed = self._enforce_series_budget(container)
+        ready = self._is_ready()
+        if self.restart_lock.granted and ready:
+            self.restart_lock.release()
+        # Pebble check events are only emitted from Juju 3.6.
+        if ready != self._stored.ready:
+            logger.info("Exporter readiness changed to %s", ready)
+        if ready != self._stored.ready or budget_changed:
+            self.reconcile()
+
+    def _on_cardinality_report_action(self, event: ops.ActionEvent) -> None:
+        """Report the series cardinality of the exporter metrics.
+
+        Args:
+            event: The cardinality-report action event.
+        """
         container = self.unit.get_container(GITHUB_CONTAINER_NAME)
         if not container.can_connect():
-            event.defer()
-            self.unit.status = ops.WaitingStatus("Waiting for pebble")
+            event.fail("Waiting for pebble")
+            return
+        try:
+            result = cardinality.report(gh_exporter.metrics(container), int(event.params["top"]))
+        except (ops.pebble.ChangeError, ops.pebble.ExecError, ops.pebble.TimeoutError) as exc:
+            event.fail(f"Failed to fetch the metrics: {exc}")
             return
-        self.model.unit.status = ops.MaintenanceStatus("Configuring pod")
-        container.add_layer(GITHUB_CONTAINER_NAME, self._pebble_layer, combine=True)
-        container.replan()
-        self.unit.status = ops.ActiveStatus()
+        families = list(result["families"].items())[: int(event.params["families"])]
+        event.set_results(
+            {
+                "series": result["series"],
+                "families": len(result["families"]),
+                # Metric and label names are not valid action result keys.
+                "report": json.dumps(dict(families), indent=2),
+            }
+        )
+
+    def _apply_resources(self, state: CharmState) -> None:
+        """Patch the StatefulSet with the configured container resources.
+
+        The StatefulSet is left untouched when no requests nor limits are configured.
+
+        Args:
+            state: The charm state.
+        """
+        desired = {
+            GITHUB_CONTAINER_NAME: resources.requirements(
+                state.workload_requests, state.workload_limits
+            ),
+            resources.CHARM_CONTAINER_NAME: resources.requirements(
+                state.charm_requests, state.charm_limits
+            ),
+        }
+        configured = {name: value for name, value in desired.items() if value is not None}
+        if configured and resources.patch_statefulset(self.app.name, self.model.name, configured):
+            logger.info("StatefulSet resources updated, the pods are being rolled")
+
+    def _sample_usage(self, container: ops.Container) -> None:
+        """Record the workload usage peaks and the requests recommended from them.
+
+        Args:
+            container: The workload container.
+        """
+        if not self._due("usage_sample"):
+            return
+        self.hook_metrics.work("usage_sample")
+        previous = dict(self._stored.usage)  # type: ignore
+        peaks = resources.sample(cgroup.read_usage(container), previous, self._limits.cpu)
+        self._stored.usage = peaks
+        for resource, unit in (("cpu", "cores"), ("memory", "bytes")):
+            peak = peaks.get(f"{resource}_peak")
+            if peak is not None:
+                self.hook_metrics.set_gauge(f"workload_{resource}_peak_{unit}", peak)
+                self.hook_metrics.set_gauge(
+                    f"workload_{resource}_recommended_{unit}", peak * resources.HEADROOM
+                )
+        recommendation = resources.recommend(peaks)
+        if recommendation:
+            logger.info("Recommended workload_requests: %s", recommendation)
+
+    def _probe_metrics(self) -> None:
+        """Request the exporter metrics if the probe is due, whatever the ready check says."""
+        if self._metrics_probe is None:
+            logger.warning("Failed to request the exporter metrics")
+
+    def _sample_storage(self) -> None:
+        """Record the capacity and usage of the workload storage in the charm metrics."""
+        path = workload_storage.location(self.model)
+        if path is None or not self._due("storage_sample"):
+            return
+        self.hook_metrics.work("storage_sample")
+        usage = workload_storage.usage(path)
+        self.hook_metrics.set_gauge("storage_capacity_bytes", usage.capacity)
+        self.hook_metrics.set_gauge("storage_used_bytes", usage.used)
+        self.hook_metrics.set_gauge("storage_available_bytes", usage.available)
+        if usage.low:
+            logger.warning(
+                "Workload storage running low: %d of %d bytes available",
+                usage.available,
+                usage.capacity,
+            )
+
+    def _enforce_series_budget(self, container: ops.Container) -> bool:
+        """Measure the series of the exporters and plan what to drop to respect the budget.
+
+        The budget applies to the scrape job of the exporters, so the metrics of the main
+        exporter and of the exporter of each additional organization are measured together.
+        They are measured as served by the exporters, before the filter, so that the plan
+        follows their cardinality. Each unit filters the metrics of its own exporters.
+
+        Args:
+            container: The workload container.
+
+        Returns:
+            bool: True if the plan changed.
+        """
+        budget = self._stored.series_budget  # type: ignore
+        plan: typing.List[dict] = []
+        if budget:  # type: ignore
+            if not self._due("series_measure"):
+                return False
+            self.hook_metrics.work("series_measure")
+            try:
+                result = cardinality.report(
+                    itertools.chain.from_iterable(
+                        gh_exporter.metrics(container, port)
+                        for port in self._stored.metrics_ports  # type: ignore
+                    ),
+                    BUDGET_TOP_VALUES,
+                )
+            except (ops.pebble.ChangeError, ops.pebble.ExecError, ops.pebble.TimeoutError) as exc:
+                logger.warning("Failed to measure the exporter series: %s", exc)
+                return False
+            self.hook_metrics.set_gauge("exporter_series", result["series"])
+            plan = cardinality.budget_plan(result, budget)
+        if plan == self._budget_plan:
+            return False
+        if plan:
+            logger.warning("Exporter series over budget, dropping %s", cardinality.describe(plan))
+        self._stored.budget_plan = plan
+        series_budget.push_plan(container, plan)
+        return True
+
+    @property
+    def _budget_plan(self) -> typing.List[dict]:
+        """Return the series dropped to respect the series budget.
+
+        Returns:
+            List: the plan returned by `cardinality.budget_plan`, empty within the budget.
+        """
+        return [
+            {"family": entry["family"], "label": entry["label"], "keep": list(entry["keep"])}
+            for entry in self._stored.budget_plan  # type: ignore
+        ]
+
+    @property
+    def _metrics_timeout(self) -> int:
+        """Return the maximum response time of the exporter metrics.
+
+        The timeout is stored by the last reconciliation, so that the hooks probing the
+        exporter don't read the configuration and the secrets.
+
+        Returns:
+            int: the configured timeout, or the default one until the configuration is valid.
+        """
+        return self._stored.metrics_timeout  # type: ignore
+
+    def _restart_limit(self) -> int:
+        """Return the maximum number of units restarting at the same time.
+
+        Returns:
+            int: the configured limit, or 1 if the configuration is invalid.
+        """
+        try:
+            return self._charm_state.max_concurrent_restarts
+        except CharmConfigInvalidError:
+            return 1
+
+    def _scrape_jobs(self) -> typing.List[dict]:
+        """Return the Prometheus scrape jobs of the exporters and of the charm.
+
+        Returns:
+            List: the scrape jobs.
+        """
+        try:
+            ports = gh_exporter.metrics_ports(self._charm_state)
+            budget = self._charm_state.series_budget
+        except CharmConfigInvalidError:
+            ports, budget = [GITHUB_METRICS_PORT], 0
+        if budget:
+            # The series over the budget are dropped by the filter.
+            ports = [series_budget.port(port) for port in ports]
+        jobs: typing.List[dict] = [
+            {"static_configs": [{"targets": [f"*:{port}" for port in ports]}]},
+            {
+                "job_name": "charm",
+                "metrics_path": f"/{CHARM_METRICS_PATH.rsplit('/', 1)[-1]}",
+                "static_configs": [{"targets": [f"*:{CHARM_METRICS_PORT}"]}],
+            },
+        ]
+        try:
+            gateway_enabled = gateway.enabled(self._charm_state)
+        except CharmConfigInvalidError:
+            gateway_enabled = False
+        if gateway_enabled:
+            jobs.append(
+                {
+                    "job_name": "webhook-gateway",
+                    "static_configs": [{"targets": [f"*:{GATEWAY_METRICS_PORT}"]}],
+                }
+            )
+        return jobs
+
+    @functools.cached_property
+    def _charm_state(self) -> CharmState:
+        """Return the charm state, validating the configuration on first access.
+
+        Hooks that don't reconcile the workload never read the configuration.
+
+        Returns:
+            CharmState: the validated charm state.
+        """
+        return CharmState.from_charm(charm=self)
 
     @property
+    def restarts_avoided(self) -> int:
+        """Return the number of replans skipped because the layer was unchanged.
+
+        Returns:
+            int: number of restarts avoided since the charm was deployed.
+        """
+        return self.hook_metrics.counter("restarts_avoided")
+
+    def workload_version(self, container: ops.Container) -> str:
+        """Return the workload version, running the binary only when it has changed.
+
+        The version is cached in the stored state keyed by the binary size and modification
+        time, so the exec round trip only happens after the image is updated.
+
+        Args:
+            container: The workload container.
+
+        Returns:
+            str: the GitHub Actions Exporter version.
+        """
+        identity = gh_exporter.binary_identity(container)
+        if identity and identity == self._stored.binary_identity:
+            return self._stored.workload_version  # type: ignore
+        self.hook_metrics.work("version_exec")
+        version = gh_exporter.version(container)
+        if identity:
+            self._stored.binary_identity = identity
+            self._stored.workload_version = version
+        return version
+
+    def _apply_layer(self, container: ops.Container) -> bool:
+        """Add the Pebble layer and replan only if the plan would change.
+
+        Pebble only restarts the services whose definition differs from the current plan on
+        replan, so an unchanged layer is not pushed at all. Restarting a running service
+        requires the restart lock, which is released once the exporter is ready again. The
+        directories of the workload storage are created first, as the services use them.
+
+        Args:
+            container: The workload container.
+
+        Returns:
+            bool: True if the layer is applied, False if waiting for the restart lock.
+        """
+        if workload_storage.location(self.model):
+            workload_storage.prepare(container)
+        layer = self._pebble_layer
+        plan = container.get_plan()
+        services = gh_exporter.changed_services(plan, layer)
+        checks = gh_exporter.changed_checks(plan, layer)
+        if not services and not checks:
+            self.hook_metrics.increment("restarts_avoided")
+            logger.debug("Pebble layer unchanged, skipping replan")
+            return True
+        restarts = [service for service in services if service in plan.services]
+        if restarts and not self.restart_lock.acquire():
+            logger.info("Waiting for the restart lock to restart %s", restarts)
+            return False
+        logger.info("Pebble layer changed, services: %s, checks: %s", services, checks)
+        reloads: typing.List[str] = []
+        if set(gateway.service_names()).intersection(services):
+            gateway.push(container, self._charm_state)
+        elif gateway.enabled(self._charm_state) and gh_exporter.SERVICE_NAME in services:
+            # The webhook token is in the environment of the exporter, the gateway workers
+            # reload it from its file instead of being restarted.
+            gateway.push_secret(container, self._charm_state)
+            reloads = [
+                name
+                for name, service in layer["services"].items()
+                if name in gateway.service_names() and service["startup"] == "enabled"
+            ]
+        if series_budget.SERVICE_NAME in services:
+            series_budget.push(container, self._budget_plan)
+        # A drain interrupted by the charm being killed leaves the unit out of the service.
+        drain.serve(container)
+        with self._drained(container, restarts):
+            container.add_layer(container.name, layer, combine=True)
+            if services:
+                self.hook_metrics.work("replan")
+                gateway.stop_surplus(container, layer["services"])
+                series_budget.stop_disabled(container, layer["services"])
+                container.replan()
+                # The metrics of the restarted exporter are requested again.
+                self.__dict__.pop("_metrics_probe", None)
+                self._stored.sampled.pop("metrics_probe", None)  # type: ignore
+                gateway.reload_secret(container, reloads)
+            else:
+                self.hook_metrics.increment("restarts_avoided")
+            # Wait for the restarted exporter so that the unit is advertised in the same hook.
+            if services and not gh_exporter.wait_ready(
+                container, metrics_timeout=self._metrics_timeout
+            ):
+                logger.warning("Exporter not ready after restart")
+                return True
+        if restarts and self.restart_lock.coordinated:
+            self.restart_lock.release()
+        return True
+
+    @contextlib.contextmanager
+    def _drained(
+        self, container: ops.Container, restarts: typing.List[str]
+    ) -> typing.Iterator[None]:
+        """Drain the webhook connections if their receiver is about to be restarted.
+
+        The deliveries are received by the webhook gateway when it is enabled, and by the
+        exporter otherwise. The drained and dropped connections are counted in the charm
+        metrics.
+
+        Args:
+            container: The workload container.
+            restarts: The services about to be restarted.
+
+        Yields:
+            None, once the exporter is drained.
+        """
+        timeout = self._charm_state.drain_timeout
+        receivers = (
+            gateway.service_names()
+            if gateway.enabled(self._charm_state)
+            else [gh_exporter.SERVICE_NAME]
+        )
+        if not set(receivers).intersection(restarts) or not timeout:
+            yield
+            return
+        with drain.draining(
+            container, timeout, self._charm_state.drain_propagation_delay
+        ) as result:
+            self.hook_metrics.increment("webhook_connections_drained", result.drained)
+            self.hook_metrics.increment("webhook_connections_dropped", result.dropped)
+            yield
+
+    @functools.cached_property
+    def _limits(self) -> cgroup.CgroupLimits:
+        """Return the resource limits of the workload container.
+
+        Returns:
+            CgroupLimits: the CPU and memory limits.
+        """
+        return cgroup.read_limits(self.unit.get_container(GITHUB_CONTAINER_NAME))
+
+    @functools.cached_property
+    def _go_runtime(self) -> typing.Dict[str, str]:
+        """Return the Go runtime environment variables of the exporters.
+
+        Returns:
+            Dict: the configured or derived GOMAXPROCS, GOMEMLIMIT and GOGC variables.
+        """
+        return gh_exporter.go_runtime(
+            self._charm_state,
+            self._limits,
+            gateway.reserved_memory(self._charm_state, self._limits),
+        )
+
+    @property
+    def _kill_delay(self) -> typing.Dict[str, str]:
+        """Return the kill delay of the exporter, giving it the drain timeout to exit.
+
+        Returns:
+            Dict: the kill-delay service option, empty if draining is disabled.
+        """
+        timeout = self._charm_state.drain_timeout
+        return {"kill-delay": f"{timeout}s"} if timeout else {}
+
+    @functools.cached_property
     def _pebble_layer(self) -> ops.pebble.LayerDict:
-        """Return a dictionary representing a Pebble layer."""
+        """Return a dictionary representing a Pebble layer.
+
+        With the webhook gateway enabled, the gateway workers listen on the webhook port and
+        the exporter on an internal one.
+        """
+        command = gh_exporter.COMMAND_PATH
+        receivers: typing.Dict[str, typing.Any] = {}
+        checks: typing.Dict[str, typing.Any] = {}
+        if gateway.enabled(self._charm_state):
+            command = f"{command} --web.listen-address-ingress=:{EXPORTER_WEBHOOK_PORT}"
+            spool_dir = (
+                workload_storage.SPOOL_DIR if workload_storage.location(self.model) else None
+            )
+            receivers = gateway.services(
+                self._charm_state,
+                spool_dir,
+                self._kill_delay,
+                gateway.workers(self._charm_state, self._limits),
+            )
+            checks[gateway.CHECK_NAME] = gateway.check()
         layer = {
             "summary": "GitHub Actions Exporter layer",
             "description": "pebble config layer for GitHub Actions Exporter",
             "services": {
                 "github-actions-exporter": {
                     "override": "replace",
-                    "on-check-failure": {gh_exporter.CHECK_READY_NAME: "restart"},
+                    "on-check-failure": {gh_exporter.CHECK_ALIVE_NAME: "restart"},
                     "summary": "github-actions-exporter",
                     "startup": "enabled",
                     "user": GITHUB_USER,
-                    "command": gh_exporter.COMMAND_PATH,
-                    "environment": gh_exporter.environment(self._charm_state),
-                }
+                    "command": command,
+                    "environment": {
+                        **gh_exporter.environment(self._charm_state),
+                        **self._go_runtime,
+                    },
+                    **self._kill_delay,
+                },
+                **gh_exporter.org_services(self._charm_state, self._go_runtime),
+                hook_metrics.SERVICE_NAME: hook_metrics.service(),
+                series_budget.SERVICE_NAME: series_budget.service(
+                    bool(self._charm_state.series_budget),
+                    gh_exporter.metrics_ports(self._charm_state),
+                ),
+                **receivers,
             },
             "checks": {
-                gh_exporter.CHECK_READY_NAME: gh_exporter.check_ready(),
+                gh_exporter.CHECK_READY_NAME: gh_exporter.check_ready(
+                    timeout=self._charm_state.metrics_timeout
+                ),
+                gh_exporter.CHECK_ALIVE_NAME: gh_exporter.check_alive(
+                    timeout=self._charm_state.metrics_timeout
+                ),
+                **gh_exporter.org_checks(self._charm_state),
+                drain.CHECK_NAME: drain.check(),
+                **checks,
             },
         }
         return typing.cast(ops.pebble.LayerDict, layer)
 
 
 if __name__ == "__main__":  # pragma: nocover
-    main(GithubActionsExporterCharm)
+    hook_profiler.main(GithubActionsExporterCharm)
@@ -4,7 +4,9 @@
 # See LICENSE file for licensing details.
 
 """State of the Charm."""
+
 import itertools
+import re
 import typing
 
 # pydantic is causing this no-name-in-module problem
@@ -13,6 +15,7 @@ from pydantic import (  # pylint: disable=no-name-in-module,import-error
     Extra,
     Field,
     ValidationError,
+    validator,
 )
 
 from exceptions import CharmConfigInvalidError
@@ -21,10 +24,34 @@ if typing.TYPE_CHECKING:
     from charm import GithubActionsExporterCharm
 
 
+# Maximum number of additional organizations, each one runs its own exporter process.
+MAX_GITHUB_ORGS = 20
+GITHUB_ORG_PATTERN = re.compile("^[A-Za-z0-9][A-Za-z0-9-]*$")
+GO_MEM_LIMIT_PATTERN = "^[0-9]+(B|KiB|MiB|GiB|TiB)?$"
+# Kubernetes resource names and quantities accepted in the container requests and limits.
+RESOURCE_NAMES = ("cpu", "memory")
+QUANTITY_PATTERN = re.compile(r"^[0-9]+(\.[0-9]+)?(m|k|M|G|T|Ki|Mi|Gi|Ti)?$")
+# Two segments of the webhook gateway spool, in MiB.
+MIN_WEBHOOK_SPOOL_SIZE = 64
+
 KNOWN_CHARM_CONFIG = (
+    "charm_limits",
+    "charm_requests",
+    "drain_propagation_delay",
+    "drain_timeout",
     "github_api_token",
     "github_org",
+    "github_orgs",
     "github_webhook_token",
+    "go_gc",
+    "go_max_procs",
+    "go_mem_limit",
+    "max_concurrent_restarts",
+    "metrics_timeout",
+    "series_budget",
+    "webhook_spool_size",
+    "workload_limits",
+    "workload_requests",
 )
 
 
@@ -32,14 +59,121 @@ class GithubActionsExporterConfig(BaseModel):  # pylint: disable=too-few-public-
     """Represent GithubActionsExporter builtin configuration values.
 
     Attrs:
+        charm_limits: charm_limits config.
+        charm_requests: charm_requests config.
+        drain_propagation_delay: drain_propagation_delay config.
+        drain_timeout: drain_timeout config.
         github_api_token: github_api_token config.
         github_org: github_org config.
+        github_orgs: github_orgs config, mapping each organization to its API token.
         github_webhook_token: github_webhook_token config.
+        go_gc: go_gc config.
+        go_max_procs: go_max_procs config.
+        go_mem_limit: go_mem_limit config.
+        max_concurrent_restarts: max_concurrent_restarts config.
+        metrics_timeout: metrics_timeout config.
+        series_budget: series_budget config.
+        webhook_spool_size: webhook_spool_size config.
+        workload_limits: workload_limits config.
+        workload_requests: workload_requests config.
     """
 
+    charm_limits: typing.Dict[str, str] = Field(default_factory=dict)
+    charm_requests: typing.Dict[str, str] = Field(default_factory=dict)
+    drain_propagation_delay: int = Field(10, ge=0)
+    drain_timeout: int = Field(30, ge=0)
     github_api_token: str = Field(None)
     github_org: str = Field(None)
+    github_orgs: typing.Dict[str, str] = Field(default_factory=dict)
     github_webhook_token: str = Field(..., min_length=1)
+    go_gc: int = Field(None, ge=1)
+    go_max_procs: int = Field(None, ge=1)
+    go_mem_limit: str = Field(None, regex=GO_MEM_LIMIT_PATTERN)
+    max_concurrent_restarts: int = Field(1, ge=1)
+    metrics_timeout: int = Field(5, ge=1)
+    series_budget: int = Field(0, ge=0)
+    webhook_spool_size: int = Field(512, ge=0)
+    workload_limits: typing.Dict[str, str] = Field(default_factory=dict)
+    workload_requests: typing.Dict[str, str] = Field(default_factory=dict)
+
+    @validator("github_orgs", pre=True)
+    @classmethod
+    def parse_github_orgs(cls, value: typing.Any) -> typing.Dict[str, str]:
+        """Parse the comma separated list of `org=api_token` entries.
+
+        The `org=secret:<id>` entries are resolved to the token of the secret beforehand, by
+        `TokenSecrets.resolve`.
+
+        Args:
+            value: The github_orgs config.
+
+        Returns:
+            The API token of each organization, in configuration order.
+
+        Raises:
+            ValueError: if an entry is malformed or there are too many organizations.
+        """
+        if not value:
+            return {}
+        if isinstance(value, dict):
+            return value
+        orgs: typing.Dict[str, str] = {}
+        for entry in str(value).split(","):
+            org, _, token = entry.strip().partition("=")
+            # GitHub organization names are case insensitive, and so are the service names.
+            duplicate = org.lower() in (known.lower() for known in orgs)
+            if not GITHUB_ORG_PATTERN.match(org) or not token or duplicate:
+                raise ValueError(f"invalid organization entry {org!r}")
+            orgs[org] = token
+        if len(orgs) > MAX_GITHUB_ORGS:
+            raise ValueError(f"at most {MAX_GITHUB_ORGS} organizations are supported")
+        return orgs
+
+    @validator("webhook_spool_size")
+    @classmethod
+    def check_webhook_spool_size(cls, value: int) -> int:
+        """Check that the spool holds at least two segments, or that it is disabled.
+
+        Args:
+            value: The webhook_spool_size config.
+
+        Returns:
+            The webhook_spool_size config.
+
+        Raises:
+            ValueError: if the spool is too small.
+        """
+        if 0 < value < MIN_WEBHOOK_SPOOL_SIZE:
+            raise ValueError(f"the spool size must be 0 or at least {MIN_WEBHOOK_SPOOL_SIZE}")
+        return value
+
+    @validator("charm_limits", "charm_requests", "workload_limits", "workload_requests", pre=True)
+    @classmethod
+    def parse_resources(cls, value: typing.Any) -> typing.Dict[str, str]:
+        """Parse the comma separated list of `resource=quantity` entries.
+
+        Args:
+            value: The requests or limits config of a container.
+
+        Returns:
+            The quantity of each resource.
+
+        Raises:
+            ValueError: if an entry is malformed.
+        """
+        if not value:
+            return {}
+        if isinstance(value, dict):
+            return value
+        resources = {}
+        for entry in str(value).split(","):
+            name, _, quantity = entry.strip().partition("=")
+            if name not in RESOURCE_NAMES or name in resources:
+                raise ValueError(f"invalid resource {name!r}")
+            if not QUANTITY_PATTERN.match(quantity):
+                raise ValueError(f"invalid quantity {quantity!r}")
+            resources[name] = quantity
+        return resources
 
     class Config:  # pylint: disable=too-few-public-methods
         """Config class.
@@ -55,9 +189,23 @@ class CharmState:
     """State of the Charm.
 
     Attrs:
+        charm_limits: charm_limits config.
+        charm_requests: charm_requests config.
+        drain_propagation_delay: drain_propagation_delay config.
+        drain_timeout: drain_timeout config.
         github_api_token: github_api_token config.
         github_org: github_org config.
+        github_orgs: github_orgs config, mapping each organization to its API token.
         github_webhook_token: github_webhook_token config.
+        go_gc: go_gc config.
+        go_max_procs: go_max_procs config.
+        go_mem_limit: go_mem_limit config.
+        max_concurrent_restarts: max_concurrent_restarts config.
+        metrics_timeout: metrics_timeout config.
+        series_budget: series_budget config.
+        webhook_spool_size: webhook_spool_size config.
+        workload_limits: workload_limits config.
+        workload_requests: workload_requests config.
     """
 
     def __init__(
@@ -72,6 +220,42 @@ class CharmState:
         """
         self._github_config = github_config
 
+    @property
+    def charm_limits(self) -> typing.Dict[str, str]:
+        """Return charm_limits config.
+
+        Returns:
+            Dict: the limits of the charm container.
+        """
+        return self._github_config.charm_limits
+
+    @property
+    def charm_requests(self) -> typing.Dict[str, str]:
+        """Return charm_requests config.
+
+        Returns:
+            Dict: the requests of the charm container.
+        """
+        return self._github_config.charm_requests
+
+    @property
+    def drain_propagation_delay(self) -> int:
+        """Return drain_propagation_delay config.
+
+        Returns:
+            int: drain_propagation_delay config, in seconds.
+        """
+        return self._github_config.drain_propagation_delay
+
+    @property
+    def drain_timeout(self) -> int:
+        """Return drain_timeout config.
+
+        Returns:
+            int: drain_timeout config, in seconds.
+        """
+        return self._github_config.drain_timeout
+
     @property
     def github_api_token(self) -> str:
         """Return github_api_token config.
@@ -90,6 +274,15 @@ class CharmState:
         """
         return self._github_config.github_org
 
+    @property
+    def github_orgs(self) -> typing.Dict[str, str]:
+        """Return github_orgs config.
+
+        Returns:
+            Dict: the API token of each additional organization.
+        """
+        return self._github_config.github_orgs
+
     @property
     def github_webhook_token(self) -> str:
         """Return github_webhook_token config.
@@ -99,6 +292,87 @@ class CharmState:
         """
         return self._github_config.github_webhook_token
 
+    @property
+    def go_gc(self) -> typing.Optional[int]:
+        """Return go_gc config.
+
+        Returns:
+            int: go_gc config, None if not set.
+        """
+        return self._github_config.go_gc
+
+    @property
+    def go_max_procs(self) -> typing.Optional[int]:
+        """Return go_max_procs config.
+
+        Returns:
+            int: go_max_procs config, None if not set.
+        """
+        return self._github_config.go_max_procs
+
+    @property
+    def go_mem_limit(self) -> typing.Optional[str]:
+        """Return go_mem_limit config.
+
+        Returns:
+            str: go_mem_limit config, None if not set.
+        """
+        return self._github_config.go_mem_limit
+
+    @property
+    def max_concurrent_restarts(self) -> int:
+        """Return max_concurrent_restarts config.
+
+        Returns:
+            int: max_concurrent_restarts config.
+        """
+        return self._github_config.max_concurrent_restarts
+
+    @property
+    def metrics_timeout(self) -> int:
+        """Return metrics_timeout config.
+
+        Returns:
+            int: metrics_timeout config, in seconds.
+        """
+        return self._github_config.metrics_timeout
+
+    @property
+    def series_budget(self) -> int:
+        """Return series_budget config.
+
+        Returns:
+            int: series_budget config, 0 if the series are not limited.
+        """
+        return self._github_config.series_budget
+
+    @property
+    def webhook_spool_size(self) -> int:
+        """Return webhook_spool_size config.
+
+        Returns:
+            int: webhook_spool_size config in MiB, 0 if the webhook gateway is disabled.
+        """
+        return self._github_config.webhook_spool_size
+
+    @property
+    def workload_limits(self) -> typing.Dict[str, str]:
+        """Return workload_limits config.
+
+        Returns:
+            Dict: the limits of the workload container.
+        """
+        return self._github_config.workload_limits
+
+    @property
+    def workload_requests(self) -> typing.Dict[str, str]:
+        """Return workload_requests config.
+
+        Returns:
+            Dict: the requests of the workload container.
+        """
+        return self._github_config.workload_requests
+
     @classmethod
     def from_charm(cls, charm: "GithubActionsExporterCharm") -> "CharmState":
         """Initialize a new instance of the CharmState class from the associated charm.
@@ -113,6 +387,7 @@ class CharmState:
             CharmConfigInvalidError: if the charm configuration is invalid.
         """
         github_config = {k: v for k, v in charm.config.items() if k in KNOWN_CHARM_CONFIG}
+        github_config.update(charm.token_secrets.resolve(charm.config))
         try:
             valid_github_config = GithubActionsExporterConfig(**github_config)  # type: ignore
         except ValidationError as exc:
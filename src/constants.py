@@ -7,3 +7,10 @@ GITHUB_CONTAINER_NAME = "github-actions-exporter"
 GITHUB_USER = "gh_exporter"
 GITHUB_METRICS_PORT = 9101
 GITHUB_WEBHOOK_PORT = 8065
+PEER_RELATION_NAME = "github-actions-exporter-peers"
+CHARM_METRICS_PORT = 9102
+CHARM_METRICS_DIR = "/srv/gh_exporter/charm-metrics"
+CHARM_METRICS_PATH = f"{CHARM_METRICS_DIR}/metrics.txt"
+# The exporter receives the webhook deliveries replayed by the gateway on this port.
+EXPORTER_WEBHOOK_PORT = 8066
+GATEWAY_METRICS_PORT = 9103
@@ -0,0 +1,133 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Drain of the webhook connections of the exporter before it is restarted."""
+
+import contextlib
+import logging
+import time
+import typing
+
+import ops
+
+from constants import GITHUB_USER, GITHUB_WEBHOOK_PORT
+
+logger = logging.getLogger(__name__)
+
+CHECK_NAME = "github-actions-exporter-draining"
+# Written while the unit is draining. While it exists the draining check fails, so Kubernetes
+# removes the pod from the endpoints of the application service, and no new webhook delivery
+# reaches the unit. The check only depends on the drain, not on any server of the workload.
+DRAINING_PATH = "/srv/gh_exporter/draining"
+# The charm container shares the network namespace of the pod.
+PROC_NET_TCP = ("/proc/net/tcp", "/proc/net/tcp6")
+TCP_ESTABLISHED = "01"
+POLL_INTERVAL = 1
+
+
+class DrainResult(typing.NamedTuple):
+    """Outcome of a drain.
+
+    Attrs:
+        drained: number of connections closed while draining.
+        dropped: number of connections still open when the drain ended.
+    """
+
+    drained: int
+    dropped: int
+
+
+def check() -> typing.Dict[str, typing.Any]:
+    """Return the ready check failing while the exporter is drained.
+
+    Returns:
+        Dict: the check definition.
+    """
+    return {
+        "override": "replace",
+        "level": "ready",
+        "period": "1s",
+        "threshold": 1,
+        "exec": {"command": f"test ! -e {DRAINING_PATH}", "user": GITHUB_USER},
+    }
+
+
+def serve(container: ops.Container) -> None:
+    """Make the draining check pass, putting the unit in the application service.
+
+    Args:
+        container: The workload container.
+    """
+    container.remove_path(DRAINING_PATH, recursive=True)
+
+
+def connections(port: int = GITHUB_WEBHOOK_PORT) -> typing.Set[typing.Tuple[str, str]]:
+    """Return the established TCP connections to a local port.
+
+    Args:
+        port: The local port.
+
+    Returns:
+        The local and remote addresses of the connections, in the kernel hexadecimal format.
+    """
+    suffix = f":{port:04X}"
+    established = set()
+    for path in PROC_NET_TCP:
+        try:
+            with open(path, encoding="ascii") as proc_net_tcp:
+                next(proc_net_tcp, None)
+                for line in proc_net_tcp:
+                    fields = line.split()
+                    if fields[1].endswith(suffix) and fields[3] == TCP_ESTABLISHED:
+                        established.add((fields[1], fields[2]))
+        except FileNotFoundError:
+            continue
+    return established
+
+
+def _wait(timeout: float, propagation_delay: float) -> DrainResult:
+    """Wait for the webhook connections to be closed.
+
+    Args:
+        timeout: Maximum time to wait, in seconds.
+        propagation_delay: Minimum time to wait, for the pod to be removed from the service
+            endpoints, in seconds.
+
+    Returns:
+        The number of connections closed and left open.
+    """
+    start = time.monotonic()
+    seen: typing.Set[typing.Tuple[str, str]] = set()
+    while True:
+        current = connections()
+        seen |= current
+        elapsed = time.monotonic() - start
+        if (not current and elapsed >= min(propagation_delay, timeout)) or elapsed >= timeout:
+            return DrainResult(drained=len(seen - current), dropped=len(current))
+        time.sleep(POLL_INTERVAL)
+
+
+@contextlib.contextmanager
+def draining(
+    container: ops.Container, timeout: float, propagation_delay: float
+) -> typing.Iterator[DrainResult]:
+    """Take the unit out of the application service and wait for its connections to close.
+
+    The unit is put back in the service on exit, once its ready checks pass again.
+
+    Args:
+        container: The workload container.
+        timeout: Maximum time to wait for the connections to close, in seconds.
+        propagation_delay: Minimum time to wait, for the failed readiness probe of the pod to
+            remove it from the service endpoints, in seconds.
+
+    Yields:
+        The outcome of the drain.
+    """
+    container.push(DRAINING_PATH, "", make_dirs=True, user=GITHUB_USER, group=GITHUB_USER)
+    try:
+        result = _wait(timeout, propagation_delay)
+        logger.info("Drained %d webhook connections, dropping %d", result.drained, result.dropped)
+        yield result
+    finally:
+        serve(container)
@@ -0,0 +1,275 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Pebble services of the webhook gateway spooling the deliveries in front of the exporter.
+
+The gateway runs one worker process per core of the CPU quota of the workload container,
+sharing the webhook and metrics ports, as long as the spool holds the two segments each worker
+rotates between.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import pathlib
+import typing
+
+import ops
+
+from cgroup import CgroupLimits
+from charm_state import CharmState
+from constants import (
+    EXPORTER_WEBHOOK_PORT,
+    GATEWAY_METRICS_PORT,
+    GITHUB_USER,
+    GITHUB_WEBHOOK_PORT,
+)
+from gateway_spool import SEGMENT_SIZE
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "webhook-gateway"
+CHECK_NAME = "webhook-gateway-ready"
+SOURCE = pathlib.Path(__file__).with_name("webhook_gateway.py")
+# Modules of the gateway program, imported from the directory of the program.
+SOURCES = [
+    SOURCE,
+    SOURCE.with_name("gateway_admission.py"),
+    SOURCE.with_name("gateway_http.py"),
+    SOURCE.with_name("gateway_spool.py"),
+]
+GATEWAY_DIR = "/srv/gh_exporter/gateway"
+PROGRAM_PATH = f"{GATEWAY_DIR}/{SOURCE.name}"
+# Spool used when the data storage is not attached, lost when the pod is rescheduled.
+EPHEMERAL_SPOOL_DIR = f"{GATEWAY_DIR}/spool"
+# Snapshots of the metrics of the workers, rendered together by the worker answering a scrape.
+STATS_DIR = f"{GATEWAY_DIR}/stats"
+# Webhook secret the signatures of the deliveries are verified with, reloaded on SIGHUP.
+SECRET_PATH = f"{GATEWAY_DIR}/webhook-secret"
+# Bloom filter of the delivery IDs received, shared by the workers.
+DEDUP_PATH = f"{GATEWAY_DIR}/deliveries.bloom"
+# The services of the workers beyond the current number are rendered disabled, and stopped
+# when the CPU quota is lowered.
+MAX_WORKERS = 8
+# Memory used by a worker: the interpreter, the deliveries in flight and its share of the
+# pages of the spool and of the Bloom filter.
+WORKER_MEMORY = 64 * 2**20
+
+
+def enabled(state: CharmState) -> bool:
+    """Return whether the webhook deliveries go through the gateway.
+
+    Args:
+        state: The state of the charm.
+
+    Returns:
+        bool: True if the gateway has a spool.
+    """
+    return bool(state.webhook_spool_size)
+
+
+def workers(state: CharmState, limits: CgroupLimits) -> int:
+    """Return the number of worker processes of the gateway.
+
+    Each worker spools to its own share of the spool, which holds at least two segments, so
+    the workers are capped by the spool size to keep the spool within it.
+
+    Args:
+        state: The state of the charm.
+        limits: The resource limits of the workload container.
+
+    Returns:
+        One worker per core of the CPU quota, or of the node if there is no quota.
+    """
+    cores = math.ceil(limits.cpu) if limits.cpu else os.cpu_count() or 1
+    shares = state.webhook_spool_size * 2**20 // (2 * SEGMENT_SIZE)
+    return max(1, min(MAX_WORKERS, cores, shares))
+
+
+def reserved_memory(state: CharmState, limits: CgroupLimits) -> int:
+    """Return the memory of the workload container used by the gateway workers.
+
+    Args:
+        state: The state of the charm.
+        limits: The resource limits of the workload container.
+
+    Returns:
+        The memory of the workers in bytes, 0 if the gateway is disabled.
+    """
+    return workers(state, limits) * WORKER_MEMORY if enabled(state) else 0
+
+
+def service_name(worker: int) -> str:
+    """Return the name of the Pebble service of a worker.
+
+    The first worker keeps the name of the service of the single process gateway.
+
+    Args:
+        worker: The index of the worker.
+
+    Returns:
+        The service name.
+    """
+    return f"{SERVICE_NAME}-{worker}" if worker else SERVICE_NAME
+
+
+def service_names() -> typing.List[str]:
+    """Return the names of the Pebble services of all the possible workers.
+
+    Returns:
+        The service names.
+    """
+    return [service_name(worker) for worker in range(MAX_WORKERS)]
+
+
+def _digest() -> str:
+    """Return the digest of the gateway program shipped with the charm.
+
+    Returns:
+        The SHA-256 of the sources of the program modules.
+    """
+    digest = hashlib.sha256()
+    for source in SOURCES:
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def services(
+    state: CharmState,
+    spool_dir: typing.Optional[str],
+    kill_delay: typing.Dict[str, str],
+    count: int,
+) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """Return the Pebble services of the workers of the webhook gateway.
+
+    The digest of the program is part of the services, so the gateway is pushed and restarted
+    when the charm is upgraded with a new version of it.
+
+    Args:
+        state: The state of the charm.
+        spool_dir: The spool directory on the data storage, None if it is not attached.
+        kill_delay: The kill-delay service option.
+        count: The number of workers.
+
+    Returns:
+        Dict: the service definitions, keyed by service name.
+    """
+    digest = _digest()
+    return {
+        service_name(worker): {
+            "override": "replace",
+            "on-check-failure": {CHECK_NAME: "restart"},
+            "summary": f"webhook gateway worker {worker}",
+            "startup": "enabled" if worker < count else "disabled",
+            "user": GITHUB_USER,
+            "command": (
+                f"python3 {PROGRAM_PATH}"
+                f" --listen=:{GITHUB_WEBHOOK_PORT}"
+                f" --metrics=:{GATEWAY_METRICS_PORT}"
+                f" --exporter=127.0.0.1:{EXPORTER_WEBHOOK_PORT}"
+                f" --spool={spool_dir or EPHEMERAL_SPOOL_DIR}"
+                f" --max-bytes={state.webhook_spool_size * 2**20}"
+                f" --stats={STATS_DIR}"
+                f" --secret={SECRET_PATH}"
+                f" --dedup={DEDUP_PATH}"
+                f" --workers={count}"
+                f" --worker={worker}"
+            ),
+            "environment": {"WEBHOOK_GATEWAY_DIGEST": digest},
+            **kill_delay,
+        }
+        for worker in range(MAX_WORKERS)
+    }
+
+
+def check() -> typing.Dict[str, typing.Any]:
+    """Return the ready check of the webhook gateway.
+
+    Returns:
+        Dict: the check definition.
+    """
+    return {
+        "override": "replace",
+        "level": "ready",
+        "period": "10s",
+        "threshold": 3,
+        "http": {"url": f"http://localhost:{GATEWAY_METRICS_PORT}/metrics"},
+    }
+
+
+def push(container: ops.Container, state: CharmState) -> None:
+    """Push the gateway program and the webhook secret to the workload container.
+
+    Args:
+        container: The workload container.
+        state: The state of the charm.
+    """
+    for source in SOURCES:
+        container.push(
+            f"{GATEWAY_DIR}/{source.name}",
+            source.read_text(encoding="utf-8"),
+            make_dirs=True,
+            user=GITHUB_USER,
+            group=GITHUB_USER,
+        )
+    push_secret(container, state)
+
+
+def push_secret(container: ops.Container, state: CharmState) -> None:
+    """Push the webhook secret to the workload container.
+
+    Args:
+        container: The workload container.
+        state: The state of the charm.
+    """
+    container.push(
+        SECRET_PATH,
+        state.github_webhook_token,
+        make_dirs=True,
+        permissions=0o600,
+        user=GITHUB_USER,
+        group=GITHUB_USER,
+    )
+
+
+def stop_surplus(container: ops.Container, layer_services: typing.Dict[str, typing.Any]) -> None:
+    """Stop the running workers beyond the current number, before a replan.
+
+    Pebble restarts on replan the running services whose definition changed, even disabled
+    ones, and the number of workers is part of the definition of every worker. Once stopped,
+    the spool of a surplus worker is adopted by the first worker.
+
+    Args:
+        container: The workload container.
+        layer_services: The services of the layer about to be planned.
+    """
+    surplus = [
+        name
+        for name, service in layer_services.items()
+        if name in service_names() and service["startup"] == "disabled"
+    ]
+    if not surplus:
+        return
+    running = [
+        name for name, info in container.get_services(*surplus).items() if info.is_running()
+    ]
+    if running:
+        logger.info("Stopping the surplus gateway workers %s", running)
+        container.stop(*running)
+
+
+def reload_secret(container: ops.Container, names: typing.List[str]) -> None:
+    """Make the running workers reload the webhook secret.
+
+    Args:
+        container: The workload container.
+        names: The service names of the running workers.
+    """
+    if not names:
+        return
+    try:
+        container.send_signal("SIGHUP", *names)
+    except ops.pebble.APIError as exc:
+        # A worker not running loads the secret when it starts.
+        logger.warning("Failed to reload the webhook secret: %s", exc)
@@ -0,0 +1,220 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Admission of the deliveries by the webhook gateway: signature and duplicate checks.
+
+This module is pushed to the workload container along with the webhook gateway program, so it
+only uses the standard library.
+"""
+
+import collections
+import hashlib
+import hmac
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+# Payloads larger than this are verified in a worker thread, hashlib releasing the GIL.
+VERIFY_INLINE_SIZE = 64 * 1024
+VERIFY_THREADS = 4
+SIGNATURE_PREFIX = "sha256="
+LRU_SIZE = 4096
+# Deliveries are remembered for between half the window and the window, in seconds.
+DEDUP_WINDOW = 24 * 60 * 60
+# Delivery IDs remembered per half window within the false positive ratio, which is the
+# ratio of the deliveries wrongly dropped as duplicates.
+BLOOM_CAPACITY = 2**20
+BLOOM_ERROR_RATE = 1e-6
+# Generation number and number of delivery IDs added, at the start of each generation.
+GENERATION = struct.Struct("<QQ")
+
+
+class Verifier:
+    """Verify the HMAC-SHA256 signature of the deliveries with the webhook secret.
+
+    The HMAC state keyed with the secret is computed once, and copied for each delivery.
+    """
+
+    def __init__(self, path: str):
+        """Load the secret.
+
+        Args:
+            path: The path of the file holding the secret.
+        """
+        self._path = path
+        self._mac: typing.Optional[hmac.HMAC] = None
+        self.load()
+
+    def load(self) -> None:
+        """Load the secret again, every delivery being refused if there is none."""
+        try:
+            with open(self._path, "rb") as secret_file:
+                key = secret_file.read().strip()
+        except OSError as exc:
+            logger.error("Deliveries refused, no webhook secret: %s", exc)
+            key = b""
+        else:
+            if not key:
+                logger.error("Deliveries refused, the webhook secret is empty")
+        self._mac = hmac.new(key, digestmod=hashlib.sha256) if key else None
+
+    def verify(self, body: bytes, signature: str) -> bool:
+        """Verify the signature of a delivery.
+
+        Args:
+            body: The body of the delivery.
+            signature: The X-Hub-Signature-256 header of the delivery.
+
+        Returns:
+            True if the signature is valid, False if there is no secret.
+        """
+        if self._mac is None:
+            return False
+        mac = self._mac.copy()
+        mac.update(body)
+        return hmac.compare_digest(SIGNATURE_PREFIX + mac.hexdigest(), signature)
+
+
+class Deduplicator:  # pylint: disable=too-many-instance-attributes
+    """Remember the IDs of the deliveries received, in bounded memory.
+
+    The recent IDs are kept in an exact LRU cache, and all the IDs of the last window in a
+    Bloom filter of two generations of half a window each, the oldest one being cleared when
+    a new one starts. The filter can be backed by a file shared by the workers, so that a
+    duplicate is found whichever worker receives it. The bits of the filter are set without
+    locking, a lost update only letting a duplicate through.
+
+    Attrs:
+        lookups: number of delivery IDs looked up.
+        lru_hits: number of delivery IDs found in the LRU cache.
+        bloom_hits: number of delivery IDs found in the Bloom filter only.
+    """
+
+    def __init__(
+        self,
+        path: typing.Optional[str] = None,
+        capacity: int = BLOOM_CAPACITY,
+        error_rate: float = BLOOM_ERROR_RATE,
+        window: float = DEDUP_WINDOW,
+        lru_size: int = LRU_SIZE,
+    ):  # pylint: disable=too-many-arguments
+        """Open the Bloom filter, creating it if needed.
+
+        Args:
+            path: The file backing the filter, shared by the workers, in memory if None.
+            capacity: The number of IDs per generation within the error rate.
+            error_rate: The false positive ratio of a full generation.
+            window: The time the IDs are remembered for, at most, in seconds.
+            lru_size: The number of recent IDs in the LRU cache.
+        """
+        self._bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self._hashes = max(1, round(self._bits / capacity * math.log(2)))
+        self._generation_size = GENERATION.size + math.ceil(self._bits / 8)
+        self._half_window = window / 2
+        self._lru: typing.OrderedDict[str, None] = collections.OrderedDict()
+        self._lru_size = lru_size
+        self.lookups = 0
+        self.lru_hits = 0
+        self.bloom_hits = 0
+        size = 2 * self._generation_size
+        if path is None:
+            self._map = mmap.mmap(-1, size)
+            return
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o640)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _positions(self, delivery: str) -> typing.List[int]:
+        """Return the bits of a delivery ID in a generation of the Bloom filter.
+
+        Args:
+            delivery: The delivery ID.
+
+        Returns:
+            The bit positions, by double hashing.
+        """
+        digest = hashlib.blake2b(delivery.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * second) % self._bits for index in range(self._hashes)]
+
+    def _generations(self) -> typing.List[typing.Tuple[int, int]]:
+        """Return the current and previous generations of the Bloom filter still valid.
+
+        Returns:
+            The offset of each generation and the number of IDs added to it.
+        """
+        current = int(time.time() // self._half_window)
+        generations = []
+        for number in (current, current - 1):
+            offset = number % 2 * self._generation_size
+            stored, count = GENERATION.unpack_from(self._map, offset)
+            if stored == number:
+                generations.append((offset, count))
+        return generations
+
+    def duplicate(self, delivery: str) -> bool:
+        """Return whether a delivery ID was added in the window.
+
+        Args:
+            delivery: The delivery ID.
+
+        Returns:
+            True if the delivery is a duplicate, or a false positive of the Bloom filter.
+        """
+        self.lookups += 1
+        if delivery in self._lru:
+            self._lru.move_to_end(delivery)
+            self.lru_hits += 1
+            return True
+        positions = self._positions(delivery)
+        for offset, _ in self._generations():
+            start = offset + GENERATION.size
+            if all(self._map[start + bit // 8] & (1 << bit % 8) for bit in positions):
+                self.bloom_hits += 1
+                return True
+        return False
+
+    def add(self, delivery: str) -> None:
+        """Add a delivery ID, starting a new generation of the Bloom filter if needed.
+
+        Args:
+            delivery: The delivery ID.
+        """
+        self._lru[delivery] = None
+        if len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+        number = int(time.time() // self._half_window)
+        offset = number % 2 * self._generation_size
+        stored, count = GENERATION.unpack_from(self._map, offset)
+        start, end = offset + GENERATION.size, offset + self._generation_size
+        if stored != number:
+            self._map[start:end] = bytes(end - start)
+            count = 0
+        for bit in self._positions(delivery):
+            self._map[start + bit // 8] |= 1 << bit % 8
+        GENERATION.pack_into(self._map, offset, number, count + 1)
+
+    def false_positive_ratio(self) -> float:
+        """Estimate the ratio of the new delivery IDs wrongly found in the Bloom filter.
+
+        Returns:
+            The estimated false positive ratio of the generations still valid.
+        """
+        # Summed as logarithms, the ratio of a generation being far below the float epsilon.
+        missed = sum(
+            math.log1p(-((1 - math.exp(-self._hashes * count / self._bits)) ** self._hashes))
+            for _, count in self._generations()
+        )
+        return max(0.0, -math.expm1(missed))
@@ -0,0 +1,202 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""HTTP/1.1 server and client of the webhook gateway, over asyncio streams.
+
+This module is pushed to the workload container along with the webhook gateway program, so it
+only uses the standard library.
+"""
+
+import asyncio
+import typing
+
+MAX_HEAD_SIZE = 64 * 1024
+# Maximum time to receive a request, in seconds. Idle connections are closed after it.
+REQUEST_TIMEOUT = 5
+POOL_SIZE = 8
+REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    411: "Length Required",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+Handler = typing.Callable[
+    [str, str, typing.Dict[str, str], bytes], typing.Awaitable[typing.Tuple[int, bytes]]
+]
+
+
+def parse_head(head: bytes) -> typing.Tuple[typing.List[str], typing.Dict[str, str]]:
+    """Parse the head of an HTTP/1.1 message.
+
+    Args:
+        head: The start line and the headers, up to the empty line.
+
+    Returns:
+        The fields of the start line, and the headers with lower case names.
+
+    Raises:
+        ValueError: if the start line is malformed.
+    """
+    start, *lines = head.decode("latin-1").split("\r\n")
+    fields = start.split(" ", 2)
+    if len(fields) < 2:
+        raise ValueError(f"malformed start line {start!r}")
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return fields, headers
+
+
+async def read_body(reader: asyncio.StreamReader, headers: typing.Dict[str, str]) -> bool:
+    """Read the body of a response, which is small and discarded.
+
+    Args:
+        reader: The stream of the response.
+        headers: The headers of the response.
+
+    Returns:
+        Whether the connection can be reused.
+    """
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readuntil(b"\r\n")
+    else:
+        await reader.read()
+        return False
+    return headers.get("connection", "").lower() != "close"
+
+
+class ExporterPool:
+    """Bounded pool of persistent HTTP/1.1 connections to the exporter."""
+
+    def __init__(self, host: str, port: int, size: int = POOL_SIZE):
+        """Construct.
+
+        Args:
+            host: The host of the exporter.
+            port: The webhook port of the exporter.
+            size: The maximum number of connections.
+        """
+        self._address = (host, port)
+        self._idle: typing.List[typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def post(self, path: str, headers: typing.Dict[str, str], body: memoryview) -> int:
+        """Post a request on an idle or new connection.
+
+        Args:
+            path: The request path.
+            headers: The request headers.
+            body: The request body, written to the connection without being copied.
+
+        Returns:
+            The status of the response.
+        """
+        async with self._slots:
+            if self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(*self._address)
+            try:
+                head = "".join(
+                    (
+                        f"POST {path} HTTP/1.1\r\n",
+                        f"Host: {self._address[0]}:{self._address[1]}\r\n",
+                        f"Content-Length: {len(body)}\r\n",
+                        *(f"{name}: {value}\r\n" for name, value in headers.items()),
+                        "\r\n",
+                    )
+                )
+                writer.write(head.encode("latin-1"))
+                writer.write(body)
+                await writer.drain()
+                fields, response_headers = parse_head(await reader.readuntil(b"\r\n\r\n"))
+                reusable = await read_body(reader, response_headers)
+            except BaseException:
+                writer.close()
+                # The exporter was most likely restarted, the idle connections are stale too.
+                self.close()
+                raise
+            if reusable:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return int(fields[1])
+
+    def close(self) -> None:
+        """Close the idle connections."""
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+def respond(writer: asyncio.StreamWriter, status: int, body: bytes, keep_alive: bool) -> None:
+    """Write a response.
+
+    Args:
+        writer: The stream of the responses.
+        status: The status of the response.
+        body: The body of the response.
+        keep_alive: Whether the connection is kept open.
+    """
+    head = f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: {len(body)}\r\n"
+    if not keep_alive:
+        head += "Connection: close\r\n"
+    writer.write(f"{head}\r\n".encode("latin-1") + body)
+
+
+async def serve(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    handler: Handler,
+    max_length: int,
+    requests: asyncio.Semaphore,
+) -> None:
+    """Serve the requests of a persistent connection until it is closed or idle.
+
+    Args:
+        reader: The stream of the requests.
+        writer: The stream of the responses.
+        handler: Return the status and body of the response to a request.
+        max_length: The maximum length of the body of a request.
+        requests: The semaphore bounding the number of requests handled at once.
+    """
+    try:
+        while True:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+            try:
+                (method, path, *_), headers = parse_head(head)
+            except ValueError:
+                respond(writer, 400, b"", keep_alive=False)
+                return
+            length = headers.get("content-length", "0")
+            if not length.isdigit() or int(length) > max_length:
+                respond(writer, 413 if length.isdigit() else 411, b"", keep_alive=False)
+                return
+            async with requests:
+                body = await asyncio.wait_for(reader.readexactly(int(length)), REQUEST_TIMEOUT)
+                status, content = await handler(method, path, headers, body)
+            keep_alive = headers.get("connection", "").lower() != "close"
+            respond(writer, status, content, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (
+        asyncio.IncompleteReadError,
+        asyncio.LimitOverrunError,
+        asyncio.TimeoutError,
+        ConnectionError,
+    ):
+        return
+    finally:
+        writer.close()
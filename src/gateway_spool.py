@@ -0,0 +1,353 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Spool of the webhook gateway, a durable FIFO queue of the deliveries.
+
+This module is pushed to the workload container along with the webhook gateway program, so it
+only uses the standard library.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import typing
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# GitHub caps the webhook payloads at 25 MB, a segment holds at least one of them.
+SEGMENT_SIZE = 32 * 1024 * 1024
+SEGMENT_SUFFIX = ".spool"
+CURSOR_NAME = "cursor"
+# Payload length, CRC32 of the enqueue time and of the payload, enqueue time in milliseconds.
+RECORD_HEADER = struct.Struct("<IIQ")
+ENQUEUED_AT = struct.Struct("<Q")
+CURSOR = struct.Struct("<QQ")
+# Length of the JSON encoded path and headers preceding the body of a delivery in its record.
+META_LENGTH = struct.Struct("<I")
+# Request headers replayed to the exporter, besides the X- ones.
+FORWARDED_HEADERS = ("content-type", "user-agent")
+
+Position = typing.Tuple[int, int]
+
+
+class SpoolFullError(Exception):
+    """Exception raised when a record doesn't fit in the spool."""
+
+
+class Record(typing.NamedTuple):
+    """Record read from the spool.
+
+    Attrs:
+        enqueued_at: time the record was written, in seconds since the epoch.
+        payload: content of the record, a view of the memory map of its segment.
+    """
+
+    enqueued_at: float
+    payload: memoryview
+
+
+class _Segment:
+    """Memory-mapped, preallocated spool segment file.
+
+    The file is unmapped once the segment and the views of its records are released.
+
+    Attrs:
+        sequence: position of the segment in the spool.
+        path: path of the segment file.
+    """
+
+    def __init__(self, directory: str, sequence: int, size: int):
+        """Open the segment file, creating it if it doesn't exist.
+
+        Args:
+            directory: The spool directory.
+            sequence: The position of the segment in the spool.
+            size: The size of the segment file.
+        """
+        self.sequence = sequence
+        self.path = os.path.join(directory, f"{sequence:020d}{SEGMENT_SUFFIX}")
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o640)
+        try:
+            if os.fstat(fd).st_size != size:
+                # The file is sparse, the blocks are only allocated as records are written.
+                os.ftruncate(fd, size)
+                os.fsync(fd)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._view = memoryview(self._map)
+
+    def read(self, offset: int) -> typing.Optional[typing.Tuple[Record, int]]:
+        """Read the record at an offset.
+
+        Args:
+            offset: The offset of the record.
+
+        Returns:
+            The record and the offset of the next one, None if there is no valid record.
+        """
+        start = offset + RECORD_HEADER.size
+        if start > len(self._view):
+            return None
+        length, crc, enqueued_at = RECORD_HEADER.unpack_from(self._view, offset)
+        end = start + length
+        if not length or end > len(self._view):
+            return None
+        payload = self._view[start:end]
+        if zlib.crc32(payload, zlib.crc32(ENQUEUED_AT.pack(enqueued_at))) != crc:
+            return None
+        return Record(enqueued_at / 1000, payload), end
+
+    def write(self, offset: int, parts: typing.Sequence[typing.Any]) -> int:
+        """Write a record at an offset, without flushing it to the disk.
+
+        Args:
+            offset: The offset of the record.
+            parts: The buffers the content of the record is made of.
+
+        Returns:
+            The offset of the next record.
+        """
+        enqueued_at = int(time.time() * 1000)
+        crc = zlib.crc32(ENQUEUED_AT.pack(enqueued_at))
+        end = offset + RECORD_HEADER.size
+        for part in parts:
+            crc = zlib.crc32(part, crc)
+            following = end + len(part)
+            self._view[end:following] = part
+            end = following
+        RECORD_HEADER.pack_into(
+            self._view, offset, end - offset - RECORD_HEADER.size, crc, enqueued_at
+        )
+        return end
+
+    def flush(self, start: int, end: int) -> None:
+        """Flush a range of the segment to the disk.
+
+        Args:
+            start: The start of the range.
+            end: The end of the range.
+        """
+        # msync only accepts offsets aligned to the pages.
+        aligned = start - start % mmap.ALLOCATIONGRANULARITY
+        self._map.flush(aligned, end - aligned)
+
+
+class Spool:  # pylint: disable=too-many-instance-attributes
+    """Durable FIFO queue of records in memory-mapped segment files.
+
+    Records are framed with their length and CRC, so that a record torn by a crash ends the
+    segment on recovery. The position of the first record not yet acknowledged is kept in
+    the cursor file, and the segments before it are deleted.
+
+    Records are written and read by the event loop and flushed from a worker thread, which
+    only shares the ranges written since the previous flush, under a lock.
+
+    Attrs:
+        depth: number of records not yet acknowledged.
+        size: number of bytes of the records not yet acknowledged.
+        segments: number of segment files.
+        max_payload: size of the largest record accepted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, segment_size: int = SEGMENT_SIZE):
+        """Open the spool and recover its records.
+
+        Args:
+            directory: The directory of the segment files.
+            max_bytes: The maximum size of the segment files.
+            segment_size: The size of a segment file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._max_segments = max(2, max_bytes // segment_size)
+        self._segment_size = segment_size
+        self.max_payload = segment_size - RECORD_HEADER.size
+        self._lock = threading.Lock()
+        self._dirty: typing.List[typing.Tuple[_Segment, int, int]] = []
+        self._new_segment = False
+        self.depth = 0
+        self.size = 0
+        self._segments: typing.List[_Segment] = []
+        self._cursor: Position = (0, 0)
+        self._write_offset = 0
+        self._recover()
+
+    @property
+    def segments(self) -> int:
+        """Return the number of segment files.
+
+        Returns:
+            The number of segment files.
+        """
+        return len(self._segments)
+
+    def _recover(self) -> None:
+        """Open the segments from the cursor on and count the records not acknowledged."""
+        sequences = sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self._directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        try:
+            with open(os.path.join(self._directory, CURSOR_NAME), "rb") as cursor:
+                self._cursor = CURSOR.unpack(cursor.read(CURSOR.size))
+        except (OSError, struct.error):
+            self._cursor = (sequences[0] if sequences else 0, 0)
+        sequence, offset = self._cursor
+        for stale in (number for number in sequences if number < sequence):
+            os.remove(os.path.join(self._directory, f"{stale:020d}{SEGMENT_SUFFIX}"))
+        sequences = [number for number in sequences if number >= sequence] or [sequence]
+        self._segments = [
+            _Segment(self._directory, number, self._segment_size) for number in sequences
+        ]
+        for segment in self._segments:
+            while (entry := segment.read(offset)) is not None:
+                self.depth += 1
+                self.size += len(entry[0].payload)
+                offset = entry[1]
+            self._write_offset, offset = offset, 0
+        logger.info("Recovered %d records from the spool", self.depth)
+
+    def write(self, *parts: typing.Any) -> None:
+        """Write a record, to be flushed to the disk by the next `flush`.
+
+        Args:
+            parts: The buffers the content of the record is made of, copied once to the spool.
+
+        Raises:
+            SpoolFullError: if the record is too large or the spool is full.
+        """
+        length = sum(len(part) for part in parts)
+        if length > self.max_payload:
+            raise SpoolFullError(f"record of {length} bytes larger than a segment")
+        if self._write_offset + RECORD_HEADER.size + length > self._segment_size:
+            if len(self._segments) >= self._max_segments:
+                raise SpoolFullError(f"spool full with {self.depth} records")
+            sequence = self._segments[-1].sequence + 1
+            self._segments.append(_Segment(self._directory, sequence, self._segment_size))
+            self._write_offset = 0
+            with self._lock:
+                self._new_segment = True
+        segment, start = self._segments[-1], self._write_offset
+        self._write_offset = segment.write(start, parts)
+        self.depth += 1
+        self.size += length
+        with self._lock:
+            self._dirty.append((segment, start, self._write_offset))
+
+    def flush(self) -> None:
+        """Flush the records written since the previous flush to the disk."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, []
+            new_segment, self._new_segment = self._new_segment, False
+        ranges: typing.Dict[_Segment, typing.Tuple[int, int]] = {}
+        for segment, start, end in dirty:
+            first, last = ranges.get(segment, (start, end))
+            ranges[segment] = (min(first, start), max(last, end))
+        for segment, (start, end) in ranges.items():
+            segment.flush(start, end)
+        if new_segment:
+            # The directory entries of the new segments have to survive a crash too.
+            fd = os.open(self._directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def append(self, *parts: typing.Any) -> None:
+        """Write a record and flush it to the disk.
+
+        Args:
+            parts: The buffers the content of the record is made of.
+        """
+        self.write(*parts)
+        self.flush()
+
+    def read(
+        self, position: typing.Optional[Position] = None
+    ) -> typing.Optional[typing.Tuple[Record, Position]]:
+        """Read a record, moving to the next segments if needed.
+
+        Args:
+            position: The position of the record, the first one not acknowledged if None.
+
+        Returns:
+            The record and the position of the next one, None if there is no record there.
+        """
+        sequence, offset = position or self._cursor
+        first = self._segments[0].sequence
+        while sequence - first < len(self._segments):
+            entry = self._segments[sequence - first].read(offset)
+            if entry is not None:
+                return entry[0], (sequence, entry[1])
+            sequence, offset = sequence + 1, 0
+        return None
+
+    def ack(self, *entries: typing.Tuple[Record, Position]) -> None:
+        """Acknowledge the first records not acknowledged, deleting the segments consumed.
+
+        Args:
+            entries: The records and the positions of the next ones, as returned by `read`,
+                in order.
+        """
+        for record, self._cursor in entries:
+            self.depth -= 1
+            self.size -= len(record.payload)
+        while self._segments[0].sequence < self._cursor[0]:
+            os.remove(self._segments.pop(0).path)
+        # The cursor is written once per batch and not flushed to the disk: after a crash,
+        # the records acknowledged since the previous flush by the kernel are delivered again.
+        path = os.path.join(self._directory, CURSOR_NAME)
+        with open(f"{path}.tmp", "wb") as cursor:
+            cursor.write(CURSOR.pack(*self._cursor))
+        os.replace(f"{path}.tmp", path)
+
+    def oldest_age(self) -> float:
+        """Return the time the first record not acknowledged has been waiting.
+
+        Returns:
+            The age of the record in seconds, 0 if the spool is empty.
+        """
+        entry = self.read()
+        return max(0.0, time.time() - entry[0].enqueued_at) if entry else 0.0
+
+
+def encode(path: str, headers: typing.Mapping[str, str]) -> bytes:
+    """Encode the path and headers of a delivery, preceding its body in its record.
+
+    Args:
+        path: The request path.
+        headers: The request headers, with lower case names.
+
+    Returns:
+        The length of the JSON encoded path and forwarded headers, then the JSON document.
+    """
+    forwarded = {
+        name: value
+        for name, value in headers.items()
+        if name.startswith("x-") or name in FORWARDED_HEADERS
+    }
+    meta = json.dumps({"path": path, "headers": forwarded}).encode()
+    return META_LENGTH.pack(len(meta)) + meta
+
+
+def decode(payload: memoryview) -> typing.Tuple[str, typing.Dict[str, str], memoryview]:
+    """Decode the record of a delivery.
+
+    Args:
+        payload: The content of the record.
+
+    Returns:
+        The request path and headers, and a view of the body.
+    """
+    (length,) = META_LENGTH.unpack_from(payload)
+    start = META_LENGTH.size
+    end = start + length
+    meta = json.loads(bytes(payload[start:end]))
+    return meta["path"], meta["headers"], payload[end:]
@@ -4,34 +4,234 @@
 
 """Helper module used to manage interactions with GitHub Actions Exporter."""
 
-from re import findall
-from typing import Dict
+import http.client
+import math
+import time
+from re import findall, fullmatch
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional
 
 from ops.model import Container
-from ops.pebble import Check
+from ops.pebble import APIError, Check, CheckStatus, LayerDict, Plan, Service
 
+from cgroup import CgroupLimits
 from charm_state import CharmState
 from constants import GITHUB_METRICS_PORT, GITHUB_USER
 
 COMMAND_PATH = "/srv/gh_exporter/github-actions-exporter"
+SERVICE_NAME = "github-actions-exporter"
 CHECK_READY_NAME = "github-actions-exporter-ready"
+CHECK_ALIVE_NAME = "github-actions-exporter-alive"
+METRICS_PATH = "/metrics"
+# Default ceiling of the /metrics response time, in seconds.
+METRICS_TIMEOUT = 5
+# The exporter always exposes the Go runtime metrics, a smaller body is a broken exposition.
+MIN_METRICS_SIZE = 1024
+# Consecutive failures of the liveness check before Pebble restarts the exporter.
+ALIVE_THRESHOLD = 5
+# The workload image has no HTTP client, the metrics are fetched with its Python interpreter.
+FETCH_METRICS_COMMAND = [
+    "python3",
+    "-c",
+    "import shutil, sys, urllib.request;"
+    " shutil.copyfileobj(urllib.request.urlopen(sys.argv[1], timeout=60), sys.stdout.buffer)",
+]
+FETCH_METRICS_TIMEOUT = 300
+# The exporters of the additional organizations listen on consecutive ports from these ones.
+ORG_METRICS_PORT_BASE = 9110
+# The exporters always listen for webhook deliveries, the ones of the additional organizations
+# on a loopback port picked by the kernel, as the deliveries are received by the main exporter.
+ORG_WEBHOOK_ADDRESS = "127.0.0.1:0"
+# Share of the memory limit given to the Go runtime, the rest is left for non heap memory.
+GO_MEMORY_LIMIT_RATIO = 0.9
+READY_TIMEOUT = 60
+READY_POLL_INTERVAL = 2
+# Pebble returns the durations of the plan in the Go format, 90s is returned as 1m30s.
+DURATION_PATTERN = r"([0-9]*\.?[0-9]+)(ns|us|µs|ms|s|m|h)"
+DURATION_UNITS = {
+    "ns": 1e-9,
+    "us": 1e-6,
+    "µs": 1e-6,
+    "ms": 1e-3,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+}
+SERVICE_DURATIONS = ("kill-delay", "backoff-delay", "backoff-limit")
+CHECK_DURATIONS = ("period", "timeout")
 
 
-def check_ready() -> Dict:
-    """Return the github exporter container check.
+class Probe(NamedTuple):
+    """Outcome of a request to the metrics endpoint of an exporter.
+
+    Attrs:
+        latency: response time, in seconds.
+        size: size of the response body, in bytes.
+    """
+
+    latency: float
+    size: int
+
+
+def _check_metrics(name: str, level: str, port: int, timeout: int, threshold: int) -> Dict:
+    """Return a check requesting the metrics endpoint of an exporter.
+
+    Args:
+        name: The name of the check.
+        level: The level of the check.
+        port: The metrics port of the exporter.
+        timeout: The maximum response time, in seconds.
+        threshold: The number of consecutive failures for the check to be down.
 
     Returns:
         Dict: check object converted to its dict representation.
     """
-    check = Check(CHECK_READY_NAME)
+    check = Check(name)
     check.override = "replace"
-    check.level = "ready"
-    check.tcp = {"port": GITHUB_METRICS_PORT}
-    check.threshold = 2
+    check.level = level
+    check.http = {"url": f"http://localhost:{port}{METRICS_PATH}"}
+    check.timeout = f"{timeout}s"
+    # Pebble requires the period to be longer than the timeout.
+    check.period = f"{max(10, timeout + 1)}s"
+    check.threshold = threshold
     # _CheckDict cannot be imported
     return check.to_dict()  # type: ignore
 
 
+def check_ready(
+    name: str = CHECK_READY_NAME, port: int = GITHUB_METRICS_PORT, timeout: int = METRICS_TIMEOUT
+) -> Dict:
+    """Return the github exporter container ready check.
+
+    The check fails when the metrics are not served within the timeout, which takes the unit
+    out of the traffic without restarting the exporter.
+
+    Args:
+        name: The name of the check.
+        port: The metrics port of the exporter.
+        timeout: The maximum response time, in seconds.
+
+    Returns:
+        Dict: check object converted to its dict representation.
+    """
+    return _check_metrics(name, "ready", port, timeout, threshold=2)
+
+
+def check_alive(
+    name: str = CHECK_ALIVE_NAME, port: int = GITHUB_METRICS_PORT, timeout: int = METRICS_TIMEOUT
+) -> Dict:
+    """Return the github exporter container liveness check.
+
+    The check tolerates twice the response time and more failures than the ready check, as
+    the exporter is restarted when it is down.
+
+    Args:
+        name: The name of the check.
+        port: The metrics port of the exporter.
+        timeout: The maximum response time of the ready check, in seconds.
+
+    Returns:
+        Dict: check object converted to its dict representation.
+    """
+    return _check_metrics(name, "alive", port, 2 * timeout, threshold=ALIVE_THRESHOLD)
+
+
+def binary_identity(container: Container) -> Optional[str]:
+    """Identify the installed GitHub Actions Exporter binary from its file metadata.
+
+    Args:
+        container: The container of the charm.
+
+    Returns:
+        A string built from the binary size and modification time, or None if the
+            binary metadata can't be retrieved.
+    """
+    try:
+        files = container.list_files(COMMAND_PATH)
+    except APIError:
+        return None
+    if not files:
+        return None
+    info = files[0]
+    modified = info.last_modified.timestamp() if info.last_modified else ""
+    return f"{info.size}:{modified}"
+
+
+def _seconds(duration: Any) -> Any:
+    """Convert a Pebble duration to seconds.
+
+    Args:
+        duration: The duration, such as 90s or 1m30s.
+
+    Returns:
+        The duration in seconds, the duration itself if it isn't a Pebble duration.
+    """
+    if not isinstance(duration, str):
+        return duration
+    if duration == "0":
+        return 0
+    if not fullmatch(f"(?:{DURATION_PATTERN})+", duration):
+        return duration
+    seconds = sum(
+        float(value) * DURATION_UNITS[unit] for value, unit in findall(DURATION_PATTERN, duration)
+    )
+    return round(seconds, 9)
+
+
+def _normalized(definition: Mapping[str, Any], durations: tuple) -> Dict[str, Any]:
+    """Return a service or check definition with its durations in seconds.
+
+    Args:
+        definition: The definition, as returned by `to_dict`.
+        durations: The fields of the definition holding durations.
+
+    Returns:
+        The definition, comparable whatever the format of its durations.
+    """
+    return {
+        key: _seconds(value) if key in durations else value for key, value in definition.items()
+    }
+
+
+def changed_services(plan: Plan, layer: LayerDict) -> List[str]:
+    """List the services of a layer whose definition differs from the current plan.
+
+    Args:
+        plan: The current Pebble plan of the container.
+        layer: The desired Pebble layer.
+
+    Returns:
+        The names of the services that are missing from the plan or differ from it.
+    """
+    services = layer.get("services", {})
+    return [
+        name
+        for name, raw in services.items()
+        if name not in plan.services
+        or _normalized(plan.services[name].to_dict(), SERVICE_DURATIONS)
+        != _normalized(Service(name, raw).to_dict(), SERVICE_DURATIONS)  # type: ignore[arg-type]
+    ]
+
+
+def changed_checks(plan: Plan, layer: LayerDict) -> List[str]:
+    """List the checks of a layer whose definition differs from the current plan.
+
+    Args:
+        plan: The current Pebble plan of the container.
+        layer: The desired Pebble layer.
+
+    Returns:
+        The names of the checks that are missing from the plan or differ from it.
+    """
+    checks = layer.get("checks", {})
+    return [
+        name
+        for name, raw in checks.items()
+        if name not in plan.checks
+        or _normalized(plan.checks[name].to_dict(), CHECK_DURATIONS)
+        != _normalized(Check(name, raw).to_dict(), CHECK_DURATIONS)  # type: ignore[arg-type]
+    ]
+
+
 def environment(state: CharmState) -> Dict[str, str]:
     """Generate a environment dictionary from the charm configurations.
 
@@ -48,6 +248,230 @@ def environment(state: CharmState) -> Dict[str, str]:
     }
 
 
+def _org_service_name(org: str) -> str:
+    """Return the name of the Pebble service of an additional organization.
+
+    Args:
+        org: The GitHub organization.
+
+    Returns:
+        The service name.
+    """
+    return f"{SERVICE_NAME}-{org.lower()}"
+
+
+def org_metrics_ports(state: CharmState) -> List[int]:
+    """Return the metrics ports of the exporters of the additional organizations.
+
+    Args:
+        state: The state of the charm.
+
+    Returns:
+        The metrics ports, in configuration order.
+    """
+    return [ORG_METRICS_PORT_BASE + index for index in range(len(state.github_orgs))]
+
+
+def metrics_ports(state: CharmState) -> List[int]:
+    """Return the metrics ports of the main exporter and of the additional organizations.
+
+    Args:
+        state: The state of the charm.
+
+    Returns:
+        The metrics ports, the one of the main exporter first.
+    """
+    return [GITHUB_METRICS_PORT, *org_metrics_ports(state)]
+
+
+def org_services(
+    state: CharmState, runtime: Optional[Dict[str, str]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Generate one Pebble service per additional organization.
+
+    Each exporter collects the billing metrics of its organization on its own metrics port.
+    Webhook deliveries are received by the main exporter, so the webhook listeners of the
+    others are not reachable from outside the workload container.
+
+    Args:
+        state: The state of the charm.
+        runtime: The Go runtime environment variables.
+
+    Returns:
+        The service definitions, keyed by service name.
+    """
+    services = {}
+    for index, (org, api_token) in enumerate(state.github_orgs.items()):
+        name = _org_service_name(org)
+        services[name] = {
+            "override": "replace",
+            "on-check-failure": {f"{name}-alive": "restart"},
+            "summary": f"github-actions-exporter for {org}",
+            "startup": "enabled",
+            "user": GITHUB_USER,
+            "command": (
+                f"{COMMAND_PATH}"
+                f" --web.listen-address=:{ORG_METRICS_PORT_BASE + index}"
+                f" --web.listen-address-ingress={ORG_WEBHOOK_ADDRESS}"
+            ),
+            "environment": {
+                **environment(state),
+                "GITHUB_API_TOKEN": api_token,
+                "GITHUB_ORG": org,
+                **(runtime or {}),
+            },
+        }
+    return services
+
+
+def org_checks(state: CharmState) -> Dict[str, Dict]:
+    """Generate the ready and liveness checks of the exporters of the additional organizations.
+
+    Args:
+        state: The state of the charm.
+
+    Returns:
+        The check definitions, keyed by check name.
+    """
+    checks = {}
+    for org, port in zip(state.github_orgs, org_metrics_ports(state)):
+        name = _org_service_name(org)
+        checks[f"{name}-ready"] = check_ready(f"{name}-ready", port, state.metrics_timeout)
+        checks[f"{name}-alive"] = check_alive(f"{name}-alive", port, state.metrics_timeout)
+    return checks
+
+
+def go_runtime(state: CharmState, limits: CgroupLimits, reserved: int = 0) -> Dict[str, str]:
+    """Generate the Go runtime environment variables of the exporters.
+
+    Without them, the Go runtime sizes itself from the node and not from the container limits,
+    which leads to CPU throttling and OOM kills.
+
+    Args:
+        state: The state of the charm.
+        limits: The resource limits of the workload container.
+        reserved: The memory used by the other processes of the container, in bytes. The
+            exporters keep at least half of the memory limit.
+
+    Returns:
+        The GOMAXPROCS, GOMEMLIMIT and GOGC variables that are configured or can be derived.
+    """
+    runtime = {}
+    if state.go_max_procs:
+        runtime["GOMAXPROCS"] = str(state.go_max_procs)
+    elif limits.cpu:
+        runtime["GOMAXPROCS"] = str(max(1, math.ceil(limits.cpu)))
+    if state.go_mem_limit:
+        runtime["GOMEMLIMIT"] = state.go_mem_limit
+    elif limits.memory:
+        processes = 1 + len(state.github_orgs)
+        available = max(limits.memory - reserved, limits.memory / 2)
+        share = available * GO_MEMORY_LIMIT_RATIO / processes
+        runtime["GOMEMLIMIT"] = f"{int(share) // 2**20}MiB"
+    if state.go_gc:
+        runtime["GOGC"] = str(state.go_gc)
+    return runtime
+
+
+def probe(port: int = GITHUB_METRICS_PORT, timeout: float = METRICS_TIMEOUT) -> Optional[Probe]:
+    """Request the metrics endpoint of an exporter.
+
+    The charm container shares the pod network namespace with the workload.
+
+    Args:
+        port: The metrics port of the exporter.
+        timeout: The maximum response time, in seconds.
+
+    Returns:
+        The response time and size, None if the request failed.
+    """
+    start = time.monotonic()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        connection.request("GET", METRICS_PATH)
+        response = connection.getresponse()
+        size = 0
+        while chunk := response.read(64 * 1024):
+            size += len(chunk)
+        if response.status != 200:
+            return None
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+    return Probe(latency=time.monotonic() - start, size=size)
+
+
+def is_ready(
+    container: Container,
+    timeout: float = METRICS_TIMEOUT,
+    probe_metrics: Optional[Callable[[], Optional[Probe]]] = None,
+) -> bool:
+    """Check if the GitHub Actions Exporter is ready to serve requests.
+
+    Pebble reports a check as up until it has failed `threshold` times, so the metrics are
+    also requested directly, and their size checked, which Pebble checks don't do.
+
+    Args:
+        container: The container of the charm.
+        timeout: The maximum response time of the metrics endpoint, in seconds.
+        probe_metrics: Return the result of a request of the metrics endpoint, so that a
+            request already made in the hook is reused. A new request is made if None.
+
+    Returns:
+        True if the ready check is up and the metrics are served in time.
+    """
+    check = container.get_checks(CHECK_READY_NAME).get(CHECK_READY_NAME)
+    if not check or check.status != CheckStatus.UP:
+        return False
+    result = probe_metrics() if probe_metrics else probe(GITHUB_METRICS_PORT, timeout)
+    return bool(result and result.latency <= timeout and result.size >= MIN_METRICS_SIZE)
+
+
+def wait_ready(
+    container: Container, timeout: float = READY_TIMEOUT, metrics_timeout: float = METRICS_TIMEOUT
+) -> bool:
+    """Wait for the GitHub Actions Exporter to be ready to serve requests.
+
+    Args:
+        container: The container of the charm.
+        timeout: Maximum time to wait, in seconds.
+        metrics_timeout: The maximum response time of the metrics endpoint, in seconds.
+
+    Returns:
+        True if the exporter became ready before the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while not is_ready(container, metrics_timeout):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(READY_POLL_INTERVAL)
+    return True
+
+
+def metrics(container: Container, port: int = GITHUB_METRICS_PORT) -> Iterator[str]:
+    """Stream the metrics exposed by the GitHub Actions Exporter, through Pebble.
+
+    Args:
+        container: The container of the charm.
+        port: The metrics port of the exporter, the one of the main exporter by default.
+
+    Yields:
+        The lines of the exposition.
+
+    Raises:
+        ExecError: if the metrics can't be fetched.
+    """
+    process = container.exec(
+        [*FETCH_METRICS_COMMAND, f"http://127.0.0.1:{port}{METRICS_PATH}"],
+        user=GITHUB_USER,
+        encoding="utf-8",
+        timeout=FETCH_METRICS_TIMEOUT,
+    )
+    yield from process.stdout  # type: ignore
+    process.wait()
+
+
 def is_configuration_valid(state: CharmState) -> bool:
     """Check if there is no empty configuration.
 
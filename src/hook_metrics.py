@@ -0,0 +1,357 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Instrumentation of the charm hook handlers exposed as Prometheus metrics."""
+
+import contextlib
+import functools
+import hashlib
+import logging
+import re
+import resource
+import time
+import typing
+
+import ops
+from opentelemetry import trace
+from ops.framework import StoredState
+
+from constants import CHARM_METRICS_DIR, CHARM_METRICS_PATH, CHARM_METRICS_PORT, GITHUB_USER
+
+logger = logging.getLogger(__name__)
+
+# Number of hook samples kept in the ring buffer.
+RING_SIZE = 32
+METRIC_PREFIX = "charm"
+SERVICE_NAME = "charm-metrics"
+# Names of the spans of the hook tools run by ops, the other spans have spaces or dots.
+HOOK_TOOL = re.compile("^[a-z][a-z-]*$")
+
+
+class _SpanCounter(trace.NoOpTracer):
+    """Count the spans ops starts for its Pebble requests and the hook tools it runs.
+
+    ops traces every Pebble request in a `pebble <method>` span and every hook tool but
+    juju-log in a span named after the tool, through the OpenTelemetry API.
+
+    Attrs:
+        counts: number of spans started with each name since the counts were last taken.
+    """
+
+    def __init__(self):
+        """Construct."""
+        self.counts: typing.Dict[str, int] = {}
+
+    def start_span(self, name: str, *args, **kwargs) -> trace.Span:
+        """Count a span, which is not recorded.
+
+        Args:
+            name: The name of the span.
+            args: The positional arguments of the span.
+            kwargs: The keyword arguments of the span.
+
+        Returns:
+            The span.
+        """
+        self.counts[name] = self.counts.get(name, 0) + 1
+        return super().start_span(name, *args, **kwargs)
+
+    def take(self) -> typing.Tuple[int, typing.Dict[str, int]]:
+        """Return the counts and reset them.
+
+        Returns:
+            The number of Pebble requests, and the number of invocations of each hook tool.
+        """
+        counts, self.counts = self.counts, {}
+        pebble = sum(count for name, count in counts.items() if name.startswith("pebble "))
+        tools = {name: count for name, count in counts.items() if HOOK_TOOL.match(name)}
+        return pebble, tools
+
+
+class _SpanCounterProvider(trace.NoOpTracerProvider):  # pylint: disable=too-few-public-methods
+    """Tracer provider counting the spans of ops."""
+
+    def __init__(self, counter: _SpanCounter):
+        """Construct.
+
+        Args:
+            counter: The tracer counting the spans of ops.
+        """
+        self.counter = counter
+
+    def get_tracer(self, instrumenting_module_name: str, *args, **kwargs) -> trace.Tracer:
+        """Return the counting tracer to ops, and a tracer doing nothing to the others.
+
+        Args:
+            instrumenting_module_name: The name of the instrumented library.
+            args: The other positional arguments of the tracer.
+            kwargs: The other keyword arguments of the tracer.
+
+        Returns:
+            The tracer.
+        """
+        if instrumenting_module_name == "ops":
+            return self.counter
+        return super().get_tracer(instrumenting_module_name, *args, **kwargs)
+
+
+def _span_counter() -> typing.Optional[_SpanCounter]:
+    """Return the counter of the spans of ops, set as the global tracer provider.
+
+    Returns:
+        The counter, None if another tracer provider is already set.
+    """
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, trace.ProxyTracerProvider):
+        provider = _SpanCounterProvider(_SpanCounter())
+        trace.set_tracer_provider(provider)
+    if isinstance(provider, _SpanCounterProvider):
+        return provider.counter
+    logger.debug("Tracer provider already set, Pebble and hook tool calls are not counted")
+    return None
+
+
+class HookMetrics(ops.Object):
+    """Record per hook wall time, CPU time, peak RSS, deferrals, Pebble and hook tool calls.
+
+    The samples are kept in a ring buffer in the charm stored state and published in the
+    Prometheus text format to the workload container, where they are served for scraping.
+    """
+
+    _stored = StoredState()
+
+    def __init__(self, charm: ops.CharmBase, container_name: str):
+        """Construct.
+
+        Args:
+            charm: The charm to instrument.
+            container_name: The name of the container the metrics are published to.
+        """
+        super().__init__(charm, "hook-metrics")
+        self._stored.set_default(samples=[], hooks={}, counters={}, gauges={}, published="")
+        self._container = charm.unit.get_container(container_name)
+        # Counted from the construction of the charm, so the calls of the libraries are too.
+        self._spans = _span_counter()
+        if self._spans:
+            self._spans.take()
+        # Work done since the last sample, including while the charm is constructed.
+        self._work: typing.Dict[str, int] = {}
+
+    @property
+    def samples(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Return the most recent hook samples.
+
+        Returns:
+            The samples, oldest first.
+        """
+        return [dict(sample) for sample in self._stored.samples]  # type: ignore
+
+    def counter(self, name: str) -> int:
+        """Return the value of a charm counter.
+
+        Args:
+            name: The name of the counter.
+
+        Returns:
+            The value of the counter.
+        """
+        return self._stored.counters.get(name, 0)  # type: ignore
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increment a charm counter.
+
+        Args:
+            name: The name of the counter.
+            value: The increment.
+        """
+        self._stored.counters[name] = self.counter(name) + value  # type: ignore
+
+    def work(self, kind: str, value: int = 1) -> None:
+        """Count work done by the current hook, reported with its next sample.
+
+        Args:
+            kind: The kind of work.
+            value: The amount of work.
+        """
+        self._work[kind] = self._work.get(kind, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Set a charm gauge.
+
+        Args:
+            name: The name of the gauge.
+            value: The value.
+        """
+        self._stored.gauges[name] = value  # type: ignore
+
+    @contextlib.contextmanager
+    def measure(self, event: ops.EventBase) -> typing.Iterator[None]:
+        """Measure the handling of an event and publish the updated metrics.
+
+        Args:
+            event: The event being handled.
+
+        Yields:
+            None, once the measurement has started.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            pebble, tools = self._spans.take() if self._spans else (0, {})
+            self._record(
+                {
+                    "hook": event.handle.kind,
+                    "wall": time.perf_counter() - wall,
+                    "cpu": time.process_time() - cpu,
+                    # ru_maxrss is in kilobytes on Linux
+                    "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                    "deferred": int(event.deferred),
+                    "pebble": pebble,
+                    "work": self._work,
+                    "tools": tools,
+                }
+            )
+            self._work = {}
+            self._publish()
+
+    def _record(self, sample: typing.Dict[str, typing.Any]) -> None:
+        """Add a sample to the ring buffer and to the per hook totals.
+
+        Args:
+            sample: The measurements of a hook handler.
+        """
+        logger.debug("Hook sample: %s", sample)
+        samples = self._stored.samples
+        samples.append(sample)  # type: ignore
+        while len(samples) > RING_SIZE:  # type: ignore
+            del samples[0]  # type: ignore
+        totals = dict(self._stored.hooks.get(sample["hook"], {}))  # type: ignore
+        totals["runs"] = totals.get("runs", 0) + 1
+        for key in ("wall", "cpu", "deferred", "pebble"):
+            totals[key] = totals.get(key, 0) + sample[key]
+        work = dict(totals.get("work", {}))
+        for kind, value in sample["work"].items():
+            work[kind] = work.get(kind, 0) + value
+        totals["work"] = work
+        tools = dict(totals.get("tools", {}))
+        for tool, value in sample["tools"].items():
+            tools[tool] = tools.get(tool, 0) + value
+        totals["tools"] = tools
+        self._stored.hooks[sample["hook"]] = totals  # type: ignore
+
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text format.
+
+        Returns:
+            The metrics exposition.
+        """
+        hooks = {hook: dict(totals) for hook, totals in self._stored.hooks.items()}  # type: ignore
+        samples = self.samples
+        lines: typing.List[str] = []
+
+        def family(name: str, kind: str, help_text: str, values: typing.Dict[str, float]):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in values.items():
+                lines.append(f"{METRIC_PREFIX}_{name}{labels} {value}")
+
+        def per_hook(key: str) -> typing.Dict[str, float]:
+            return {f'{{hook="{hook}"}}': totals[key] for hook, totals in sorted(hooks.items())}
+
+        family("hook_runs_total", "counter", "Hook handlers run.", per_hook("runs"))
+        family("hook_deferred_total", "counter", "Events deferred.", per_hook("deferred"))
+        family("hook_wall_seconds_total", "counter", "Wall time in handlers.", per_hook("wall"))
+        family("hook_cpu_seconds_total", "counter", "CPU time in handlers.", per_hook("cpu"))
+        family(
+            "hook_pebble_requests_total", "counter", "Pebble requests made.", per_hook("pebble")
+        )
+        family(
+            "hook_work_total",
+            "counter",
+            "Work done by the handlers.",
+            {
+                f'{{hook="{hook}",work="{kind}"}}': value
+                for hook, totals in sorted(hooks.items())
+                for kind, value in sorted(totals.get("work", {}).items())
+            },
+        )
+        family(
+            "hook_tool_calls_total",
+            "counter",
+            "Juju hook tools run by the handlers.",
+            {
+                f'{{hook="{hook}",tool="{tool}"}}': value
+                for hook, totals in sorted(hooks.items())
+                for tool, value in sorted(totals.get("tools", {}).items())
+            },
+        )
+        latest = {sample["hook"]: sample for sample in samples}
+        family(
+            "hook_last_wall_seconds",
+            "gauge",
+            "Wall time of the latest run of each handler.",
+            {f'{{hook="{hook}"}}': sample["wall"] for hook, sample in sorted(latest.items())},
+        )
+        family(
+            "hook_max_rss_bytes",
+            "gauge",
+            "Peak resident set size over the recent hooks.",
+            {"": max((sample["rss"] for sample in samples), default=0)},
+        )
+        for name, value in sorted(self._stored.counters.items()):  # type: ignore
+            family(f"{name}_total", "counter", f"Charm {name.replace('_', ' ')}.", {"": value})
+        for name, value in sorted(self._stored.gauges.items()):  # type: ignore
+            family(name, "gauge", f"Charm {name.replace('_', ' ')}.", {"": value})
+        return "\n".join(lines) + "\n"
+
+    def _publish(self) -> None:
+        """Write the metrics to the workload container if they changed and it is reachable."""
+        metrics = self.render()
+        digest = hashlib.sha256(metrics.encode()).hexdigest()
+        if digest == self._stored.published or not self._container.can_connect():
+            return
+        self._container.push(
+            CHARM_METRICS_PATH,
+            metrics,
+            make_dirs=True,
+            user=GITHUB_USER,
+            group=GITHUB_USER,
+        )
+        self._stored.published = digest
+
+
+def service() -> typing.Dict[str, typing.Any]:
+    """Return the Pebble service serving the charm metrics from the workload container.
+
+    Returns:
+        Dict: the service definition.
+    """
+    return {
+        "override": "replace",
+        "summary": "charm hook metrics",
+        "startup": "enabled",
+        "user": GITHUB_USER,
+        "command": (
+            f"python3 -m http.server {CHARM_METRICS_PORT} --directory {CHARM_METRICS_DIR}"
+        ),
+    }
+
+
+def instrumented(handler: typing.Callable) -> typing.Callable:
+    """Decorate a charm event handler to measure it with the charm `hook_metrics`.
+
+    Args:
+        handler: The event handler.
+
+    Returns:
+        The instrumented handler.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(charm, event):
+        with charm.hook_metrics.measure(event):
+            return handler(charm, event)
+
+    return wrapper
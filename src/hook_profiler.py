@@ -0,0 +1,181 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Profiling of the charm hooks with cProfile, enabled for a number of hooks by an action."""
+
+import io
+import os
+import pathlib
+import time
+import typing
+
+import ops
+
+# ops keeps the charm state in the charm directory, the profiles are kept next to it.
+PROFILES_DIRNAME = ".profiles"
+REMAINING_FILENAME = "remaining"
+PROFILE_SUFFIX = ".pstats"
+PROFILE_ACTION_DISPATCH_PATH = "actions/profile-hooks"
+MAX_PROFILES = 100
+
+
+def _profiles_dir(charm_dir: typing.Optional[pathlib.Path] = None) -> pathlib.Path:
+    """Return the directory holding the profiles.
+
+    Args:
+        charm_dir: The charm directory, taken from the Juju environment if not given.
+
+    Returns:
+        The profiles directory.
+    """
+    if charm_dir is None:
+        charm_dir = pathlib.Path(
+            os.environ.get("JUJU_CHARM_DIR", pathlib.Path(__file__).parent.parent)
+        )
+    return charm_dir / PROFILES_DIRNAME
+
+
+def _remaining(profiles_dir: pathlib.Path) -> int:
+    """Return the number of hooks still to profile.
+
+    Args:
+        profiles_dir: The profiles directory.
+
+    Returns:
+        The number of hooks, 0 if profiling is disabled.
+    """
+    try:
+        return int((profiles_dir / REMAINING_FILENAME).read_text(encoding="ascii"))
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _set_remaining(profiles_dir: pathlib.Path, count: int) -> None:
+    """Set the number of hooks still to profile.
+
+    Args:
+        profiles_dir: The profiles directory.
+        count: The number of hooks, 0 to disable profiling.
+    """
+    path = profiles_dir / REMAINING_FILENAME
+    if count <= 0:
+        path.unlink(missing_ok=True)
+        return
+    profiles_dir.mkdir(parents=True, exist_ok=True)
+    path.write_text(str(count), encoding="ascii")
+
+
+def _profiles(profiles_dir: pathlib.Path, hook: str = "") -> typing.List[pathlib.Path]:
+    """Return the profiles, oldest first.
+
+    Args:
+        profiles_dir: The profiles directory.
+        hook: Only return the profiles of this hook, all profiles if empty.
+
+    Returns:
+        The paths of the profiles.
+    """
+    if not profiles_dir.is_dir():
+        return []
+    return [
+        path
+        for path in sorted(profiles_dir.glob(f"*{PROFILE_SUFFIX}"))
+        if not hook or path.stem.split("-", 1)[-1] == hook
+    ]
+
+
+def main(charm_class: typing.Type[ops.CharmBase]) -> None:
+    """Run the charm, under cProfile if hooks remain to be profiled.
+
+    When profiling is disabled, this only adds a failed file read to the dispatch.
+
+    Args:
+        charm_class: The charm class to run.
+    """
+    profiles_dir = _profiles_dir()
+    remaining = _remaining(profiles_dir)
+    if not remaining:
+        ops.main(charm_class)
+        return
+    # pylint: disable=import-outside-toplevel
+    import cProfile
+
+    # pylint: enable=import-outside-toplevel
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(ops.main, charm_class)
+    finally:
+        dispatch_path = os.environ.get("JUJU_DISPATCH_PATH", "unknown")
+        hook = dispatch_path.rsplit("/", 1)[-1]
+        profiler.dump_stats(profiles_dir / f"{time.time_ns()}-{hook}{PROFILE_SUFFIX}")
+        for path in _profiles(profiles_dir)[:-MAX_PROFILES]:
+            path.unlink()
+        # The profile-hooks action sets the count of the next hooks, which is kept as is. The
+        # count is read again in case it was changed while the hook ran.
+        if dispatch_path != PROFILE_ACTION_DISPATCH_PATH:
+            _set_remaining(profiles_dir, _remaining(profiles_dir) - 1)
+
+
+def summary(paths: typing.List[pathlib.Path], top: int) -> str:
+    """Summarize profiles by cumulative time.
+
+    Args:
+        paths: The paths of the profiles.
+        top: The number of functions to list.
+
+    Returns:
+        The summary.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pstats
+
+    # pylint: enable=import-outside-toplevel
+
+    output = io.StringIO()
+    stats = pstats.Stats(*(str(path) for path in paths), stream=output)
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    return output.getvalue()
+
+
+class HookProfiler(ops.Object):
+    """Actions enabling the profiling of the next hooks and summarizing the profiles."""
+
+    def __init__(self, charm: ops.CharmBase):
+        """Construct.
+
+        Args:
+            charm: The charm to profile.
+        """
+        super().__init__(charm, "hook-profiler")
+        self._profiles_dir = _profiles_dir(charm.charm_dir)
+        self.framework.observe(charm.on.profile_hooks_action, self._on_profile_hooks_action)
+        self.framework.observe(charm.on.profile_summary_action, self._on_profile_summary_action)
+
+    def _on_profile_hooks_action(self, event: ops.ActionEvent) -> None:
+        """Profile the next hooks.
+
+        Args:
+            event: The profile-hooks action event.
+        """
+        count = int(event.params["count"])
+        _set_remaining(self._profiles_dir, count)
+        event.set_results({"remaining": count})
+
+    def _on_profile_summary_action(self, event: ops.ActionEvent) -> None:
+        """Summarize the recorded profiles.
+
+        Args:
+            event: The profile-summary action event.
+        """
+        paths = _profiles(self._profiles_dir, event.params.get("hook", ""))
+        if not paths:
+            event.fail("No profile recorded, run the profile-hooks action first")
+            return
+        event.set_results(
+            {
+                "profiles": len(paths),
+                "remaining": _remaining(self._profiles_dir),
+                "summary": summary(paths, int(event.params["top"])),
+            }
+        )
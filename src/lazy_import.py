@@ -0,0 +1,38 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Deferred loading of modules that are not needed by every hook."""
+
+import importlib.util
+import sys
+import types
+import typing
+
+
+def lazy_import(name: str) -> typing.Optional[types.ModuleType]:
+    """Register a module that is only loaded when one of its attributes is accessed.
+
+    The module is loaded by `importlib.util.LazyLoader`, which also loads it on the `import`
+    statements naming it, as they read its spec. It is set as an attribute of its package,
+    so that `from package import module` gets it without loading it.
+
+    Args:
+        name: The fully qualified name of the module.
+
+    Returns:
+        The module, or None if the module can't be found.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    package, _, attr = name.rpartition(".")
+    if package:
+        setattr(sys.modules[package], attr, module)
+    return module
@@ -0,0 +1,115 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Prometheus scrape endpoint of the GitHub Actions Exporter charm."""
+
+import json
+import socket
+import typing
+from urllib.parse import urlparse
+
+import ops
+from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
+from cosl.rules import AlertRules
+
+# Unit relation data keys holding the address Prometheus scrapes the unit at.
+UNIT_ADDRESS_KEYS = (
+    "prometheus_scrape_unit_address",
+    "prometheus_scrape_unit_path",
+    "prometheus_scrape_unit_name",
+)
+
+
+class ExporterMetricsEndpointProvider(
+    MetricsEndpointProvider
+):  # pylint: disable=too-few-public-methods
+    """Metrics endpoint provider building its scrape jobs only when they are published.
+
+    The jobs depend on the charm configuration, which most hooks don't need to read. The unit
+    address is only published while the unit is ready, so that Prometheus doesn't scrape an
+    exporter that is still starting or failing.
+
+    Each hook tool call is a subprocess, so the jobs, alert rules and unit address are computed
+    once for all the relations, and each databag is written with a single relation-set, only
+    if it changed.
+    """
+
+    def __init__(
+        self,
+        charm: ops.CharmBase,
+        jobs: typing.Callable[[], typing.List[dict]],
+        ready: typing.Callable[[], bool],
+        refresh_event: typing.List[ops.BoundEvent],
+    ):
+        """Construct.
+
+        Args:
+            charm: The charm providing the metrics endpoint.
+            jobs: Return the scrape jobs.
+            ready: Return whether the unit is ready to be scraped.
+            refresh_event: Events on which the scrape jobs are published again.
+        """
+        super().__init__(charm, refresh_event=refresh_event, lookaside_jobs_callable=jobs)
+        self._ready = ready
+
+    def set_scrape_job_spec(self, _=None, ready: typing.Optional[bool] = None) -> None:
+        """Publish the unit address and, from the leader, the scrape jobs and alert rules.
+
+        Args:
+            ready: Whether the unit is ready to be scraped, asked to the charm if None.
+        """
+        self._publish_unit_address(ready)
+        relations = self._charm.model.relations[self._relation_name]
+        if not relations or not self._charm.unit.is_leader():
+            return
+        alert_rules = AlertRules(query_type="promql", topology=self.topology)
+        alert_rules.add_path(self._alert_rules_path, recursive=True)
+        alert_rules_as_dict = alert_rules.as_dict()
+        data = {
+            "scrape_metadata": json.dumps(self._scrape_metadata),
+            "scrape_jobs": json.dumps(self._scrape_jobs),
+        }
+        if alert_rules_as_dict:
+            data["alert_rules"] = json.dumps(alert_rules_as_dict)
+        for relation in relations:
+            relation.data[self._charm.app].update(data)
+
+    def _unit_address(self) -> typing.Tuple[str, str]:
+        """Return the address Prometheus scrapes the unit at.
+
+        The address is the same for all the relations of the endpoint, so it is looked up with
+        a single network-get.
+
+        Returns:
+            The host and the path of the unit.
+        """
+        if self.external_url:
+            parsed = urlparse(self.external_url)
+            return str(parsed.hostname), parsed.path
+        binding = self._charm.model.get_binding(self._relation_name)
+        unit_ip = str(binding.network.bind_address) if binding else ""
+        if self._is_valid_unit_address(unit_ip):
+            return unit_ip, ""
+        return socket.getfqdn(), ""
+
+    def _publish_unit_address(self, ready: typing.Optional[bool]) -> None:
+        """Publish the unit address if the unit is ready, withdraw it otherwise.
+
+        Prometheus only scrapes the units that have published their address.
+
+        Args:
+            ready: Whether the unit is ready to be scraped, asked to the charm if None.
+        """
+        relations = self._charm.model.relations[self._relation_name]
+        if not relations:
+            return
+        if ready is None:
+            ready = self._ready()
+        if ready:
+            address, path = self._unit_address()
+            data = dict(zip(UNIT_ADDRESS_KEYS, (address, path, self._charm.unit.name)))
+        else:
+            # Setting a key to an empty string removes it.
+            data = dict.fromkeys(UNIT_ADDRESS_KEYS, "")
+        for relation in relations:
+            relation.data[self._charm.unit].update(data)
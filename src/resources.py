@@ -0,0 +1,185 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Kubernetes resource requirements of the pod containers and sizing recommendations."""
+
+import logging
+import math
+import time
+import typing
+
+from cgroup import CgroupUsage
+
+logger = logging.getLogger(__name__)
+
+CHARM_CONTAINER_NAME = "charm"
+# Margin applied to the observed peaks to recommend the container requests.
+HEADROOM = 1.2
+MEBIBYTE = 1024 * 1024
+
+Resources = typing.Dict[str, typing.Dict[str, str]]
+
+
+class ResourcePatchError(Exception):
+    """Exception raised when the StatefulSet resources can't be patched.
+
+    Attrs:
+        msg (str): Explanation of the error.
+    """
+
+    def __init__(self, msg: str):
+        """Initialize a new instance of the ResourcePatchError exception.
+
+        Args:
+            msg (str): Explanation of the error.
+        """
+        self.msg = msg
+
+
+def patch_statefulset(name: str, namespace: str, resources: typing.Dict[str, Resources]) -> bool:
+    """Set the resource requirements of the StatefulSet containers, if they differ.
+
+    Changing the pod template makes Kubernetes roll the pods of the application, so the
+    StatefulSet is only patched when the requirements differ from the current ones. This
+    requires the application to be trusted.
+
+    Args:
+        name: The name of the StatefulSet.
+        namespace: The namespace of the StatefulSet.
+        resources: The requests and limits of each container to update.
+
+    Returns:
+        True if the StatefulSet was patched, False if it was up to date.
+
+    Raises:
+        ResourcePatchError: if the Kubernetes API can't be reached or rejects the request.
+    """
+    # lightkube is only imported when there is something to patch as loading it takes a
+    # substantial part of the charm import time budget.
+    # pylint: disable=import-outside-toplevel
+    from lightkube import ApiError, Client, ConfigError
+    from lightkube.models.core_v1 import ResourceRequirements
+    from lightkube.resources.apps_v1 import StatefulSet
+    from lightkube.utils.quantity import equals_canonically
+
+    # pylint: enable=import-outside-toplevel
+
+    try:
+        client = Client(field_manager=name)
+        statefulset = client.get(StatefulSet, name=name, namespace=namespace)
+        current = {
+            container.name: container.resources or ResourceRequirements()
+            for container in statefulset.spec.template.spec.containers  # type: ignore
+        }
+        desired = {
+            container: ResourceRequirements(requests=value["requests"], limits=value["limits"])
+            for container, value in resources.items()
+        }
+        changed = [
+            container
+            for container, requirements in desired.items()
+            if container in current and not equals_canonically(current[container], requirements)
+        ]
+        if not changed:
+            return False
+        logger.info("Patching the resources of the %s containers", changed)
+        client.patch(StatefulSet, name, _containers_patch(resources, changed), namespace=namespace)
+    except ApiError as exc:
+        raise ResourcePatchError(
+            f"failed to patch resources: {exc.status.message}"  # type: ignore
+        ) from exc
+    except ConfigError as exc:
+        raise ResourcePatchError("Kubernetes API not reachable") from exc
+    return True
+
+
+def _containers_patch(
+    resources: typing.Dict[str, Resources], containers: typing.List[str]
+) -> typing.Dict[str, typing.Any]:
+    """Return the strategic merge patch of the containers resource requirements.
+
+    Args:
+        resources: The requests and limits of each container.
+        containers: The containers to patch.
+
+    Returns:
+        The StatefulSet patch.
+    """
+    patches = [
+        # Replace the whole requirements so that the values no longer set are removed.
+        {"name": container, "resources": {"$patch": "replace", **resources[container]}}
+        for container in containers
+    ]
+    return {"spec": {"template": {"spec": {"containers": patches}}}}
+
+
+def requirements(
+    requests: typing.Dict[str, str], limits: typing.Dict[str, str]
+) -> typing.Optional[Resources]:
+    """Return the resource requirements of a container.
+
+    Args:
+        requests: The configured requests.
+        limits: The configured limits.
+
+    Returns:
+        The requirements, None if neither requests nor limits are configured.
+    """
+    if not requests and not limits:
+        return None
+    return {"requests": dict(requests), "limits": dict(limits)}
+
+
+def sample(
+    usage: CgroupUsage, previous: typing.Dict[str, float], cpu_limit: typing.Optional[float] = None
+) -> typing.Dict[str, float]:
+    """Update the observed usage peaks with a new usage sample.
+
+    The CPU usage averaged over the interval since the previous sample misses the bursts in
+    between. A container throttled during the interval had a demand reaching its CPU quota,
+    so the CPU peak is raised to the quota then.
+
+    Args:
+        usage: The current cgroup usage.
+        previous: The peaks returned for the previous sample, empty for the first one.
+        cpu_limit: The CPU quota of the container in cores, None if unlimited.
+
+    Returns:
+        The updated peaks, with the CPU peak in cores and the memory peak in bytes.
+    """
+    now = time.time()
+    peaks = dict(previous)
+    if usage.cpu_usec is not None:
+        elapsed = now - previous.get("time", now)
+        consumed = usage.cpu_usec - previous.get("cpu_usec", usage.cpu_usec)
+        # A negative consumption means the container restarted since the previous sample.
+        if elapsed > 0 and consumed >= 0:
+            peaks["cpu_peak"] = max(previous.get("cpu_peak", 0.0), consumed / 1e6 / elapsed)
+        peaks["cpu_usec"] = usage.cpu_usec
+        peaks["time"] = now
+    if usage.cpu_throttled is not None:
+        throttled = usage.cpu_throttled - previous.get("cpu_throttled", usage.cpu_throttled)
+        if cpu_limit and throttled > 0:
+            peaks["cpu_peak"] = max(peaks.get("cpu_peak", 0.0), cpu_limit)
+        peaks["cpu_throttled"] = usage.cpu_throttled
+    memory = usage.memory_peak if usage.memory_peak is not None else usage.memory
+    if memory is not None:
+        peaks["memory_peak"] = max(previous.get("memory_peak", 0), memory)
+    return peaks
+
+
+def recommend(peaks: typing.Dict[str, float]) -> typing.Dict[str, str]:
+    """Return the container requests recommended from the observed usage peaks.
+
+    Args:
+        peaks: The usage peaks returned by `sample`.
+
+    Returns:
+        The recommended requests, in the format of the requests configuration options.
+    """
+    recommendation = {}
+    if "cpu_peak" in peaks:
+        recommendation["cpu"] = f"{max(1, math.ceil(peaks['cpu_peak'] * HEADROOM * 1000))}m"
+    if "memory_peak" in peaks:
+        recommendation["memory"] = f"{math.ceil(peaks['memory_peak'] * HEADROOM / MEBIBYTE)}Mi"
+    return recommendation
@@ -0,0 +1,148 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Peer coordinated lock limiting the number of units restarting the workload at once."""
+
+import json
+import logging
+import typing
+
+import ops
+
+logger = logging.getLogger(__name__)
+
+REQUEST_KEY = "restart"
+GRANTED_KEY = "restart-granted"
+REQUESTED = "requested"
+
+
+class RestartGrantedEvent(ops.EventBase):
+    """Event emitted when this unit is granted the restart lock."""
+
+
+class RestartLockEvents(ops.ObjectEvents):
+    """Restart lock events.
+
+    Attrs:
+        granted: emitted when this unit is granted the restart lock.
+    """
+
+    granted = ops.EventSource(RestartGrantedEvent)
+
+
+class RestartLock(ops.Object):
+    """Restart lock shared by the units through the peer relation.
+
+    Units request the lock in their unit databag and the leader grants it, in unit name
+    order, to at most `limit` units at a time in the application databag. A unit alone in
+    the application doesn't need the lock.
+
+    Attrs:
+        on: the restart lock events.
+        coordinated: whether other units share the lock.
+        granted: whether this unit holds the lock.
+    """
+
+    on = RestartLockEvents()
+
+    def __init__(self, charm: ops.CharmBase, relation_name: str, limit: typing.Callable[[], int]):
+        """Construct.
+
+        Args:
+            charm: The charm using the lock.
+            relation_name: The name of the peer relation.
+            limit: Return the maximum number of units restarting at the same time.
+        """
+        super().__init__(charm, relation_name)
+        self._charm = charm
+        self._relation_name = relation_name
+        self._limit = limit
+        self.framework.observe(charm.on[relation_name].relation_changed, self._on_changed)
+        self.framework.observe(charm.on[relation_name].relation_departed, self._on_changed)
+        self.framework.observe(charm.on.leader_elected, self._on_changed)
+
+    @property
+    def _relation(self) -> typing.Optional[ops.Relation]:
+        """Return the peer relation, if established."""
+        return self.model.get_relation(self._relation_name)
+
+    @property
+    def coordinated(self) -> bool:
+        """Return whether other units share the lock.
+
+        Returns:
+            True if the peer relation has other units.
+        """
+        return bool(self._relation and self._relation.units)
+
+    @property
+    def granted(self) -> bool:
+        """Return whether this unit holds the lock.
+
+        Returns:
+            True if the leader granted the lock to this unit.
+        """
+        return self._charm.unit.name in self._granted_units()
+
+    def acquire(self) -> bool:
+        """Request the lock.
+
+        Returns:
+            True if this unit may restart now, False if it has to wait for the lock.
+        """
+        relation = self._relation
+        if not relation or not relation.units:
+            return True
+        if self.granted:
+            return True
+        relation.data[self._charm.unit][REQUEST_KEY] = REQUESTED
+        self._grant()
+        return self.granted
+
+    def release(self) -> None:
+        """Release the lock or withdraw the request for it."""
+        relation = self._relation
+        if not relation:
+            return
+        relation.data[self._charm.unit].pop(REQUEST_KEY, None)
+        self._grant()
+
+    def _granted_units(self) -> typing.List[str]:
+        """Return the units holding the lock.
+
+        Returns:
+            The names of the units holding the lock.
+        """
+        relation = self._relation
+        if not relation:
+            return []
+        return json.loads(relation.data[self._charm.app].get(GRANTED_KEY, "[]"))
+
+    def _grant(self) -> None:
+        """Grant the lock to the waiting units, if this unit is the leader."""
+        relation = self._relation
+        if not relation or not self._charm.unit.is_leader():
+            return
+        requesters = sorted(
+            unit.name
+            for unit in (self._charm.unit, *relation.units)
+            if relation.data[unit].get(REQUEST_KEY) == REQUESTED
+        )
+        granted = [unit for unit in self._granted_units() if unit in requesters]
+        for unit in requesters:
+            if len(granted) >= self._limit():
+                break
+            if unit not in granted:
+                granted.append(unit)
+        if granted != self._granted_units():
+            logger.info("Restart lock granted to %s", granted)
+            relation.data[self._charm.app][GRANTED_KEY] = json.dumps(granted)
+
+    def _on_changed(self, _: ops.EventBase) -> None:
+        """Grant the lock if leader and notify this unit if it was granted the lock."""
+        self._grant()
+        relation = self._relation
+        if not relation or relation.data[self._charm.unit].get(REQUEST_KEY) != REQUESTED:
+            return
+        if self.granted:
+            self.on.granted.emit()
@@ -0,0 +1,117 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Pebble service of the filter enforcing the series budget on the exporter metrics.
+
+Prometheus drops the metric relabeling rules of the scrape jobs the charm publishes, so the
+series over the budget are dropped in the workload container instead: with a budget, the
+scrape job targets the filter, which serves the metrics of each exporter on its own port.
+"""
+
+import hashlib
+import json
+import logging
+import pathlib
+import typing
+
+import ops
+
+from constants import GITHUB_USER
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "series-filter"
+SOURCE = pathlib.Path(__file__).with_name("series_filter.py")
+FILTER_DIR = "/srv/gh_exporter/series-filter"
+PROGRAM_PATH = f"{FILTER_DIR}/series_filter.py"
+# Series dropped, reloaded by the filter when it changes.
+PLAN_PATH = f"{FILTER_DIR}/plan.json"
+# The filter serves the metrics of each exporter on the metrics port of the exporter plus this.
+PORT_OFFSET = 100
+
+
+def port(exporter_port: int) -> int:
+    """Return the port the filtered metrics of an exporter are served on.
+
+    Args:
+        exporter_port: The metrics port of the exporter.
+
+    Returns:
+        The port of the filter.
+    """
+    return exporter_port + PORT_OFFSET
+
+
+def service(enabled: bool, exporter_ports: typing.List[int]) -> typing.Dict[str, typing.Any]:
+    """Return the Pebble service of the filter.
+
+    The service is always part of the layer, disabled without a budget, so that it is
+    stopped when the budget is removed. The digest of the program is part of the service, so
+    the filter is pushed and restarted when the charm is upgraded with a new version of it.
+
+    Args:
+        enabled: Whether a series budget is configured.
+        exporter_ports: The metrics ports of the exporters.
+
+    Returns:
+        Dict: the service definition.
+    """
+    ports = " ".join(f"--port={port(exporter)}:{exporter}" for exporter in exporter_ports)
+    return {
+        "override": "replace",
+        "summary": "series budget filter of the exporter metrics",
+        "startup": "enabled" if enabled else "disabled",
+        "user": GITHUB_USER,
+        "command": f"python3 {PROGRAM_PATH} --plan={PLAN_PATH} {ports}",
+        "environment": {"SERIES_FILTER_DIGEST": hashlib.sha256(SOURCE.read_bytes()).hexdigest()},
+    }
+
+
+def _push(container: ops.Container, path: str, content: str) -> None:
+    """Push a file of the filter, owned by the workload user.
+
+    Args:
+        container: The workload container.
+        path: The path of the file.
+        content: The content of the file.
+    """
+    container.push(path, content, make_dirs=True, user=GITHUB_USER, group=GITHUB_USER)
+
+
+def push(container: ops.Container, plan: typing.List[dict]) -> None:
+    """Push the filter program and the plan to the workload container.
+
+    Args:
+        container: The workload container.
+        plan: The plan returned by `cardinality.budget_plan`.
+    """
+    _push(container, PROGRAM_PATH, SOURCE.read_text(encoding="utf-8"))
+    push_plan(container, plan)
+
+
+def push_plan(container: ops.Container, plan: typing.List[dict]) -> None:
+    """Push the series dropped by the filter to the workload container.
+
+    Args:
+        container: The workload container.
+        plan: The plan returned by `cardinality.budget_plan`.
+    """
+    _push(container, PLAN_PATH, json.dumps(plan))
+
+
+def stop_disabled(container: ops.Container, layer_services: typing.Dict[str, typing.Any]) -> None:
+    """Stop the running filter once the budget is removed, before a replan.
+
+    Pebble restarts on replan the running services whose definition changed, even disabled
+    ones.
+
+    Args:
+        container: The workload container.
+        layer_services: The services of the layer about to be planned.
+    """
+    if layer_services[SERVICE_NAME]["startup"] == "enabled":
+        return
+    info = container.get_services(SERVICE_NAME).get(SERVICE_NAME)
+    if info and info.is_running():
+        logger.info("Stopping the series budget filter")
+        container.stop(SERVICE_NAME)
@@ -0,0 +1,227 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Filter of the exporter metrics dropping the series over the series budget.
+
+This program is pushed to the workload container by the charm and run by Pebble with the
+Python interpreter of the workload image, so it only uses the standard library.
+
+Prometheus scrapes the exporters through the filter when a series budget is configured. The
+filter streams the exposition of an exporter line by line, dropping the samples of the plan
+the charm writes to the plan file: the families dropped, and the series of the families
+whose label has a value outside of the values kept. The plan is read again when the file
+changes, so a new plan applies from the next scrape.
+"""
+
+import argparse
+import http.client
+import http.server
+import json
+import logging
+import os
+import re
+import threading
+import typing
+
+logger = logging.getLogger(__name__)
+
+LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+# Suffixes of the samples of the counter, histogram and summary families.
+SAMPLE_SUFFIXES = ("_bucket", "_count", "_sum", "_total", "_created", "_gcount", "_gsum")
+# Maximum time to receive the exposition of an exporter, in seconds.
+UPSTREAM_TIMEOUT = 60
+# Response headers of the exporter forwarded to Prometheus.
+FORWARDED_HEADERS = ("content-type",)
+
+
+class Plan:
+    """Series dropped by the filter, read from the plan file written by the charm.
+
+    The file holds the list returned by `cardinality.budget_plan`, every series is kept if
+    it is missing.
+    """
+
+    def __init__(self, path: str):
+        """Construct.
+
+        Args:
+            path: The plan file.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._mtime: typing.Optional[int] = None
+        self._dropped: typing.Set[str] = set()
+        self._folded: typing.Dict[str, typing.Tuple[str, typing.FrozenSet[str]]] = {}
+
+    def reload(self) -> None:
+        """Read the plan file again if it changed since it was last read."""
+        try:
+            mtime: typing.Optional[int] = os.stat(self._path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            entries = []
+            if mtime is not None:
+                with open(self._path, encoding="utf-8") as file:
+                    entries = json.load(file)
+            self._dropped = {entry["family"] for entry in entries if not entry["label"]}
+            self._folded = {
+                entry["family"]: (entry["label"], frozenset(entry["keep"]))
+                for entry in entries
+                if entry["label"]
+            }
+            self._mtime = mtime
+        logger.info("Series budget plan loaded: %s", entries)
+
+    def _family(self, name: str) -> typing.Optional[str]:
+        """Return the family of the plan a sample belongs to.
+
+        Args:
+            name: The name of the sample.
+
+        Returns:
+            The family name, None if the plan keeps the family.
+        """
+        candidates = [name]
+        candidates.extend(
+            name[: -len(suffix)] for suffix in SAMPLE_SUFFIXES if name.endswith(suffix)
+        )
+        for candidate in candidates:
+            if candidate in self._dropped or candidate in self._folded:
+                return candidate
+        return None
+
+    def keep(self, line: str) -> bool:
+        """Return whether a line of an exposition is kept.
+
+        Args:
+            line: The line, in the Prometheus text format.
+
+        Returns:
+            False for the samples, and the HELP and TYPE comments, of the series dropped.
+        """
+        if line.startswith("#"):
+            fields = line.split(" ", 3)
+            return not (
+                len(fields) > 2 and fields[1] in ("HELP", "TYPE") and fields[2] in self._dropped
+            )
+        if not line.strip():
+            return True
+        name = line.split("{", 1)[0].split(" ", 1)[0]
+        family = self._family(name)
+        if family is None:
+            return True
+        if family in self._dropped:
+            return False
+        label, values = self._folded[family]
+        _, _, labels = line.partition("{")
+        for candidate, value in LABEL_PATTERN.findall(labels[: labels.rfind("}")]):
+            if candidate == label:
+                return value in values
+        # Series without the label are kept.
+        return True
+
+
+class FilterHandler(http.server.BaseHTTPRequestHandler):
+    """Stream the metrics of an exporter without the series dropped by the plan."""
+
+    server: "FilterServer"
+
+    def do_GET(self) -> None:  # noqa: N802 pylint: disable=invalid-name
+        """Forward a scrape to the exporter and filter its response."""
+        self.server.plan.reload()
+        connection = http.client.HTTPConnection(
+            "127.0.0.1", self.server.upstream, timeout=UPSTREAM_TIMEOUT
+        )
+        try:
+            connection.request("GET", self.path)
+            response = connection.getresponse()
+        except (OSError, http.client.HTTPException) as exc:
+            connection.close()
+            self.send_error(502, f"exporter unavailable: {exc}")
+            return
+        try:
+            self.send_response(response.status)
+            for name in FORWARDED_HEADERS:
+                value = response.getheader(name)
+                if value:
+                    self.send_header(name, value)
+            # The length of the filtered response is not known in advance, it is delimited by
+            # the end of the connection.
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for raw in response:
+                if self.server.plan.keep(raw.decode("utf-8", "replace")):
+                    self.wfile.write(raw)
+        finally:
+            connection.close()
+
+    def log_message(self, format: str, *args: typing.Any) -> None:  # noqa: A002
+        """Log the requests at the debug level only.
+
+        Args:
+            format: The message format.
+            args: The message arguments.
+        """
+        # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+class FilterServer(http.server.ThreadingHTTPServer):
+    """Server filtering the metrics of an exporter.
+
+    Attrs:
+        plan: the series dropped.
+        upstream: the metrics port of the exporter.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int, upstream: int, plan: Plan):
+        """Construct.
+
+        Args:
+            port: The port Prometheus scrapes.
+            upstream: The metrics port of the exporter.
+            plan: The series dropped.
+        """
+        super().__init__(("", port), FilterHandler)
+        self.plan = plan
+        self.upstream = upstream
+
+
+def _ports(value: str) -> typing.Tuple[int, int]:
+    """Parse a `port:upstream` pair of ports.
+
+    Args:
+        value: The pair.
+
+    Returns:
+        The port scraped and the metrics port of the exporter.
+    """
+    port, _, upstream = value.partition(":")
+    return int(port), int(upstream)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:  # pragma: nocover
+    """Parse the command line and filter the metrics of the exporters until interrupted.
+
+    Args:
+        argv: The command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--plan", required=True)
+    parser.add_argument("--port", type=_ports, action="append", required=True)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    plan = Plan(args.plan)
+    servers = [FilterServer(port, upstream, plan) for port, upstream in args.port]
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    servers[0].serve_forever()
+
+
+if __name__ == "__main__":  # pragma: nocover
+    main()
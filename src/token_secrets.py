@@ -0,0 +1,128 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""GitHub tokens read from Juju user secrets, cached for the hook."""
+
+import logging
+import typing
+
+import ops
+
+from exceptions import CharmConfigInvalidError
+
+logger = logging.getLogger(__name__)
+
+# Secret configuration option holding each token, overriding the plain option.
+SECRET_OPTIONS = {
+    "github_api_token": "github_api_token_secret",
+    "github_webhook_token": "github_webhook_token_secret",
+}
+# Key of the token in the secret content.
+SECRET_KEY = "token"
+# Option listing the additional organizations, whose tokens can be secret URIs.
+ORGS_OPTION = "github_orgs"
+SECRET_SCHEME = "secret:"
+
+
+def _unique_id(uri: str) -> str:
+    """Return the unique identifier of a secret URI, with or without the model UUID.
+
+    Args:
+        uri: The secret URI.
+
+    Returns:
+        The identifier, without the scheme and the model UUID.
+    """
+    return uri.split(":", 1)[-1].rsplit("/", 1)[-1]
+
+
+class TokenSecrets(ops.Object):
+    """Tokens of the secrets configured in the secret options.
+
+    The charm reads the revision of a secret it tracks until it refreshes it on
+    secret-changed, so a rotated token is only applied, and the exporter restarted, then.
+    The content is cached in memory, so each secret is read at most once per hook, and it is
+    never persisted, so it is read again by every hook that needs it.
+    """
+
+    def __init__(self, charm: ops.CharmBase):
+        """Construct.
+
+        Args:
+            charm: The charm reading the secrets.
+        """
+        super().__init__(charm, "token-secrets")
+        self._cache: typing.Dict[str, typing.Dict[str, str]] = {}
+        self.framework.observe(charm.on.secret_changed, self._on_secret_changed)
+
+    def _on_secret_changed(self, event: ops.SecretChangedEvent) -> None:
+        """Track the latest revision of a changed secret.
+
+        Args:
+            event: The secret-changed event.
+        """
+        unique_id = _unique_id(typing.cast(str, event.secret.id))
+        self._cache[unique_id] = event.secret.get_content(refresh=True)
+        logger.info("Secret %s changed, tracking its latest revision", unique_id)
+
+    def token(self, option: str, uri: str) -> str:
+        """Return the token of a secret.
+
+        Args:
+            option: The configuration option holding the secret URI.
+            uri: The secret URI.
+
+        Returns:
+            The token.
+
+        Raises:
+            CharmConfigInvalidError: if the secret is not granted or has no token.
+        """
+        unique_id = _unique_id(uri)
+        if unique_id not in self._cache:
+            try:
+                self._cache[unique_id] = self.model.get_secret(id=uri).get_content()
+            except (ops.SecretNotFoundError, ops.ModelError) as exc:
+                raise CharmConfigInvalidError(f"secret not granted: {option}") from exc
+        token = self._cache[unique_id].get(SECRET_KEY)
+        if not token:
+            raise CharmConfigInvalidError(f"secret has no {SECRET_KEY} key: {option}")
+        return token
+
+    def resolve(self, config: typing.Mapping[str, typing.Any]) -> typing.Dict[str, str]:
+        """Return the tokens of the configured secret options.
+
+        Args:
+            config: The charm configuration.
+
+        Returns:
+            The tokens, keyed by the plain option they override, and the additional
+            organizations with the tokens of their `org=secret:<id>` entries.
+        """
+        tokens = {
+            name: self.token(option, config[option])
+            for name, option in SECRET_OPTIONS.items()
+            if config.get(option)
+        }
+        if SECRET_SCHEME in str(config.get(ORGS_OPTION) or ""):
+            tokens[ORGS_OPTION] = self._resolve_orgs(str(config[ORGS_OPTION]))
+        return tokens
+
+    def _resolve_orgs(self, value: str) -> str:
+        """Replace the secret URIs of the additional organizations with their tokens.
+
+        The entries are validated with the rest of the configuration afterwards.
+
+        Args:
+            value: The github_orgs config.
+
+        Returns:
+            The github_orgs config with the tokens of the secrets.
+        """
+        entries = []
+        for entry in value.split(","):
+            org, separator, token = entry.strip().partition("=")
+            if token.startswith(SECRET_SCHEME):
+                token = self.token(ORGS_OPTION, token)
+            entries.append(f"{org}{separator}{token}")
+        return ",".join(entries)
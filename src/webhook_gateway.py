@@ -0,0 +1,602 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Webhook gateway spooling the GitHub deliveries in front of the exporter.
+
+This program is pushed to the workload container by the charm and run by Pebble with the
+Python interpreter of the workload image, so it only uses the standard library.
+
+GitHub gives up on a delivery after 10 seconds and doesn't retry it, so a delivery is
+acknowledged as soon as it is durably appended to the spool, and replayed to the exporter
+from there, with retries, while the exporter is restarting or slow.
+
+Everything runs in a single asyncio event loop. The records written while the spool is being
+flushed are flushed together by the next flush, and the deliveries are replayed over a
+bounded pool of persistent HTTP/1.1 connections to the exporter, straight from the memory
+map of the spool.
+
+Several workers can share the webhook and metrics ports with SO_REUSEPORT, the kernel
+spreading the connections between them. Each worker has its own spool, and publishes the
+snapshot of its metrics, so that the worker answering a scrape renders the metrics of all.
+
+The signature of the deliveries is verified before they are spooled, and the deliveries
+already received, as identified by their GitHub delivery ID, are acknowledged without being
+spooled again, so that the exporter doesn't count them twice.
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import shutil
+import signal
+import time
+import typing
+
+from gateway_admission import VERIFY_INLINE_SIZE, VERIFY_THREADS, Deduplicator, Verifier
+from gateway_http import MAX_HEAD_SIZE, POOL_SIZE, ExporterPool
+from gateway_http import serve as serve_connection
+from gateway_spool import (
+    CURSOR_NAME,
+    SEGMENT_SUFFIX,
+    Position,
+    Record,
+    Spool,
+    SpoolFullError,
+    decode,
+    encode,
+)
+
+logger = logging.getLogger(__name__)
+
+# Maximum time to replay a delivery to the exporter, in seconds.
+FORWARD_TIMEOUT = 10
+MAX_CONCURRENT_REQUESTS = 256
+RETRY_BACKOFF = 0.5
+MAX_RETRY_BACKOFF = 30
+METRIC_PREFIX = "webhook_gateway"
+# Interval between two snapshots of the metrics of a worker, in seconds.
+STATS_INTERVAL = 1
+STATS_EXPIRY = 5 * STATS_INTERVAL
+STATS_SUFFIX = ".json"
+COUNTERS = (
+    "received",
+    "refused",
+    "forwarded",
+    "rejected",
+    "retries",
+    "unauthorized",
+    "duplicated",
+)
+GAUGES = {
+    "spool_depth": "Deliveries waiting to be forwarded.",
+    "spool_bytes": "Size of the deliveries waiting.",
+    "spool_segments": "Segment files of the spool.",
+    "spool_oldest_age_seconds": "Time the oldest delivery has been waiting.",
+    "dedup_bloom_false_positive_ratio": "Estimated false positive ratio of the Bloom filter.",
+}
+DEDUP_COUNTERS = {
+    "lookups": "Delivery IDs looked up.",
+    "lru_hits": "Delivery IDs found in the cache of the recent deliveries.",
+    "bloom_hits": "Delivery IDs found in the Bloom filter only.",
+}
+
+
+class Stats:  # pylint: disable=too-few-public-methods
+    """Counters of the gateway.
+
+    Attrs:
+        counters: value of each counter.
+    """
+
+    def __init__(self) -> None:
+        """Construct."""
+        self.counters: typing.Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+
+    def increment(self, name: str) -> None:
+        """Increment a counter.
+
+        Args:
+            name: The name of the counter.
+        """
+        self.counters[name] += 1
+
+
+class Gateway:  # pylint: disable=too-many-instance-attributes
+    """Receive the webhook deliveries in the spool, and replay them to the exporter.
+
+    Attrs:
+        spool: the spool of the deliveries.
+        stats: the counters of the gateway.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        exporter: typing.Tuple[str, int],
+        *,
+        pool_size: int = POOL_SIZE,
+        max_requests: int = MAX_CONCURRENT_REQUESTS,
+        worker: int = 0,
+        stats_dir: typing.Optional[str] = None,
+        verifier: typing.Optional[Verifier] = None,
+        deduplicator: typing.Optional[Deduplicator] = None,
+    ):  # pylint: disable=too-many-arguments
+        """Construct.
+
+        Args:
+            spool: The spool of the deliveries.
+            exporter: The host and webhook port of the exporter.
+            pool_size: The maximum number of connections to the exporter, and of deliveries
+                being replayed.
+            max_requests: The maximum number of requests handled at once, the others wait.
+            worker: The index of the worker.
+            stats_dir: The directory of the metrics snapshots of the workers, None if the
+                worker is alone.
+            verifier: The verifier of the signatures, None to accept unsigned deliveries.
+            deduplicator: The memory of the delivery IDs, an in-memory one if None.
+        """
+        self.spool = spool
+        self.stats = Stats()
+        self.worker = worker
+        self._stats_dir = stats_dir
+        self.verifier = verifier
+        self.deduplicator = deduplicator or Deduplicator()
+        self._verifiers = concurrent.futures.ThreadPoolExecutor(
+            VERIFY_THREADS, thread_name_prefix="verify"
+        )
+        if stats_dir is not None:
+            os.makedirs(stats_dir, exist_ok=True)
+        self._pool = ExporterPool(*exporter, size=pool_size)
+        self._pool_size = pool_size
+        self._requests = asyncio.Semaphore(max_requests)
+        self._written = asyncio.Event()
+        self._batch: typing.Optional[asyncio.Future] = None
+        self._flusher: typing.Optional[asyncio.Future] = None
+
+    async def serve_deliveries(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the webhook deliveries of a connection.
+
+        Args:
+            reader: The stream of the requests.
+            writer: The stream of the responses.
+        """
+        await serve_connection(
+            reader, writer, self._receive, self.spool.max_payload, self._requests
+        )
+
+    async def serve_metrics(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the metrics requests of a connection.
+
+        Args:
+            reader: The stream of the requests.
+            writer: The stream of the responses.
+        """
+        await serve_connection(
+            reader, writer, self._metrics, self.spool.max_payload, self._requests
+        )
+
+    async def _receive(
+        self, method: str, path: str, headers: typing.Dict[str, str], body: bytes
+    ) -> typing.Tuple[int, bytes]:
+        """Acknowledge a delivery once it is written to the spool and flushed to the disk.
+
+        Args:
+            method: The request method.
+            path: The request path.
+            headers: The request headers.
+            body: The request body.
+
+        Returns:
+            The status and body of the response.
+        """
+        if method != "POST":
+            return 404, b""
+        if not await self._verified(headers, body):
+            self.stats.increment("unauthorized")
+            return 401, b""
+        delivery = headers.get("x-github-delivery")
+        if delivery and self.deduplicator.duplicate(delivery):
+            self.stats.increment("duplicated")
+            return 200, b""
+        try:
+            self.spool.write(encode(path, headers), body)
+        except SpoolFullError as exc:
+            logger.error("Refused a delivery: %s", exc)
+            self.stats.increment("refused")
+            return 503, b""
+        self._written.set()
+        try:
+            await self._flushed()
+        except OSError as exc:
+            logger.error("Failed to flush a delivery: %s", exc)
+            self.stats.increment("refused")
+            return 503, b""
+        # The ID is only remembered once the delivery is durable, so that the retry of a
+        # delivery not acknowledged is not dropped as a duplicate.
+        if delivery:
+            self.deduplicator.add(delivery)
+        self.stats.increment("received")
+        return 202, b""
+
+    async def _verified(self, headers: typing.Dict[str, str], body: bytes) -> bool:
+        """Verify the signature of a delivery, in a worker thread if it is large.
+
+        Args:
+            headers: The request headers.
+            body: The request body.
+
+        Returns:
+            True if the signature is valid, or if signatures are not verified.
+        """
+        if self.verifier is None:
+            return True
+        signature = headers.get("x-hub-signature-256", "")
+        if len(body) <= VERIFY_INLINE_SIZE:
+            return self.verifier.verify(body, signature)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._verifiers, self.verifier.verify, body, signature)
+
+    async def _metrics(self, method: str, path: str, *_: typing.Any) -> typing.Tuple[int, bytes]:
+        """Serve the gateway metrics.
+
+        Args:
+            method: The request method.
+            path: The request path.
+
+        Returns:
+            The status and body of the response.
+        """
+        if method != "GET" or path != "/metrics":
+            return 404, b""
+        return 200, render(self.snapshots()).encode()
+
+    def snapshots(self) -> typing.Dict[int, typing.Dict[str, float]]:
+        """Return the metrics of this worker, and the last snapshots of the other ones.
+
+        Returns:
+            The metrics of each worker, keyed by worker index.
+        """
+        snapshots = {}
+        names = os.listdir(self._stats_dir) if self._stats_dir is not None else []
+        for name in (name for name in names if name.endswith(STATS_SUFFIX)):
+            path = os.path.join(typing.cast(str, self._stats_dir), name)
+            try:
+                with open(path, encoding="utf-8") as file:
+                    # The workers stopped since don't publish their snapshot anymore.
+                    if time.time() - os.fstat(file.fileno()).st_mtime > STATS_EXPIRY:
+                        continue
+                    snapshots[int(name[: -len(STATS_SUFFIX)])] = json.load(file)
+            except (OSError, ValueError):
+                continue
+        snapshots[self.worker] = snapshot(self.spool, self.stats, self.deduplicator)
+        return snapshots
+
+    async def publish(self) -> None:
+        """Publish the snapshot of the metrics of this worker periodically, until cancelled."""
+        if self._stats_dir is None:
+            return
+        path = os.path.join(self._stats_dir, f"{self.worker}{STATS_SUFFIX}")
+        while True:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+                json.dump(snapshot(self.spool, self.stats, self.deduplicator), file)
+            os.replace(f"{path}.tmp", path)
+            await asyncio.sleep(STATS_INTERVAL)
+
+    async def _flushed(self) -> None:
+        """Wait for the records written so far to be flushed to the disk.
+
+        The records written during a flush are flushed together by the next one, so that
+        the deliveries received at the same time share the cost of the flush.
+        """
+        if self._batch is None:
+            self._batch = asyncio.get_running_loop().create_future()
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.ensure_future(self._flush())
+        await asyncio.shield(self._batch)
+
+    async def _flush(self) -> None:
+        """Flush the spool until no record waits to be flushed."""
+        loop = asyncio.get_running_loop()
+        while self._batch is not None:
+            batch, self._batch = self._batch, None
+            try:
+                await loop.run_in_executor(None, self.spool.flush)
+            except OSError as exc:
+                batch.set_exception(exc)
+            else:
+                batch.set_result(None)
+
+    async def replay(self) -> None:
+        """Replay the spooled deliveries to the exporter, in parallel, until cancelled.
+
+        Deliveries are acknowledged in order, so at most the pool size of deliveries are
+        replayed again after a crash.
+        """
+        in_flight: typing.Deque[typing.Tuple[typing.Tuple[Record, Position], asyncio.Future]] = (
+            collections.deque()
+        )
+        position = None
+        while True:
+            done = []
+            while in_flight and in_flight[0][1].done():
+                entry, forward = in_flight.popleft()
+                self.stats.increment(forward.result())
+                done.append(entry)
+            if done:
+                self.spool.ack(*done)
+            self._written.clear()
+            while len(in_flight) < self._pool_size:
+                read = self.spool.read(position)
+                if read is None:
+                    break
+                position = read[1]
+                in_flight.append((read, asyncio.ensure_future(self._forward(read[0]))))
+            written = asyncio.ensure_future(self._written.wait())
+            waiters = {written, *([in_flight[0][1]] if in_flight else [])}
+            try:
+                await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                written.cancel()
+
+    async def _forward(self, record: Record) -> str:
+        """Replay a delivery to the exporter until it is accepted or rejected.
+
+        A delivery is retried with an exponential backoff while the exporter can't be reached
+        or fails, and dropped if the exporter rejects it, as replaying it again wouldn't help.
+
+        Args:
+            record: The record of the delivery.
+
+        Returns:
+            The counter of the outcome, forwarded or rejected.
+        """
+        path, headers, body = decode(record.payload)
+        backoff = RETRY_BACKOFF
+        while True:
+            try:
+                status = await asyncio.wait_for(
+                    self._pool.post(path, headers, body), FORWARD_TIMEOUT
+                )
+            except (
+                OSError,
+                ValueError,
+                asyncio.IncompleteReadError,
+                asyncio.TimeoutError,
+            ) as exc:
+                logger.warning("Failed to forward a delivery: %r", exc)
+                status = 0
+            if 200 <= status < 300:
+                return "forwarded"
+            if 400 <= status < 500 and status not in (408, 429):
+                return "rejected"
+            self.stats.increment("retries")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+
+    def close(self) -> None:
+        """Close the idle connections to the exporter, and stop the verification threads."""
+        self._pool.close()
+        self._verifiers.shutdown(wait=False)
+
+
+def snapshot(spool: Spool, stats: Stats, deduplicator: Deduplicator) -> typing.Dict[str, float]:
+    """Take a snapshot of the metrics of a worker.
+
+    Args:
+        spool: The spool of the worker.
+        stats: The counters of the worker.
+        deduplicator: The memory of the delivery IDs of the worker.
+
+    Returns:
+        The value of each metric, keyed by name without the prefix.
+    """
+    return {
+        "spool_depth": spool.depth,
+        "spool_bytes": spool.size,
+        "spool_segments": spool.segments,
+        "spool_oldest_age_seconds": spool.oldest_age(),
+        "dedup_bloom_false_positive_ratio": deduplicator.false_positive_ratio(),
+        **{f"deliveries_{name}_total": value for name, value in stats.counters.items()},
+        **{f"dedup_{name}_total": getattr(deduplicator, name) for name in DEDUP_COUNTERS},
+    }
+
+
+def render(snapshots: typing.Mapping[int, typing.Mapping[str, float]]) -> str:
+    """Render the metrics of the workers in the Prometheus text format.
+
+    Args:
+        snapshots: The metrics of each worker, keyed by worker index.
+
+    Returns:
+        The metrics exposition, with one sample per worker labelled with its index.
+    """
+    families = [
+        *((name, "gauge", help_text) for name, help_text in GAUGES.items()),
+        *((f"deliveries_{name}_total", "counter", f"Deliveries {name}.") for name in COUNTERS),
+        *((f"dedup_{name}_total", "counter", text) for name, text in DEDUP_COUNTERS.items()),
+    ]
+    lines = []
+    for name, kind, help_text in families:
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+        for worker, values in sorted(snapshots.items()):
+            if name in values:
+                lines.append(f'{METRIC_PREFIX}_{name}{{worker="{worker}"}} {values[name]}')
+    return "\n".join(lines) + "\n"
+
+
+def _orphans(directory: str, workers: int) -> typing.List[str]:
+    """List the spools no worker owns, left by a larger number of workers or a single one.
+
+    Args:
+        directory: The directory of the spools of the workers.
+        workers: The number of workers.
+
+    Returns:
+        The directories of the orphan spools.
+    """
+    orphans = []
+    if any(name.endswith(SEGMENT_SUFFIX) for name in os.listdir(directory)):
+        orphans.append(directory)
+    orphans.extend(
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.isdigit() and int(name) >= workers
+    )
+    return orphans
+
+
+def _running(stats_dir: typing.Optional[str], worker: int) -> bool:
+    """Return whether a worker still publishes the snapshot of its metrics.
+
+    Args:
+        stats_dir: The directory of the metrics snapshots of the workers, None if the
+            workers don't publish them.
+        worker: The index of the worker.
+
+    Returns:
+        True if the snapshot of the worker is not expired.
+    """
+    if stats_dir is None:
+        return False
+    try:
+        published = os.stat(os.path.join(stats_dir, f"{worker}{STATS_SUFFIX}")).st_mtime
+    except FileNotFoundError:
+        return False
+    return time.time() - published <= STATS_EXPIRY
+
+
+async def adopt(
+    directory: str,
+    workers: int,
+    exporter: typing.Tuple[str, int],
+    max_bytes: int,
+    stats_dir: typing.Optional[str] = None,
+) -> None:
+    """Replay the orphan spools to the exporter, then delete them.
+
+    The spool of a worker is only adopted once the worker stopped, so that none of the
+    deliveries it acknowledged is deleted before being replayed.
+
+    Args:
+        directory: The directory of the spools of the workers.
+        workers: The number of workers.
+        exporter: The host and webhook port of the exporter.
+        max_bytes: The maximum size of the segment files of a spool.
+        stats_dir: The directory of the metrics snapshots of the workers, None if the
+            workers don't publish them.
+    """
+    for orphan in _orphans(directory, workers):
+        while orphan != directory and _running(stats_dir, int(os.path.basename(orphan))):
+            await asyncio.sleep(STATS_INTERVAL)
+        gateway = Gateway(Spool(orphan, max_bytes), exporter)
+        logger.info("Replaying %d deliveries of the spool %s", gateway.spool.depth, orphan)
+        replay = asyncio.ensure_future(gateway.replay())
+        try:
+            while gateway.spool.depth:
+                await asyncio.sleep(STATS_INTERVAL)
+        finally:
+            replay.cancel()
+            gateway.close()
+        if orphan != directory:
+            shutil.rmtree(orphan)
+            continue
+        for name in os.listdir(directory):
+            if name.endswith(SEGMENT_SUFFIX) or name.startswith(CURSOR_NAME):
+                os.remove(os.path.join(directory, name))
+
+
+def _address(value: str) -> typing.Tuple[str, int]:
+    """Parse a `host:port` address, the host defaulting to all the interfaces.
+
+    Args:
+        value: The address.
+
+    Returns:
+        The host and the port.
+    """
+    host, _, port = value.rpartition(":")
+    return host, int(port)
+
+
+async def serve(args: argparse.Namespace) -> None:  # pragma: nocover
+    """Run a gateway worker until SIGTERM or SIGINT.
+
+    Args:
+        args: The command line arguments.
+    """
+    spool = Spool(os.path.join(args.spool, str(args.worker)), args.max_bytes // args.workers)
+    verifier = Verifier(args.secret) if args.secret else None
+    gateway = Gateway(
+        spool,
+        args.exporter,
+        worker=args.worker,
+        stats_dir=args.stats,
+        verifier=verifier,
+        deduplicator=Deduplicator(args.dedup),
+    )
+    deliveries = await asyncio.start_server(
+        gateway.serve_deliveries, *args.listen, limit=MAX_HEAD_SIZE, reuse_port=True
+    )
+    metrics = await asyncio.start_server(gateway.serve_metrics, *args.metrics, reuse_port=True)
+    tasks = [asyncio.ensure_future(gateway.replay()), asyncio.ensure_future(gateway.publish())]
+    if args.worker == 0:
+        tasks.append(
+            asyncio.ensure_future(
+                adopt(
+                    args.spool,
+                    args.workers,
+                    args.exporter,
+                    args.max_bytes // args.workers,
+                    args.stats,
+                )
+            )
+        )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    if verifier is not None:
+        # The charm sends SIGHUP when the webhook secret is updated.
+        loop.add_signal_handler(signal.SIGHUP, verifier.load)
+    await stop.wait()
+    for server in (deliveries, metrics):
+        server.close()
+        await server.wait_closed()
+    for task in tasks:
+        task.cancel()
+    gateway.close()
+    gateway.spool.flush()
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:  # pragma: nocover
+    """Parse the command line and run a gateway worker.
+
+    Args:
+        argv: The command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listen", type=_address, required=True)
+    parser.add_argument("--metrics", type=_address, required=True)
+    parser.add_argument("--exporter", type=_address, required=True)
+    parser.add_argument("--spool", required=True)
+    parser.add_argument("--max-bytes", type=int, required=True)
+    parser.add_argument("--stats")
+    parser.add_argument("--secret")
+    parser.add_argument("--dedup")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--worker", type=int, default=0)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":  # pragma: nocover
+    main()
@@ -0,0 +1,101 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Persistent storage of the workload, surviving the pod being rescheduled."""
+
+import logging
+import os
+import typing
+
+import ops
+
+from constants import GITHUB_USER
+
+logger = logging.getLogger(__name__)
+
+STORAGE_NAME = "data"
+# Location of the storage in the workload container, declared in metadata.yaml.
+MOUNT_PATH = "/var/lib/gh_exporter"
+SPOOL_DIR = f"{MOUNT_PATH}/spool"
+DIRECTORIES = (SPOOL_DIR,)
+# Share of the storage under which the free space is reported as low.
+LOW_SPACE_RATIO = 0.1
+
+
+class StorageUsage(typing.NamedTuple):
+    """Space usage of a filesystem.
+
+    Attrs:
+        capacity: size of the filesystem in bytes.
+        used: bytes used.
+        available: bytes available to unprivileged users.
+    """
+
+    capacity: int
+    used: int
+    available: int
+
+    @property
+    def low(self) -> bool:
+        """Return whether the free space is running low.
+
+        Returns:
+            bool: True if less than LOW_SPACE_RATIO of the capacity is available.
+        """
+        return self.available < self.capacity * LOW_SPACE_RATIO
+
+
+def location(model: ops.Model) -> typing.Optional[str]:
+    """Return where the storage is mounted in the charm container.
+
+    Args:
+        model: The model of the charm.
+
+    Returns:
+        The path of the storage, None if it is not attached.
+    """
+    storages = model.storages[STORAGE_NAME]
+    if not storages:
+        return None
+    return str(storages[0].location)
+
+
+def prepare(container: ops.Container) -> typing.List[str]:
+    """Create the missing directories of the storage, owned by the workload user.
+
+    The directories are listed in a single Pebble call, so that nothing is created once the
+    layout exists.
+
+    Args:
+        container: The workload container, with the storage mounted.
+
+    Returns:
+        The directories created.
+    """
+    existing = {info.path for info in container.list_files(MOUNT_PATH)}
+    missing = [directory for directory in DIRECTORIES if directory not in existing]
+    for directory in missing:
+        container.make_dir(directory, permissions=0o750, user=GITHUB_USER, group=GITHUB_USER)
+    if missing:
+        logger.info("Created the storage directories %s", missing)
+    return missing
+
+
+def usage(path: str) -> StorageUsage:
+    """Return the space usage of the filesystem of a path.
+
+    The charm container mounts the same filesystem as the workload container, so it is
+    measured without a Pebble round trip.
+
+    Args:
+        path: A path of the filesystem.
+
+    Returns:
+        The space usage.
+    """
+    stat = os.statvfs(path)
+    return StorageUsage(
+        capacity=stat.f_blocks * stat.f_frsize,
+        used=(stat.f_blocks - stat.f_bfree) * stat.f_frsize,
+        available=stat.f_bavail * stat.f_frsize,
+    )
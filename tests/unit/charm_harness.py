@@ -0,0 +1,65 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Harness set up shared by the charm unit tests."""
+
+import os
+import unittest
+from unittest.mock import patch
+
+from ops.testing import Harness
+
+import drain
+import github_actions_exporter as gh_exporter
+from charm import GithubActionsExporterCharm
+
+TEST_MODEL_NAME = "test-github-actions-exporter"
+
+
+class CharmTestCase(unittest.TestCase):
+    """Charm unit tests with a ready exporter and no wait for the drained connections.
+
+    Attrs:
+        harness: the harness of the charm.
+        mock_is_ready: the mock of the readiness of the exporter.
+        mock_drain_wait: the mock of the wait for the drained connections.
+    """
+
+    def setUp(self):
+        """Set up test environment."""
+        self.harness = Harness(GithubActionsExporterCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_model_name(TEST_MODEL_NAME)
+        is_ready = patch.object(gh_exporter, "is_ready", return_value=True)
+        self.mock_is_ready = is_ready.start()
+        self.addCleanup(is_ready.stop)
+        drain_wait = patch.object(drain, "_wait", return_value=drain.DrainResult(0, 0))
+        self.mock_drain_wait = drain_wait.start()
+        self.addCleanup(drain_wait.stop)
+        self.harness.begin()
+
+
+class FastPathTestCase(unittest.TestCase):
+    """Charm unit tests dispatched for update-status, with a ready exporter.
+
+    Attrs:
+        harness: the harness of the charm.
+        mock_is_ready: the mock of the readiness of the exporter.
+    """
+
+    def setUp(self):
+        """Set up a charm dispatched for update-status."""
+        environ = patch.dict(os.environ, {"JUJU_DISPATCH_PATH": "hooks/update-status"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        is_ready = patch.object(gh_exporter, "is_ready", return_value=True)
+        self.mock_is_ready = is_ready.start()
+        self.addCleanup(is_ready.stop)
+        probe = patch.object(gh_exporter, "probe", return_value=gh_exporter.Probe(0.25, 4096))
+        probe.start()
+        self.addCleanup(probe.stop)
+        self.harness = Harness(GithubActionsExporterCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.set_can_connect("github-actions-exporter", True)
+        self.harness.handle_exec("github-actions-exporter", [], result="")
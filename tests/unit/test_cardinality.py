@@ -0,0 +1,288 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Series cardinality unit tests."""
+
+# pylint: disable=protected-access
+
+import itertools
+import json
+import types
+import typing
+from unittest.mock import patch
+
+import ops
+from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointConsumer
+from unit.charm_harness import CharmTestCase
+
+import github_actions_exporter as gh_exporter
+import series_budget
+from cardinality import TopK, budget_plan, describe, report
+
+EXPOSITION = """\
+# HELP workflow_job_duration_seconds Duration of the workflow jobs.
+# TYPE workflow_job_duration_seconds histogram
+workflow_job_duration_seconds_bucket{repo="a",le="1"} 1
+workflow_job_duration_seconds_bucket{repo="a",le="+Inf"} 2
+workflow_job_duration_seconds_sum{repo="a"} 3.5
+workflow_job_duration_seconds_count{repo="a"} 2
+workflow_job_duration_seconds_bucket{repo="b",le="1"} 0
+workflow_job_duration_seconds_bucket{repo="b",le="+Inf"} 1
+workflow_job_duration_seconds_sum{repo="b"} 4
+workflow_job_duration_seconds_count{repo="b"} 1
+# TYPE workflow_status counter
+workflow_status_total{repo="a",status="say \\"hi\\", {ok}"} 1
+
+go_goroutines 12
+"""
+
+
+def test_report():
+    """
+    arrange: an exposition with a histogram, a counter and an untyped metric.
+    act: build the cardinality report.
+    assert: the samples are counted per family and per label, with escaped label values.
+    """
+    result = report(EXPOSITION.splitlines(keepends=True), top=1)
+
+    assert result["series"] == 10
+    assert list(result["families"]) == [
+        "workflow_job_duration_seconds",
+        "go_goroutines",
+        "workflow_status",
+    ]
+    histogram = result["families"]["workflow_job_duration_seconds"]
+    assert histogram["series"] == 8
+    assert histogram["labels"]["repo"] == {"series": 8, "top": {"a": 4}}
+    assert histogram["labels"]["le"]["series"] == 4
+    assert result["families"]["go_goroutines"] == {"series": 1, "labels": {}}
+    status = result["families"]["workflow_status"]["labels"]["status"]
+    assert status["top"] == {'say \\"hi\\", {ok}': 1}
+
+
+def test_top_k_exact_within_capacity():
+    """
+    arrange: a stream with fewer distinct values than the capacity.
+    act: count the values.
+    assert: the counts are exact.
+    """
+    top_k = TopK(capacity=10)
+    for value in "abracadabra":
+        top_k.add(value)
+
+    assert top_k.top(3) == [("a", 5), ("b", 2), ("r", 2)]
+
+
+def test_top_k_bounded_memory():
+    """
+    arrange: a stream of one million values, most of them distinct, with two values more
+        frequent than 1 / capacity.
+    act: count the values.
+    assert: the heavy hitters are found and the memory used is bounded by the capacity.
+    """
+    top_k = TopK(capacity=100)
+    unique = (f"run-{index}" for index in itertools.count())
+    for index in range(1_000_000):
+        if index % 10 == 0:
+            top_k.add("main")
+        elif index % 25 == 0:
+            top_k.add("release")
+        else:
+            top_k.add(next(unique))
+        assert len(top_k._counts) <= 100
+        assert len(top_k._heap) <= 400
+
+    assert [value for value, _ in top_k.top(2)] == ["main", "release"]
+
+
+def test_budget_plan():
+    """
+    arrange: an exposition with a family having a long tail of label values.
+    act: plan the series to drop for budgets of 40 and 2 series.
+    assert: the tail of the label is dropped first, then whole families.
+    """
+    lines = ["# TYPE workflow_status counter\n"]
+    lines.extend(
+        f'workflow_status_total{{repo="r{index:02}",status="ok"}} 1\n' for index in range(50)
+    )
+    lines.append("go_goroutines 12\n")
+    result = report(lines, top=10)
+
+    assert not budget_plan(result, 51)
+    plan = budget_plan(result, 40)
+    assert plan == [
+        {"family": "workflow_status", "label": "repo", "keep": [f"r{i:02}" for i in range(10)]}
+    ]
+    assert describe(plan) == "workflow_status{repo}"
+    assert describe(budget_plan(result, 2)) == "workflow_status{repo}, go_goroutines"
+
+
+class TestCharmSeriesBudget(CharmTestCase):
+    """Series cardinality of the charm unit tests."""
+
+    def _update_config(self, config: typing.Dict[str, typing.Any]) -> None:
+        """Change the configuration in a new config-changed hook.
+
+        Args:
+            config: The options changed.
+        """
+        for name in ("_charm_state", "_go_runtime", "_pebble_layer"):
+            self.harness.charm.__dict__.pop(name, None)
+        self.harness.update_config(config)
+
+    def test_cardinality_report_action(self):
+        """
+        arrange: exporter exposing two metric families
+        act: run the cardinality-report action for the largest family
+        assert: the series of the family are counted per label
+        """
+        self.harness.set_can_connect("github-actions-exporter", True)
+        self.harness.handle_exec(
+            "github-actions-exporter",
+            ["python3"],
+            result=(
+                "# TYPE workflow_status counter\n"
+                'workflow_status_total{repo="a",status="success"} 1\n'
+                'workflow_status_total{repo="b",status="success"} 2\n'
+                "go_goroutines 12\n"
+            ),
+        )
+
+        output = self.harness.run_action("cardinality-report", {"families": 1})
+
+        self.assertEqual(output.results["series"], 3)
+        self.assertEqual(output.results["families"], 2)
+        self.assertEqual(
+            json.loads(output.results["report"]),
+            {
+                "workflow_status": {
+                    "series": 2,
+                    "labels": {
+                        "repo": {"series": 2, "top": {"a": 1, "b": 1}},
+                        "status": {"series": 2, "top": {"success": 2}},
+                    },
+                }
+            },
+        )
+
+    @patch.object(gh_exporter, "probe", return_value=gh_exporter.Probe(0.25, 4096))
+    def test_series_budget_enforced(self, _):
+        """
+        arrange: leader unit related to Prometheus, with an exporter exposing 21 series
+        act: set a budget of 10 series and trigger update-status
+        assert: the long tail of the repo label and the smallest family are dropped by the
+            scrape job, and the status says so
+        """
+        app_name = "github-actions-exporter"
+        self.harness.set_leader(True)
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus-k8s")
+        self.harness.add_relation_unit(relation_id, "prometheus-k8s/0")
+        self.harness.set_can_connect(app_name, True)
+        self.harness.handle_exec(app_name, [], result="")
+        self.harness.handle_exec(
+            app_name,
+            ["python3"],
+            result="# TYPE workflow_status counter\n"
+            + "".join(f'workflow_status_total{{repo="r{index:02}"}} 1\n' for index in range(20))
+            + "go_goroutines 12\n",
+        )
+        self._update_config({"github_webhook_token": "foo", "series_budget": 10})
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertIn(
+            "over series budget, dropped workflow_status{repo}, go_goroutines",
+            self.harness.model.unit.status.message,
+        )
+        container = self.harness.model.unit.get_container(app_name)
+        plan = json.loads(container.pull(series_budget.PLAN_PATH).read())
+        self.assertEqual(
+            plan,
+            [
+                {
+                    "family": "workflow_status",
+                    "label": "repo",
+                    "keep": [f"r{i:02}" for i in range(10)],
+                },
+                {"family": "go_goroutines", "label": "", "keep": []},
+            ],
+        )
+        plan_services = self.harness.get_container_pebble_plan(app_name).services
+        self.assertEqual(plan_services[series_budget.SERVICE_NAME].startup, "enabled")
+        self.assertEqual(self._scraped_ports(relation_id), ["9201", "9102", "9103"])
+
+        self._update_config({"series_budget": 0})
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(json.loads(container.pull(series_budget.PLAN_PATH).read()), [])
+        plan_services = self.harness.get_container_pebble_plan(app_name).services
+        self.assertEqual(plan_services[series_budget.SERVICE_NAME].startup, "disabled")
+        self.assertEqual(self._scraped_ports(relation_id), ["9101", "9102", "9103"])
+
+    def _scraped_ports(self, relation_id: int) -> typing.List[str]:
+        """Return the ports Prometheus scrapes, as configured by Prometheus.
+
+        The scrape jobs published by the charm go through the sanitization of the consumer
+        side of the relation, which drops the keys Prometheus doesn't support.
+
+        Args:
+            relation_id: The ID of the metrics-endpoint relation.
+
+        Returns:
+            The ports of the targets of the scrape jobs.
+        """
+        app, unit = self.harness.charm.app, self.harness.charm.unit
+        relation = types.SimpleNamespace(
+            app=app,
+            units={unit},
+            data={
+                app: self.harness.get_relation_data(relation_id, app.name),
+                unit: self.harness.get_relation_data(relation_id, unit.name),
+            },
+        )
+        consumer = MetricsEndpointConsumer.__new__(MetricsEndpointConsumer)
+        return [
+            target.rsplit(":", 1)[1]
+            for job in consumer._static_scrape_config(relation)
+            for config in job["static_configs"]
+            for target in config["targets"]
+        ]
+
+    @patch.object(gh_exporter, "probe", return_value=gh_exporter.Probe(0.25, 4096))
+    def test_series_budget_measures_every_exporter(self, _):
+        """
+        arrange: leader unit with the exporters of two additional organizations, each one
+            exposing 6 series
+        act: set a budget of 10 series and trigger update-status
+        assert: the series of the three exporters are measured together, over the budget
+        """
+        app_name = "github-actions-exporter"
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(app_name, True)
+        self.harness.handle_exec(app_name, [], result="")
+        urls = []
+
+        def fetch_metrics(args):
+            urls.append(args.command[-1])
+            series = (f'workflow_status_total{{repo="r{index}"}} 1\n' for index in range(6))
+            return ops.testing.ExecResult(stdout="".join(series))
+
+        self.harness.handle_exec(app_name, ["python3"], handler=fetch_metrics)
+        self._update_config(
+            {
+                "github_webhook_token": "foo",
+                "github_orgs": "org-a=token-a,org-b=token-b",
+                "series_budget": 10,
+            }
+        )
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            [url.split("/")[2] for url in urls],
+            ["127.0.0.1:9101", "127.0.0.1:9110", "127.0.0.1:9111"],
+        )
+        container = self.harness.model.unit.get_container(app_name)
+        metrics = container.pull("/srv/gh_exporter/charm-metrics/metrics.txt").read()
+        self.assertIn("charm_exporter_series 18", metrics)
+        self.assertIn("over series budget", self.harness.model.unit.status.message)
@@ -2,29 +2,31 @@
 # See LICENSE file for licensing details.
 
 """GitHub Actions Exporter charm unit tests."""
-# pylint: disable=protected-access
 
-import unittest
+# pylint: disable=protected-access,too-many-public-methods
+
+import json
+import logging
+import statistics
+import time
 from secrets import token_hex
 from unittest.mock import MagicMock, patch
 
 import ops
-from ops.testing import Harness
+from unit.charm_harness import TEST_MODEL_NAME, CharmTestCase, FastPathTestCase
 
-from charm import GithubActionsExporterCharm
+import drain
+import github_actions_exporter as gh_exporter
+from charm import SAMPLE_INTERVALS
 
-TEST_MODEL_NAME = "test-github-actions-exporter"
+logger = logging.getLogger(__name__)
 
+# Hooks measured per case by the update-status CPU measurement.
+UPDATE_STATUS_RUNS = 20
 
-class TestCharm(unittest.TestCase):
-    """GitHub Actions Exporter charm unit tests."""
 
-    def setUp(self):
-        """Set up test environment."""
-        self.harness = Harness(GithubActionsExporterCharm)
-        self.addCleanup(self.harness.cleanup)
-        self.harness.set_model_name(TEST_MODEL_NAME)
-        self.harness.begin()
+class TestCharm(CharmTestCase):
+    """GitHub Actions Exporter charm unit tests."""
 
     @patch.object(ops.Container, "exec")
     def test_config_changed(self, mock_container_exec):
@@ -157,3 +159,492 @@ class TestCharm(unittest.TestCase):
         )
         self.assertTrue(service.is_running())
         self.assertEqual(self.harness.model.unit.status, ops.ActiveStatus())
+
+    @patch.object(ops.Container, "replan")
+    @patch.object(ops.Container, "exec")
+    def test_config_changed_with_unchanged_layer(self, mock_container_exec, mock_replan):
+        """
+        arrange: charm created and container ready with the current configuration
+        act: trigger a configuration change that does not alter the pebble layer
+        assert: the service is not replanned and the avoided restart is recorded
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        self.harness.container_pebble_ready("github-actions-exporter")
+        mock_replan.assert_called_once()
+
+        self.harness.update_config({"github_webhook_token": "default"})
+
+        mock_replan.assert_called_once()
+        self.assertEqual(self.harness.charm.restarts_avoided, 1)
+        self.assertEqual(self.harness.model.unit.status, ops.ActiveStatus())
+
+    @patch.object(ops.Container, "replan")
+    @patch.object(ops.Container, "exec")
+    def test_config_changed_with_changed_layer(self, mock_container_exec, mock_replan):
+        """
+        arrange: charm created without the webhook gateway and container ready with the
+            current configuration
+        act: change the webhook token
+        assert: the service is drained and replanned with the new token
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        self.mock_drain_wait.return_value = drain.DrainResult(drained=3, dropped=1)
+        self.harness.update_config({"webhook_spool_size": 0})
+        self.harness.container_pebble_ready("github-actions-exporter")
+        self.mock_drain_wait.assert_not_called()
+        self.harness.disable_hooks()
+        self.harness._framework = ops.framework.Framework(
+            self.harness._storage, self.harness._charm_dir, self.harness._meta, self.harness._model
+        )
+        self.harness._charm = None
+        new_webhook_token = token_hex(16)
+        self.harness.update_config({"github_webhook_token": new_webhook_token})
+        self.harness.enable_hooks()
+        self.harness.begin_with_initial_hooks()
+
+        self.assertEqual(mock_replan.call_count, 2)
+        updated_plan = self.harness.get_container_pebble_plan("github-actions-exporter").to_dict()
+        updated_plan_env = updated_plan["services"]["github-actions-exporter"]["environment"]
+        self.assertEqual(new_webhook_token, updated_plan_env["GITHUB_WEBHOOK_TOKEN"])
+        self.assertEqual(updated_plan["services"]["github-actions-exporter"]["kill-delay"], "30s")
+        self.mock_drain_wait.assert_called_once_with(30, 10)
+        container = self.harness.model.unit.get_container("github-actions-exporter")
+        self.assertFalse(container.exists(drain.DRAINING_PATH))
+        self.assertEqual(self.harness.charm.hook_metrics.counter("webhook_connections_drained"), 3)
+        self.assertEqual(self.harness.charm.hook_metrics.counter("webhook_connections_dropped"), 1)
+
+    @patch.object(ops.Container, "exec")
+    def test_workload_version_cached(self, mock_container_exec):
+        """
+        arrange: charm created and exporter binary present in the container
+        act: trigger pebble ready twice, then replace the binary and trigger it again
+        assert: the binary is only executed when its metadata changes
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("version abcdef123", None))
+        )
+        self.harness.set_can_connect("github-actions-exporter", True)
+        container = self.harness.model.unit.get_container("github-actions-exporter")
+        container.push("/srv/gh_exporter/github-actions-exporter", "v1", make_dirs=True)
+
+        self.harness.container_pebble_ready("github-actions-exporter")
+        self.harness.container_pebble_ready("github-actions-exporter")
+
+        self.assertEqual(mock_container_exec.call_count, 1)
+        self.assertEqual(self.harness.get_workload_version(), "abcdef1")
+
+        container.push("/srv/gh_exporter/github-actions-exporter", "v2-longer")
+        self.harness.container_pebble_ready("github-actions-exporter")
+
+        self.assertEqual(mock_container_exec.call_count, 2)
+
+    @patch.object(ops.Container, "exec")
+    def test_reconcile_without_deferring(self, mock_container_exec):
+        """
+        arrange: charm created and pebble not ready yet
+        act: trigger a configuration change, then upgrade the charm once pebble is reachable
+        assert: no event is deferred and the upgrade configures the workload
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        self.harness.update_config({"github_webhook_token": "foo"})
+        self.assertEqual(self.harness.model.unit.status, ops.WaitingStatus("Waiting for pebble"))
+
+        self.harness.set_can_connect("github-actions-exporter", True)
+        self.harness.charm.on.upgrade_charm.emit()
+
+        self.assertFalse(list(self.harness.framework._storage.notices()))
+        plan = self.harness.get_container_pebble_plan("github-actions-exporter").to_dict()
+        self.assertIn("github-actions-exporter", plan["services"])
+        self.assertEqual(self.harness.model.unit.status, ops.ActiveStatus())
+
+    @patch.object(gh_exporter, "wait_ready", return_value=True)
+    @patch.object(ops.Container, "exec")
+    def test_restart_waits_for_lock(self, mock_container_exec, _):
+        """
+        arrange: leader unit with a running exporter to restart, and the restart lock held by
+            its peer
+        act: reconcile, then release the lock from the peer
+        assert: the exporter is only restarted once the lock is granted, then released
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        app_name = "github-actions-exporter"
+        peer = f"{app_name}/1"
+        self.harness.set_leader(True)
+        relation_id = self.harness.add_relation("github-actions-exporter-peers", app_name)
+        self.harness.add_relation_unit(relation_id, peer)
+        self.harness.update_relation_data(relation_id, peer, {"restart": "requested"})
+        self.harness.update_relation_data(
+            relation_id, app_name, {"restart-granted": f'["{peer}"]'}
+        )
+        self.harness.set_can_connect(app_name, True)
+        container = self.harness.model.unit.get_container(app_name)
+        container.add_layer(
+            "previous",
+            {"services": {app_name: {"override": "replace", "command": "previous"}}},
+        )
+
+        self.harness.charm.reconcile()
+
+        self.assertEqual(
+            self.harness.model.unit.status, ops.WaitingStatus("Waiting for restart lock")
+        )
+        plan = self.harness.get_container_pebble_plan(app_name).to_dict()
+        self.assertEqual(plan["services"][app_name]["command"], "previous")
+
+        self.harness.update_relation_data(relation_id, peer, {"restart": ""})
+
+        plan = self.harness.get_container_pebble_plan(app_name).to_dict()
+        self.assertEqual(
+            plan["services"][app_name]["command"],
+            f"{gh_exporter.COMMAND_PATH} --web.listen-address-ingress=:8066",
+        )
+        self.assertEqual(self.harness.model.unit.status, ops.ActiveStatus())
+        relation_data = self.harness.get_relation_data(relation_id, app_name)
+        self.assertEqual(relation_data["restart-granted"], "[]")
+
+    @patch.object(gh_exporter, "is_ready")
+    def test_update_status_releases_restart_lock(self, mock_is_ready):
+        """
+        arrange: unit holding the restart lock with an exporter not ready yet
+        act: trigger update-status before and after the exporter is ready
+        assert: the lock is only released once the exporter is ready
+        """
+        app_name = "github-actions-exporter"
+        unit_name = f"{app_name}/0"
+        relation_id = self.harness.add_relation("github-actions-exporter-peers", app_name)
+        self.harness.add_relation_unit(relation_id, f"{app_name}/1")
+        self.harness.update_relation_data(relation_id, unit_name, {"restart": "requested"})
+        self.harness.update_relation_data(
+            relation_id, app_name, {"restart-granted": f'["{unit_name}"]'}
+        )
+        self.harness.set_can_connect(app_name, True)
+        self.harness.handle_exec(app_name, [], result="")
+        mock_is_ready.return_value = False
+
+        self.harness.charm.on.update_status.emit()
+
+        relation_data = self.harness.get_relation_data(relation_id, unit_name)
+        self.assertEqual(relation_data.get("restart"), "requested")
+
+        mock_is_ready.return_value = True
+        self.harness.charm.on.update_status.emit()
+
+        relation_data = self.harness.get_relation_data(relation_id, unit_name)
+        self.assertNotIn("restart", relation_data)
+
+    @patch.object(ops.Container, "exec")
+    def test_ingress_load_balanced_across_units(self, mock_container_exec):
+        """
+        arrange: leader unit related to an ingress provider
+        act: trigger a configuration change
+        assert: the unit opens its ports and the ingress routes to the application service
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        self.harness.set_leader(True)
+        self.harness.set_can_connect("github-actions-exporter", True)
+        relation_id = self.harness.add_relation("ingress", "traefik-k8s")
+        self.harness.add_relation_unit(relation_id, "traefik-k8s/0")
+
+        self.harness.update_config({"github_webhook_token": "foo"})
+
+        self.assertEqual(
+            self.harness.model.unit.opened_ports(),
+            {ops.OpenedPort("tcp", 8065), ops.OpenedPort("tcp", 9101)},
+        )
+        relation_data = self.harness.get_relation_data(relation_id, "github-actions-exporter")
+        self.assertEqual(
+            relation_data["host"],
+            f"github-actions-exporter.{TEST_MODEL_NAME}.svc.cluster.local",
+        )
+
+    @patch.object(ops.Container, "exec")
+    def test_multiple_organizations(self, mock_container_exec):
+        """
+        arrange: charm related to prometheus and configured with additional organizations
+        act: set container as ready
+        assert: one exporter per organization is run and scraped on its own port
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        self.harness.set_leader(True)
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus-k8s")
+        self.harness.add_relation_unit(relation_id, "prometheus-k8s/0")
+        self.harness.disable_hooks()
+        self.harness._framework = ops.framework.Framework(
+            self.harness._storage, self.harness._charm_dir, self.harness._meta, self.harness._model
+        )
+        self.harness._charm = None
+        self.harness.update_config({"github_orgs": "Org-A=token-a,org-b=token-b"})
+        self.harness.enable_hooks()
+        self.harness.begin_with_initial_hooks()
+
+        plan = self.harness.get_container_pebble_plan("github-actions-exporter").to_dict()
+        service = plan["services"]["github-actions-exporter-org-a"]
+        self.assertEqual(service["environment"]["GITHUB_ORG"], "Org-A")
+        self.assertEqual(service["environment"]["GITHUB_API_TOKEN"], "token-a")
+        self.assertIn("--web.listen-address=:9110", service["command"])
+        self.assertIn("--web.listen-address-ingress=127.0.0.1:0", service["command"])
+        self.assertIn(
+            "--web.listen-address=:9111",
+            plan["services"]["github-actions-exporter-org-b"]["command"],
+        )
+        self.assertEqual(
+            plan["checks"]["github-actions-exporter-org-b-ready"]["http"],
+            {"url": "http://localhost:9111/metrics"},
+        )
+        self.assertEqual(
+            plan["services"]["github-actions-exporter-org-b"]["on-check-failure"],
+            {"github-actions-exporter-org-b-alive": "restart"},
+        )
+        relation_data = self.harness.get_relation_data(relation_id, "github-actions-exporter")
+        jobs = json.loads(relation_data["scrape_jobs"])
+        self.assertEqual(jobs[0]["static_configs"][0]["targets"], ["*:9101", "*:9110", "*:9111"])
+
+    def test_invalid_organizations(self):
+        """
+        arrange: charm created
+        act: configure a malformed list of additional organizations, or one with the same
+            organization twice in different cases
+        assert: the unit reaches blocked status
+        """
+        for github_orgs in ("org-a", "Org-A=token-a,org-a=token-b"):
+            with self.subTest(github_orgs=github_orgs):
+                self.harness.update_config({"github_orgs": github_orgs})
+                self.harness.charm.__dict__.pop("_charm_state", None)
+
+                self.harness.charm.reconcile()
+
+                self.assertEqual(
+                    self.harness.model.unit.status,
+                    ops.BlockedStatus("invalid configuration: github_orgs"),
+                )
+
+    @patch.object(ops.Container, "exec")
+    def test_go_runtime_from_cgroup_limits(self, mock_container_exec):
+        """
+        arrange: workload container limited to 1.5 CPU and 1GiB of memory
+        act: set container as ready
+        assert: the Go runtime limits are derived from the container limits, less the memory
+            of the two webhook gateway workers, and reported
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        self.harness.set_can_connect("github-actions-exporter", True)
+        container = self.harness.model.unit.get_container("github-actions-exporter")
+        container.push("/sys/fs/cgroup/cpu.max", "150000 100000\n", make_dirs=True)
+        container.push("/sys/fs/cgroup/memory.max", f"{2**30}\n")
+
+        self.harness.container_pebble_ready("github-actions-exporter")
+
+        plan = self.harness.get_container_pebble_plan("github-actions-exporter").to_dict()
+        environment = plan["services"]["github-actions-exporter"]["environment"]
+        self.assertEqual(environment["GOMAXPROCS"], "2")
+        self.assertEqual(environment["GOMEMLIMIT"], "806MiB")
+        self.assertNotIn("GOGC", environment)
+        self.assertEqual(
+            self.harness.model.unit.status, ops.ActiveStatus("GOMAXPROCS=2 GOMEMLIMIT=806MiB")
+        )
+
+    @patch.object(gh_exporter, "probe", return_value=gh_exporter.Probe(0.25, 4096))
+    def test_update_status_probes_once(self, mock_probe):
+        """
+        arrange: workload container with a ready exporter already planned
+        act: trigger update-status, then check readiness as the scrape job provider does
+        assert: the exporter metrics are requested once, and reused by the ready check
+        """
+        self.harness.set_can_connect("github-actions-exporter", True)
+        self.harness.handle_exec("github-actions-exporter", [], result="")
+        self.harness.charm.on.update_status.emit()
+        # A new hook runs with a new charm instance.
+        self.harness.charm.__dict__.pop("_metrics_probe", None)
+        mock_probe.reset_mock()
+
+        self.harness.charm.on.update_status.emit()
+        self.harness.charm._is_ready()
+
+        probe_metrics = self.mock_is_ready.call_args.args[2]
+        self.assertEqual(probe_metrics(), gh_exporter.Probe(0.25, 4096))
+        mock_probe.assert_called_once()
+
+    @patch.object(gh_exporter, "wait_ready", return_value=False)
+    @patch.object(ops.Container, "exec")
+    def test_advertised_once_ready(self, mock_container_exec, _):
+        """
+        arrange: leader unit related to Prometheus and to an ingress provider
+        act: start an exporter that is not ready, then recover and fail its ready check
+        assert: the unit is only advertised while its exporter is ready
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        app_name = "github-actions-exporter"
+        unit_name = f"{app_name}/0"
+        self.harness.set_leader(True)
+        metrics_id = self.harness.add_relation("metrics-endpoint", "prometheus-k8s")
+        self.harness.add_relation_unit(metrics_id, "prometheus-k8s/0")
+        ingress_id = self.harness.add_relation("ingress", "traefik-k8s")
+        self.harness.add_relation_unit(ingress_id, "traefik-k8s/0")
+        self.mock_is_ready.return_value = False
+
+        self.harness.container_pebble_ready(app_name)
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ops.WaitingStatus("Waiting for the exporter to be ready"),
+        )
+        metrics_data = self.harness.get_relation_data(metrics_id, unit_name)
+        self.assertNotIn("prometheus_scrape_unit_address", metrics_data)
+        self.assertNotIn("host", self.harness.get_relation_data(ingress_id, app_name))
+
+        self.mock_is_ready.return_value = True
+        container = self.harness.model.unit.get_container(app_name)
+        self.harness.charm.on.github_actions_exporter_pebble_check_recovered.emit(
+            container, gh_exporter.CHECK_READY_NAME
+        )
+
+        self.assertEqual(self.harness.model.unit.status, ops.ActiveStatus())
+        metrics_data = self.harness.get_relation_data(metrics_id, unit_name)
+        self.assertEqual(metrics_data["prometheus_scrape_unit_name"], unit_name)
+        self.assertIn("prometheus_scrape_unit_address", metrics_data)
+        self.assertIn("host", self.harness.get_relation_data(ingress_id, app_name))
+
+        self.mock_is_ready.return_value = False
+        self.harness.charm.on.github_actions_exporter_pebble_check_failed.emit(
+            container, gh_exporter.CHECK_READY_NAME
+        )
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ops.WaitingStatus("Waiting for the exporter to be ready"),
+        )
+        metrics_data = self.harness.get_relation_data(metrics_id, unit_name)
+        self.assertNotIn("prometheus_scrape_unit_address", metrics_data)
+
+
+class TestFastPath(FastPathTestCase):
+    """Dispatch fast path unit tests."""
+
+    def test_update_status_skips_relation_wiring(self):
+        """
+        arrange: charm dispatched for update-status with a ready exporter
+        act: trigger update-status
+        assert: the relation libraries are not wired, and the work done is counted per hook
+        """
+        self.harness.charm._stored.ready = True
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertNotIn("_metrics_endpoint", vars(self.harness.charm))
+        self.assertNotIn("ingress", vars(self.harness.charm))
+        container = self.harness.model.unit.get_container("github-actions-exporter")
+        metrics = container.pull("/srv/gh_exporter/charm-metrics/metrics.txt").read()
+        self.assertIn('charm_hook_work_total{hook="update_status",work="fast_path"} 1', metrics)
+        self.assertIn(
+            'charm_hook_work_total{hook="update_status",work="metrics_probe"} 1', metrics
+        )
+        self.assertNotIn('work="reconcile"', metrics)
+
+    def test_update_status_wires_relations_on_demand(self):
+        """
+        arrange: charm dispatched for update-status with an exporter that became ready
+        act: trigger update-status
+        assert: the workload is reconciled, wiring the relation libraries it publishes to
+        """
+        self.harness.disable_hooks()
+        self.harness.update_config({"github_webhook_token": "foo"})
+        self.harness.enable_hooks()
+        self.assertNotIn("_metrics_endpoint", vars(self.harness.charm))
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertIn("_metrics_endpoint", vars(self.harness.charm))
+        self.assertIsInstance(self.harness.model.unit.status, ops.ActiveStatus)
+
+    def _sampling_leader(self) -> ops.Container:
+        """Configure a ready leader unit taking every update-status sample.
+
+        Returns:
+            The workload container.
+        """
+        app_name = "github-actions-exporter"
+        self.harness.set_leader(True)
+        self.harness.add_storage("data", attach=True)
+        self.harness.handle_exec(app_name, ["python3"], result="go_goroutines 12\n")
+        container = self.harness.model.unit.get_container(app_name)
+        container.push("/sys/fs/cgroup/cpu.stat", "usage_usec 1000\n", make_dirs=True)
+        container.push("/sys/fs/cgroup/memory.peak", f"{100 * 2**20}\n")
+        # A new hook runs with a new charm instance.
+        for name in ("_charm_state", "_go_runtime", "_pebble_layer"):
+            self.harness.charm.__dict__.pop(name, None)
+        self.harness.update_config({"github_webhook_token": "foo", "series_budget": 1000})
+        self.harness.charm._stored.ready = True
+        return container
+
+    def test_update_status_samples_on_intervals(self):
+        """
+        arrange: ready leader unit with a series budget and a data storage, sampled by a
+            first update-status
+        act: trigger update-status again, then once every sample interval elapsed
+        assert: the samples are only taken again once their interval elapsed
+        """
+        self._sampling_leader()
+        self.harness.charm.on.update_status.emit()
+        # A new hook runs with a new charm instance.
+        self.harness.charm.__dict__.pop("_metrics_probe", None)
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(self.harness.charm.hook_metrics.samples[-1]["work"], {})
+
+        self.harness.charm.__dict__.pop("_metrics_probe", None)
+        later = time.time() + max(SAMPLE_INTERVALS.values())
+        with patch("charm.time.time", return_value=later):
+            self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            set(self.harness.charm.hook_metrics.samples[-1]["work"]), set(SAMPLE_INTERVALS)
+        )
+
+    def test_update_status_cpu(self):
+        """
+        arrange: ready leader unit with a series budget and a data storage
+        act: trigger update-status with every sample due, then within the sample intervals,
+            measuring the CPU time of the hook
+        assert: within the intervals, update-status reads fewer files and makes no exec
+        """
+        self._sampling_leader()
+        charm = self.harness.charm
+
+        def update_status(due: bool) -> dict:
+            if due:
+                charm._stored.sampled.clear()
+            charm.__dict__.pop("_metrics_probe", None)
+            with patch.object(
+                ops.Container, "pull", autospec=True, side_effect=ops.Container.pull
+            ) as mock_pull:
+                charm.on.update_status.emit()
+            return {**charm.hook_metrics.samples[-1], "pulls": mock_pull.call_count}
+
+        due = [update_status(due=True) for _ in range(UPDATE_STATUS_RUNS)]
+        steady = [update_status(due=False) for _ in range(UPDATE_STATUS_RUNS)]
+
+        logger.info(
+            "update-status CPU time: %.2f ms with every sample due, %.2f ms within the intervals",
+            statistics.median(sample["cpu"] for sample in due) * 1000,
+            statistics.median(sample["cpu"] for sample in steady) * 1000,
+        )
+        self.assertIn("series_measure", due[-1]["work"])
+        self.assertEqual(steady[-1]["work"], {})
+        self.assertLess(steady[-1]["pulls"], due[-1]["pulls"])
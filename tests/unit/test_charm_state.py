@@ -0,0 +1,81 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""GitHub Actions Exporter charm state unit tests."""
+
+# pylint: disable=protected-access
+
+import logging
+import timeit
+from unittest.mock import patch
+
+from ops.testing import Harness
+
+import github_actions_exporter as gh_exporter
+from charm import GithubActionsExporterCharm
+from charm_state import CharmState
+
+logger = logging.getLogger(__name__)
+
+
+@patch.object(gh_exporter, "probe", return_value=gh_exporter.Probe(0.25, 4096))
+@patch.object(gh_exporter, "is_ready", return_value=True)
+def test_charm_state_not_validated_on_unrelated_hooks(_, mock_probe):
+    """
+    arrange: ready unit reading its webhook token from a user secret, with a series budget
+        and the container reachable.
+    act: trigger update-status in a new hook, with every sample due, and measure the cost of
+        building the charm state.
+    assert: the configuration is not read nor validated, and the secret is not read, which
+        saves the measured cost.
+    """
+    harness = Harness(GithubActionsExporterCharm)
+    harness.begin()
+    harness.set_can_connect("github-actions-exporter", True)
+    harness.handle_exec("github-actions-exporter", [], result="")
+    secret_id = harness.add_user_secret({"token": "foo"})
+    harness.grant_secret(secret_id, harness.model.app.name)
+    harness.update_config(
+        {"github_webhook_token_secret": secret_id, "metrics_timeout": 7, "series_budget": 100}
+    )
+    number = 1000
+    per_call = timeit.timeit(lambda: CharmState.from_charm(harness.charm), number=number)
+    logger.info("Charm state validation avoided: %.1f us per hook", per_call / number * 1e6)
+    # A new hook runs with a new charm instance.
+    for name in ("_charm_state", "_metrics_probe"):
+        harness.charm.__dict__.pop(name, None)
+    harness.charm.token_secrets._cache.clear()
+    harness.charm._stored.sampled.clear()
+    harness.charm._stored.ready = True
+
+    with patch.object(
+        CharmState, "from_charm", wraps=CharmState.from_charm
+    ) as from_charm, patch.object(
+        harness._backend, "secret_get", wraps=harness._backend.secret_get
+    ) as secret_get:
+        harness.charm.on.update_status.emit()
+
+        from_charm.assert_not_called()
+        secret_get.assert_not_called()
+    mock_probe.assert_called_with(9101, 7)
+    harness.cleanup()
+
+
+@patch.object(gh_exporter, "is_ready", return_value=True)
+def test_charm_state_validated_once_per_hook(_):
+    """
+    arrange: charm created and container reachable.
+    act: reconcile the workload twice.
+    assert: the configuration is validated only once.
+    """
+    harness = Harness(GithubActionsExporterCharm)
+    harness.begin()
+    harness.set_can_connect("github-actions-exporter", True)
+    harness.handle_exec("github-actions-exporter", [], result="")
+
+    with patch.object(CharmState, "from_charm", wraps=CharmState.from_charm) as from_charm:
+        harness.charm.reconcile()
+        harness.charm.reconcile()
+
+        from_charm.assert_called_once()
+    harness.cleanup()
@@ -0,0 +1,78 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Webhook connections drain unit tests."""
+
+# pylint: disable=protected-access
+
+from unittest.mock import MagicMock, patch
+
+import drain
+
+PROC_NET_TCP = """\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:1F91 00000000:0000 0A 00000000:00000000 00:00000000 00000000  2000        0 1 1
+   1: 0100007F:1F91 0A01010A:D431 01 00000000:00000000 00:00000000 00000000  2000        0 2 1
+   2: 0100007F:1F91 0A01010A:D432 06 00000000:00000000 00:00000000 00000000  2000        0 3 1
+   3: 0100007F:239D 0A01010A:D433 01 00000000:00000000 00:00000000 00000000  2000        0 4 1
+"""
+
+
+def test_connections(tmp_path):
+    """
+    arrange: a TCP socket table with listening, established and closing sockets.
+    act: list the established connections to the webhook port.
+    assert: only the established connections to the webhook port are returned.
+    """
+    proc_net_tcp = tmp_path / "tcp"
+    proc_net_tcp.write_text(PROC_NET_TCP, encoding="ascii")
+
+    with patch.object(drain, "PROC_NET_TCP", (str(proc_net_tcp), str(tmp_path / "tcp6"))):
+        assert drain.connections(8081) == {("0100007F:1F91", "0A01010A:D431")}
+
+
+@patch("time.sleep")
+def test_wait(_):
+    """
+    arrange: two connections, one closing before the timeout and one staying open.
+    act: wait for the connections to close.
+    assert: the closed connection is counted as drained and the other one as dropped.
+    """
+    first, second = ("local", "first"), ("local", "second")
+    with patch.object(
+        drain, "connections", side_effect=[{first, second}, {second}, {second}]
+    ), patch("time.monotonic", side_effect=[0, 0, 1, 2]):
+        assert drain._wait(2, 10) == drain.DrainResult(drained=1, dropped=1)
+
+
+@patch("time.sleep")
+def test_wait_without_connections(mock_sleep):
+    """
+    arrange: no connection.
+    act: wait for the connections to close.
+    assert: the wait ends once the pod had time to be removed from the service.
+    """
+    with patch.object(drain, "connections", return_value=set()), patch(
+        "time.monotonic", side_effect=[0, 0, 15]
+    ):
+        assert drain._wait(30, 15) == drain.DrainResult(drained=0, dropped=0)
+    mock_sleep.assert_called_once_with(drain.POLL_INTERVAL)
+
+
+def test_draining():
+    """
+    arrange: a workload container.
+    act: drain the webhook connections.
+    assert: the marker failing the draining check exists while draining, for at least the
+        propagation delay, then is removed, and the check only tests the marker.
+    """
+    container = MagicMock()
+
+    with patch.object(drain, "_wait", return_value=drain.DrainResult(0, 0)) as mock_wait:
+        with drain.draining(container, 30, 5):
+            assert container.push.call_args.args[0] == drain.DRAINING_PATH
+            container.remove_path.assert_not_called()
+
+    mock_wait.assert_called_once_with(30, 5)
+    container.remove_path.assert_called_once_with(drain.DRAINING_PATH, recursive=True)
+    assert drain.check()["exec"]["command"] == f"test ! -e {drain.DRAINING_PATH}"
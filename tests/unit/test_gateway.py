@@ -0,0 +1,139 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Webhook gateway of the charm unit tests."""
+
+# pylint: disable=protected-access
+
+import json
+from secrets import token_hex
+from unittest.mock import MagicMock, patch
+
+import ops
+from unit.charm_harness import CharmTestCase
+
+import gateway
+import workload_storage
+from cgroup import CgroupLimits
+from charm_state import MIN_WEBHOOK_SPOOL_SIZE
+from gateway_spool import SEGMENT_SIZE
+
+
+class TestCharmGateway(CharmTestCase):
+    """Webhook gateway of the charm unit tests."""
+
+    @patch.object(ops.Container, "exec")
+    def test_webhook_gateway(self, mock_container_exec):
+        """
+        arrange: charm created with the default webhook spool size, and a quota of 1.5 cores
+        act: set the container as ready, then change the webhook token
+        assert: two gateway workers listen on the webhook port and spool to the data storage,
+            the other workers are disabled, the exporter listens on an internal port, and the
+            exporter is restarted without draining while the workers reload the new token
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        app_name = "github-actions-exporter"
+        self.harness.set_leader(True)
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(relation_id, "prometheus/0")
+        self.harness.set_can_connect(app_name, True)
+        container = self.harness.model.unit.get_container(app_name)
+        container.push("/sys/fs/cgroup/cpu.max", "150000 100000\n", make_dirs=True)
+        self.harness.add_storage("data", attach=True)
+        self.harness.container_pebble_ready(app_name)
+
+        plan = self.harness.get_container_pebble_plan(app_name).to_dict()
+        command = plan["services"][gateway.SERVICE_NAME]["command"]
+        self.assertIn("--listen=:8065", command)
+        self.assertIn("--exporter=127.0.0.1:8066", command)
+        self.assertIn(f"--spool={workload_storage.SPOOL_DIR}", command)
+        self.assertIn(f"--max-bytes={512 * 2**20}", command)
+        self.assertIn("--workers=2 --worker=0", command)
+        self.assertEqual(
+            [plan["services"][name]["startup"] for name in gateway.service_names()],
+            ["enabled"] * 2 + ["disabled"] * (gateway.MAX_WORKERS - 2),
+        )
+        self.assertTrue(
+            plan["services"][gateway.service_name(1)]["command"].endswith("--worker=1")
+        )
+        self.assertIn(gateway.CHECK_NAME, plan["checks"])
+        self.assertTrue(plan["services"][app_name]["command"].endswith("=:8066"))
+        for source in gateway.SOURCES:
+            self.assertEqual(
+                container.pull(f"{gateway.GATEWAY_DIR}/{source.name}").read(),
+                source.read_text(encoding="utf-8"),
+            )
+        jobs = json.loads(self.harness.get_relation_data(relation_id, app_name)["scrape_jobs"])
+        self.assertIn(["*:9103"], [job["static_configs"][0]["targets"] for job in jobs])
+
+        self.harness.disable_hooks()
+        self.harness._framework = ops.framework.Framework(
+            self.harness._storage, self.harness._charm_dir, self.harness._meta, self.harness._model
+        )
+        self.harness._charm = None
+        token = token_hex(16)
+        self.harness.update_config({"github_webhook_token": token})
+        self.harness.enable_hooks()
+        with patch.object(ops.Container, "send_signal") as mock_send_signal:
+            self.harness.begin_with_initial_hooks()
+
+        self.mock_drain_wait.assert_not_called()
+        self.assertEqual(container.pull(gateway.SECRET_PATH).read(), token)
+        mock_send_signal.assert_called_once_with(
+            "SIGHUP", gateway.SERVICE_NAME, gateway.service_name(1)
+        )
+        self.assertEqual(self.harness.model.unit.status, ops.ActiveStatus("GOMAXPROCS=2"))
+
+    @patch.object(ops.Container, "exec")
+    def test_webhook_gateway_workers_stopped(self, mock_container_exec):
+        """
+        arrange: webhook gateway running three workers for a quota of 3 cores
+        act: lower the quota to 1 core and reconcile in a new hook
+        assert: the surplus workers are stopped rather than restarted by the replan, and the
+            remaining worker runs alone
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        app_name = "github-actions-exporter"
+        self.harness.set_can_connect(app_name, True)
+        container = self.harness.model.unit.get_container(app_name)
+        container.push("/sys/fs/cgroup/cpu.max", "300000 100000\n", make_dirs=True)
+        self.harness.container_pebble_ready(app_name)
+        self.assertTrue(container.get_service(gateway.service_name(2)).is_running())
+
+        container.push("/sys/fs/cgroup/cpu.max", "100000 100000\n")
+        self.harness._framework = ops.framework.Framework(
+            self.harness._storage, self.harness._charm_dir, self.harness._meta, self.harness._model
+        )
+        self.harness._charm = None
+        self.harness.begin()
+        self.harness.charm.reconcile()
+
+        services = container.get_services(*gateway.service_names()[:3])
+        self.assertEqual(
+            [services[name].is_running() for name in gateway.service_names()[:3]],
+            [True, False, False],
+        )
+        plan = self.harness.get_container_pebble_plan(app_name).to_dict()
+        self.assertIn("--workers=1 --worker=0", plan["services"][gateway.SERVICE_NAME]["command"])
+
+
+def test_workers_capped_by_spool_size():
+    """
+    arrange: a quota of 8 cores, with the minimum spool size and with the default one.
+    act: get the number of gateway workers.
+    assert: a single worker shares the minimum spool, one worker per core the default one, so
+        the two segments of each worker fit in the spool.
+    """
+    limits = CgroupLimits(cpu=8.0, memory=None)
+    state = MagicMock(webhook_spool_size=MIN_WEBHOOK_SPOOL_SIZE)
+
+    assert gateway.workers(state, limits) == 1
+
+    state.webhook_spool_size = 512
+    count = gateway.workers(state, limits)
+    assert count == 8
+    assert count * 2 * SEGMENT_SIZE <= 512 * 2**20
@@ -0,0 +1,234 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""GitHub Actions Exporter helper unit tests."""
+
+import http.server
+import io
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from ops.pebble import CheckInfo, CheckLevel, CheckStatus, PathError, Plan
+
+import github_actions_exporter as gh_exporter
+from cgroup import CgroupLimits, read_limits
+
+
+def _container(status: CheckStatus) -> MagicMock:
+    """Return a container mock with the exporter ready check in the given status.
+
+    Args:
+        status: The status of the ready check.
+
+    Returns:
+        The container mock.
+    """
+    container = MagicMock()
+    container.get_checks.return_value = {
+        gh_exporter.CHECK_READY_NAME: CheckInfo(
+            gh_exporter.CHECK_READY_NAME, CheckLevel.READY, status
+        )
+    }
+    return container
+
+
+@pytest.mark.parametrize(
+    "status, result, expected",
+    [
+        pytest.param(CheckStatus.UP, gh_exporter.Probe(0.1, 4096), True, id="ready"),
+        pytest.param(CheckStatus.DOWN, gh_exporter.Probe(0.1, 4096), False, id="check down"),
+        pytest.param(CheckStatus.UP, None, False, id="request failed"),
+        pytest.param(CheckStatus.UP, gh_exporter.Probe(6.0, 4096), False, id="too slow"),
+        pytest.param(CheckStatus.UP, gh_exporter.Probe(0.1, 10), False, id="too small"),
+    ],
+)
+def test_is_ready(status, result, expected):
+    """
+    arrange: a container with the ready check in a given status and a metrics endpoint.
+    act: check if the exporter is ready.
+    assert: the exporter is ready only if the check is up and the metrics are served in time.
+    """
+    with patch.object(gh_exporter, "probe", return_value=result):
+        assert gh_exporter.is_ready(_container(status), timeout=5) is expected
+
+
+@pytest.mark.parametrize(
+    "status, expected_size",
+    [
+        pytest.param(200, 2048, id="ok"),
+        pytest.param(503, None, id="error"),
+    ],
+)
+def test_probe(status, expected_size):
+    """
+    arrange: an HTTP server answering the metrics requests with a given status.
+    act: request the metrics.
+    assert: the response size is measured for successful responses only.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """Metrics request handler."""
+
+        def do_GET(self):  # noqa: N802 pylint: disable=invalid-name
+            """Answer with a 2KiB body."""
+            self.send_response(status)
+            self.send_header("Content-Length", "2048")
+            self.end_headers()
+            self.wfile.write(b"#" * 2048)
+
+        def log_message(self, *_):
+            """Don't log the requests."""
+
+    with http.server.HTTPServer(("127.0.0.1", 0), Handler) as server:
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        result = gh_exporter.probe(server.server_address[1], timeout=5)
+        thread.join()
+
+    assert (result.size if result else None) == expected_size
+
+
+def test_probe_connection_refused():
+    """
+    arrange: no exporter listening.
+    act: request the metrics.
+    assert: the request fails.
+    """
+    with patch("http.client.HTTPConnection.request", side_effect=ConnectionRefusedError()):
+        assert gh_exporter.probe(1, timeout=1) is None
+
+
+def test_wait_ready_timeout():
+    """
+    arrange: an exporter that never becomes ready.
+    act: wait for the exporter to be ready.
+    assert: the wait gives up after the timeout.
+    """
+    with patch.object(gh_exporter, "is_ready", return_value=False), patch("time.sleep"), patch(
+        "time.monotonic", side_effect=[0, 1, 2, 3]
+    ):
+        assert not gh_exporter.wait_ready(MagicMock(), timeout=2)
+
+
+def test_wait_ready():
+    """
+    arrange: an exporter becoming ready on the second probe.
+    act: wait for the exporter to be ready.
+    assert: the wait succeeds.
+    """
+    with patch.object(gh_exporter, "is_ready", side_effect=[False, True]), patch("time.sleep"):
+        assert gh_exporter.wait_ready(MagicMock(), timeout=10)
+
+
+def test_changed_with_go_durations():
+    """
+    arrange: a plan with the durations returned by Pebble in the Go format, and a layer with
+        the same durations in seconds, then with a different one.
+    act: list the services and checks changed.
+    assert: only the services and checks with a different duration are changed.
+    """
+    plan = Plan(
+        {
+            "services": {
+                "exporter": {"override": "replace", "command": "run", "kill-delay": "1m30s"},
+            },
+            "checks": {
+                "ready": {
+                    "override": "replace",
+                    "period": "1m0s",
+                    "timeout": "500ms",
+                    "http": {"url": "http://localhost/"},
+                },
+            },
+        }
+    )
+    layer = {
+        "services": {"exporter": {"override": "replace", "command": "run", "kill-delay": "90s"}},
+        "checks": {
+            "ready": {
+                "override": "replace",
+                "period": "60s",
+                "timeout": "0.5s",
+                "http": {"url": "http://localhost/"},
+            },
+        },
+    }
+
+    assert gh_exporter.changed_services(plan, layer) == []
+    assert gh_exporter.changed_checks(plan, layer) == []
+
+    layer["services"]["exporter"]["kill-delay"] = "91s"
+    layer["checks"]["ready"]["timeout"] = "2s"
+
+    assert gh_exporter.changed_services(plan, layer) == ["exporter"]
+    assert gh_exporter.changed_checks(plan, layer) == ["ready"]
+
+
+def test_go_runtime_overrides():
+    """
+    arrange: charm state overriding the Go runtime limits and two exporters to run.
+    act: generate the Go runtime environment.
+    assert: the configured values take precedence over the container limits.
+    """
+    state = MagicMock(go_max_procs=4, go_mem_limit="256MiB", go_gc=50, github_orgs={"a": "t"})
+
+    runtime = gh_exporter.go_runtime(state, CgroupLimits(cpu=1.0, memory=2**30))
+
+    assert runtime == {"GOMAXPROCS": "4", "GOMEMLIMIT": "256MiB", "GOGC": "50"}
+
+
+def test_go_runtime_shares_memory_between_exporters():
+    """
+    arrange: charm state with two exporters to run in an unlimited CPU container.
+    act: generate the Go runtime environment.
+    assert: the memory limit is shared between the exporters and GOMAXPROCS is not set.
+    """
+    state = MagicMock(go_max_procs=None, go_mem_limit=None, go_gc=None, github_orgs={"a": "t"})
+
+    runtime = gh_exporter.go_runtime(state, CgroupLimits(cpu=None, memory=2**30))
+
+    assert runtime == {"GOMEMLIMIT": "460MiB"}
+
+
+@pytest.mark.parametrize(
+    "reserved, expected",
+    [
+        pytest.param(256 * 2**20, "691MiB", id="reserved"),
+        pytest.param(2**30, "460MiB", id="half of the limit at least"),
+    ],
+)
+def test_go_runtime_reserves_memory(reserved, expected):
+    """
+    arrange: charm state with a single exporter and memory used by other processes.
+    act: generate the Go runtime environment.
+    assert: the memory limit of the exporter excludes the reserved memory, up to half of it.
+    """
+    state = MagicMock(go_max_procs=None, go_mem_limit=None, go_gc=None, github_orgs={})
+
+    runtime = gh_exporter.go_runtime(state, CgroupLimits(cpu=None, memory=2**30), reserved)
+
+    assert runtime == {"GOMEMLIMIT": expected}
+
+
+@pytest.mark.parametrize(
+    "cpu_max, memory_max, expected",
+    [
+        pytest.param("max 100000", "max", CgroupLimits(None, None), id="unlimited"),
+        pytest.param("50000 100000", "1048576", CgroupLimits(0.5, 2**20), id="limited"),
+        pytest.param(None, None, CgroupLimits(None, None), id="unreadable"),
+    ],
+)
+def test_read_limits(cpu_max, memory_max, expected):
+    """
+    arrange: a container with given cgroup interface files.
+    act: read the container limits.
+    assert: the limits are parsed from the files.
+    """
+    container = MagicMock()
+    container.pull.side_effect = [
+        io.StringIO(content) if content else PathError("not-found", "missing")
+        for content in (cpu_max, memory_max)
+    ]
+
+    assert read_limits(container) == expected
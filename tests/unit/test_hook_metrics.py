@@ -0,0 +1,80 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Hook metrics unit tests."""
+
+# pylint: disable=protected-access
+
+from unittest.mock import MagicMock, patch
+
+import ops
+from opentelemetry import trace
+from unit.charm_harness import CharmTestCase
+
+import hook_metrics
+
+
+def test_span_counter():
+    """
+    arrange: the counter of the spans of ops, set as the global tracer provider.
+    act: start the spans of Pebble requests, hook tools and event handlers, and of another
+        library, take the counts, then start another one.
+    assert: the Pebble requests and the hook tool invocations of ops are counted until the
+        counts are taken.
+    """
+    counter = hook_metrics._span_counter()
+    assert counter is not None
+    counter.take()
+    tracer = trace.get_tracer("ops")
+
+    with tracer.start_as_current_span("pebble get_plan"):
+        tracer.start_span("relation-set").end()
+    tracer.start_span("relation-set").end()
+    tracer.start_span("is-leader").end()
+    tracer.start_span("config_changed: GithubActionsExporterCharm").end()
+    tracer.start_span("ops.main").end()
+    trace.get_tracer("other").start_span("relation-set").end()
+
+    assert counter.take() == (1, {"relation-set": 2, "is-leader": 1})
+    tracer.start_span("pebble push").end()
+    assert counter.take() == (1, {})
+
+
+class TestCharmHookMetrics(CharmTestCase):
+    """Hook metrics of the charm unit tests."""
+
+    @patch.object(ops.Container, "exec")
+    def test_hook_metrics_published(self, mock_container_exec):
+        """
+        arrange: charm created
+        act: trigger a configuration change before pebble is ready, then pebble ready, then
+            publish the metrics again unchanged
+        assert: the hook metrics are recorded and published to the workload container, only
+            when they changed
+        """
+        mock_container_exec.return_value = MagicMock(
+            wait_output=MagicMock(return_value=("", None))
+        )
+        self.harness.update_config({"github_webhook_token": "foo"})
+        self.harness.container_pebble_ready("github-actions-exporter")
+
+        samples = self.harness.charm.hook_metrics.samples
+        self.assertEqual(
+            [sample["hook"] for sample in samples],
+            ["config_changed", "github_actions_exporter_pebble_ready"],
+        )
+        self.assertEqual(samples[0]["deferred"], 0)
+        self.assertIn("replan", samples[1]["work"])
+        container = self.harness.model.unit.get_container("github-actions-exporter")
+        metrics = container.pull("/srv/gh_exporter/charm-metrics/metrics.txt").read()
+        self.assertIn('charm_hook_runs_total{hook="config_changed"} 1', metrics)
+        self.assertIn('charm_hook_deferred_total{hook="config_changed"} 0', metrics)
+        self.assertIn(
+            'charm_hook_runs_total{hook="github_actions_exporter_pebble_ready"} 1', metrics
+        )
+        plan = self.harness.get_container_pebble_plan("github-actions-exporter").to_dict()
+        self.assertIn("charm-metrics", plan["services"])
+
+        with patch.object(ops.Container, "push") as mock_push:
+            self.harness.charm.hook_metrics._publish()
+        mock_push.assert_not_called()
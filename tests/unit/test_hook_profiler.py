@@ -0,0 +1,109 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Hook profiling unit tests."""
+
+import json
+from unittest.mock import patch
+
+import ops
+import pytest
+from ops.testing import ActionFailed, Harness
+
+import hook_profiler
+from charm import GithubActionsExporterCharm
+
+
+@pytest.fixture(name="profiles_dir")
+def profiles_dir_fixture(tmp_path, monkeypatch):
+    """Keep the profiles in a temporary directory."""
+    monkeypatch.setattr(hook_profiler, "_profiles_dir", lambda charm_dir=None: tmp_path)
+    return tmp_path
+
+
+def _hook():
+    """Do some work to profile."""
+    return json.loads(json.dumps(list(range(1000))))
+
+
+def test_main_not_profiling(profiles_dir):
+    """
+    arrange: no hook to profile.
+    act: dispatch a hook.
+    assert: the charm is run without hook_profiler.
+    """
+    with patch.object(ops, "main") as mock_main:
+        hook_profiler.main(GithubActionsExporterCharm)
+
+    mock_main.assert_called_once_with(GithubActionsExporterCharm)
+    assert not list(profiles_dir.iterdir())
+
+
+def test_main_profiling(profiles_dir, monkeypatch):
+    """
+    arrange: two hooks to profile.
+    act: dispatch three hooks.
+    assert: the first two hooks are profiled, then profiling stops.
+    """
+    monkeypatch.setenv("JUJU_DISPATCH_PATH", "hooks/config-changed")
+    (profiles_dir / hook_profiler.REMAINING_FILENAME).write_text("2", encoding="ascii")
+
+    with patch.object(ops, "main", side_effect=lambda _: _hook()) as mock_main:
+        hook_profiler.main(GithubActionsExporterCharm)
+        assert (profiles_dir / hook_profiler.REMAINING_FILENAME).read_text(encoding="ascii") == "1"
+        hook_profiler.main(GithubActionsExporterCharm)
+        hook_profiler.main(GithubActionsExporterCharm)
+
+    assert mock_main.call_count == 3
+    assert not (profiles_dir / hook_profiler.REMAINING_FILENAME).exists()
+    profiles = list(profiles_dir.glob("*-config-changed.pstats"))
+    assert len(profiles) == 2
+    assert "_hook" in hook_profiler.summary(profiles, top=10)
+
+
+@pytest.mark.parametrize("count", [0, 3])
+def test_main_profile_hooks_action(profiles_dir, monkeypatch, count):
+    """
+    arrange: five hooks to profile.
+    act: dispatch the profile-hooks action setting the count of hooks to profile.
+    assert: the count set by the action is kept.
+    """
+    monkeypatch.setenv("JUJU_DISPATCH_PATH", hook_profiler.PROFILE_ACTION_DISPATCH_PATH)
+    # pylint: disable=protected-access
+    hook_profiler._set_remaining(profiles_dir, 5)
+
+    with patch.object(
+        ops, "main", side_effect=lambda _: hook_profiler._set_remaining(profiles_dir, count)
+    ):
+        hook_profiler.main(GithubActionsExporterCharm)
+
+    assert hook_profiler._remaining(profiles_dir) == count
+    # pylint: enable=protected-access
+
+
+def test_profile_actions(profiles_dir, monkeypatch):
+    """
+    arrange: charm created.
+    act: enable the profiling of the next hooks, then summarize the profiles.
+    assert: the next hooks are profiled and the summary lists the slowest functions.
+    """
+    harness = Harness(GithubActionsExporterCharm)
+    harness.begin()
+
+    with pytest.raises(ActionFailed):
+        harness.run_action("profile-summary")
+
+    output = harness.run_action("profile-hooks", {"count": 1})
+
+    assert output.results == {"remaining": 1}
+    monkeypatch.setenv("JUJU_DISPATCH_PATH", "hooks/update-status")
+    with patch.object(ops, "main", side_effect=lambda _: _hook()):
+        hook_profiler.main(GithubActionsExporterCharm)
+
+    output = harness.run_action("profile-summary", {"top": 5, "hook": "update-status"})
+
+    assert output.results["profiles"] == 1
+    assert output.results["remaining"] == 0
+    assert "cumulative" in output.results["summary"]
+    assert list(profiles_dir.iterdir())
+    harness.cleanup()
@@ -0,0 +1,77 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Import time budget of the charm dispatch path."""
+
+import os
+import re
+import statistics
+import subprocess  # nosec B404
+import sys
+
+import pytest
+
+# Cumulative import time of the charm module allowed on a cold interpreter, in milliseconds.
+IMPORT_TIME_BUDGET_MS = int(os.environ.get("CHARM_IMPORT_TIME_BUDGET_MS", "500"))
+# Modules that must not be loaded when the charm module is imported.
+DEFERRED_MODULES = ("jsonschema", "charms.traefik_k8s.v1.ingress")
+RUNS = 3
+
+
+def _import_charm() -> str:
+    """Import the charm module in a fresh interpreter with import time profiling.
+
+    Returns:
+        The import time report written by the interpreter.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), PYTHONDONTWRITEBYTECODE="")
+    result = subprocess.run(  # nosec B603
+        [sys.executable, "-X", "importtime", "-c", "import charm"],
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return result.stderr
+
+
+def _imported_modules(report: str) -> dict:
+    """Parse an import time report.
+
+    Args:
+        report: The report written by `python -X importtime`.
+
+    Returns:
+        A mapping of the module names to their cumulative import time in microseconds.
+    """
+    modules = {}
+    for match in re.finditer(r"^import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$", report, re.M):
+        modules[match.group(2)] = int(match.group(1))
+    return modules
+
+
+@pytest.mark.benchmark
+def test_charm_import_time_budget():
+    """
+    arrange: the charm source and its libraries.
+    act: import the charm module in fresh interpreters.
+    assert: the median cumulative import time is within the budget.
+    """
+    timings = [_imported_modules(_import_charm())["charm"] for _ in range(RUNS)]
+
+    assert statistics.median(timings) / 1000 <= IMPORT_TIME_BUDGET_MS
+
+
+def test_charm_import_defers_modules():
+    """
+    arrange: the charm source and its libraries.
+    act: import the charm module in a fresh interpreter.
+    assert: the deferred modules are not loaded.
+    """
+    modules = _imported_modules(_import_charm())
+
+    assert not [
+        module
+        for module in modules
+        if any(module == name or module.startswith(f"{name}.") for name in DEFERRED_MODULES)
+    ]
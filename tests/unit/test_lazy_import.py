@@ -0,0 +1,48 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Lazy import unit tests."""
+
+import sys
+import types
+from unittest.mock import patch
+
+from lazy_import import lazy_import
+
+
+def test_lazy_import_loads_on_attribute_access():
+    """
+    arrange: a module of a package that is not imported yet.
+    act: register it lazily, import it from its package and access one of its attributes.
+    assert: the module is only loaded on attribute access.
+    """
+    with patch.dict(sys.modules):
+        sys.modules.pop("json.tool", None)
+
+        module = lazy_import("json.tool")
+        from json import tool  # pylint: disable=import-outside-toplevel
+
+        assert tool is module
+        assert type(module) is not types.ModuleType  # pylint: disable=unidiomatic-typecheck
+        assert callable(module.main)
+        assert type(module) is types.ModuleType  # pylint: disable=unidiomatic-typecheck
+        assert sys.modules["json.tool"] is module
+
+
+def test_lazy_import_already_imported():
+    """
+    arrange: a module that is already imported.
+    act: register it lazily.
+    assert: the imported module is returned.
+    """
+    assert lazy_import("sys") is sys
+
+
+def test_lazy_import_missing_module():
+    """
+    arrange: a module that does not exist.
+    act: register it lazily.
+    assert: nothing is registered.
+    """
+    assert lazy_import("not_an_existing_module") is None
+    assert "not_an_existing_module" not in sys.modules
@@ -0,0 +1,73 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Metrics endpoint provider unit tests."""
+
+# pylint: disable=protected-access
+
+from unittest.mock import patch
+
+import ops
+from unit.charm_harness import FastPathTestCase
+
+
+class TestMetricsEndpoint(FastPathTestCase):
+    """Metrics endpoint provider unit tests."""
+
+    def test_scrape_job_spec_batched(self):
+        """
+        arrange: leader unit related to two Prometheus applications
+        act: publish the scrape jobs twice
+        assert: each databag is written with a single relation-set, and only if it changed
+        """
+        self.harness.set_leader(True)
+        self.harness.set_can_connect("github-actions-exporter", True)
+        self.harness.disable_hooks()
+        for prometheus in ("prometheus-a", "prometheus-b"):
+            relation_id = self.harness.add_relation("metrics-endpoint", prometheus)
+            self.harness.add_relation_unit(relation_id, f"{prometheus}/0")
+        self.harness.enable_hooks()
+
+        with patch.object(
+            ops.model.RelationDataContent,
+            "_commit",
+            autospec=True,
+            side_effect=ops.model.RelationDataContent._commit,
+        ) as mock_commit:
+            self.harness.charm._metrics_endpoint.set_scrape_job_spec()
+
+            self.assertEqual(mock_commit.call_count, 4)
+            written = [set(call.args[1]) for call in mock_commit.call_args_list]
+            self.assertIn({"scrape_metadata", "scrape_jobs", "alert_rules"}, written)
+            self.assertIn(
+                {"prometheus_scrape_unit_address", "prometheus_scrape_unit_name"}, written
+            )
+
+            mock_commit.reset_mock()
+            self.harness.charm._metrics_endpoint.set_scrape_job_spec()
+
+            mock_commit.assert_not_called()
+
+    def test_unit_address_withdrawn(self):
+        """
+        arrange: unit related to Prometheus, with its address published
+        act: publish the scrape job spec of a unit not ready
+        assert: the address of the unit is removed from the unit databag
+        """
+        self.harness.set_can_connect("github-actions-exporter", True)
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus-k8s")
+        self.harness.add_relation_unit(relation_id, "prometheus-k8s/0")
+        endpoint = self.harness.charm._metrics_endpoint
+        endpoint.set_scrape_job_spec(ready=True)
+        unit_name = self.harness.charm.unit.name
+        self.assertIn(
+            "prometheus_scrape_unit_address",
+            self.harness.get_relation_data(relation_id, unit_name),
+        )
+
+        endpoint.set_scrape_job_spec(ready=False)
+
+        self.assertNotIn(
+            "prometheus_scrape_unit_address",
+            self.harness.get_relation_data(relation_id, unit_name),
+        )
@@ -0,0 +1,314 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Kubernetes resources unit tests."""
+
+# pylint: disable=protected-access
+
+import io
+from unittest.mock import MagicMock, patch
+
+import ops
+import pytest
+from lightkube import ApiError
+from lightkube.models.apps_v1 import StatefulSetSpec
+from lightkube.models.core_v1 import Container, PodSpec, PodTemplateSpec, ResourceRequirements
+from lightkube.models.meta_v1 import LabelSelector, Status
+from lightkube.resources.apps_v1 import StatefulSet
+from ops.pebble import PathError
+from unit.charm_harness import TEST_MODEL_NAME, CharmTestCase
+
+import github_actions_exporter as gh_exporter
+import resources
+from cgroup import CgroupUsage, read_usage
+
+
+def _statefulset(workload: ResourceRequirements) -> StatefulSet:
+    """Return a StatefulSet with the charm and the workload containers.
+
+    Args:
+        workload: The resource requirements of the workload container.
+
+    Returns:
+        The StatefulSet.
+    """
+    return StatefulSet(
+        spec=StatefulSetSpec(
+            selector=LabelSelector(),
+            serviceName="github-actions-exporter",
+            template=PodTemplateSpec(
+                spec=PodSpec(
+                    containers=[
+                        Container(name="charm"),
+                        Container(name="github-actions-exporter", resources=workload),
+                    ]
+                )
+            ),
+        )
+    )
+
+
+@patch("lightkube.Client")
+def test_patch_statefulset(mock_client_class):
+    """
+    arrange: StatefulSet without workload container resources.
+    act: set the workload container requests.
+    assert: the workload container requirements are replaced.
+    """
+    client = mock_client_class.return_value
+    client.get.return_value = _statefulset(ResourceRequirements())
+    requirements = {"requests": {"cpu": "500m"}, "limits": {}}
+
+    assert resources.patch_statefulset(
+        "github-actions-exporter", "model", {"github-actions-exporter": requirements}
+    )
+
+    client.get.assert_called_once_with(
+        StatefulSet, name="github-actions-exporter", namespace="model"
+    )
+    patch_body = client.patch.call_args.args[2]
+    assert patch_body["spec"]["template"]["spec"]["containers"] == [
+        {
+            "name": "github-actions-exporter",
+            "resources": {"$patch": "replace", "requests": {"cpu": "500m"}, "limits": {}},
+        }
+    ]
+
+
+@patch("lightkube.Client")
+def test_patch_statefulset_unchanged(mock_client_class):
+    """
+    arrange: StatefulSet with the workload container requests in another notation.
+    act: set the same workload container requests.
+    assert: the StatefulSet is not patched.
+    """
+    client = mock_client_class.return_value
+    client.get.return_value = _statefulset(ResourceRequirements(requests={"cpu": "0.5"}))
+    requirements = {"requests": {"cpu": "500m"}, "limits": {}}
+
+    assert not resources.patch_statefulset(
+        "github-actions-exporter", "model", {"github-actions-exporter": requirements}
+    )
+
+    client.patch.assert_not_called()
+
+
+@patch("lightkube.Client")
+def test_patch_statefulset_forbidden(mock_client_class):
+    """
+    arrange: Kubernetes API denying the access to the StatefulSet.
+    act: set the workload container requests.
+    assert: the error is reported with the message of the API.
+    """
+    mock_client_class.return_value.get.side_effect = ApiError(
+        status=Status(code=403, message="forbidden", reason="Forbidden")
+    )
+
+    with pytest.raises(resources.ResourcePatchError) as exc_info:
+        resources.patch_statefulset("github-actions-exporter", "model", {})
+
+    assert exc_info.value.msg == "failed to patch resources: forbidden"
+
+
+def test_sample_and_recommend():
+    """
+    arrange: usage peaks of a previous sample.
+    act: sample the usage 10 seconds later, then after a container restart.
+    assert: the peaks are updated and the recommended requests include the headroom.
+    """
+    previous = {"cpu_usec": 1_000_000, "time": 990.0, "cpu_peak": 0.1, "memory_peak": 2**20}
+
+    with patch("time.time", return_value=1000.0):
+        peaks = resources.sample(CgroupUsage(6_000_000, 2**20, 100 * 2**20), previous)
+
+    assert peaks == {
+        "cpu_usec": 6_000_000,
+        "time": 1000.0,
+        "cpu_peak": 0.5,
+        "memory_peak": 100 * 2**20,
+    }
+    assert resources.recommend(peaks) == {"cpu": "600m", "memory": "120Mi"}
+
+    with patch("time.time", return_value=1010.0):
+        peaks = resources.sample(CgroupUsage(1000, 2**20, None), peaks)
+
+    assert peaks["cpu_peak"] == 0.5
+    assert peaks["cpu_usec"] == 1000
+    assert peaks["memory_peak"] == 100 * 2**20
+
+
+def test_sample_throttled():
+    """
+    arrange: usage peaks of a previous sample of a container limited to 2 cores.
+    act: sample the usage of an interval averaging 0.5 core, without and with throttling.
+    assert: the CPU peak is the average without throttling, and the quota with throttling.
+    """
+    previous = {"cpu_usec": 1_000_000, "time": 990.0, "cpu_throttled": 3}
+
+    with patch("time.time", return_value=1000.0):
+        peaks = resources.sample(CgroupUsage(6_000_000, None, None, 3), previous, 2.0)
+        throttled = resources.sample(CgroupUsage(6_000_000, None, None, 5), previous, 2.0)
+
+    assert peaks["cpu_peak"] == 0.5
+    assert throttled["cpu_peak"] == 2.0
+    assert throttled["cpu_throttled"] == 5
+
+
+@pytest.mark.parametrize(
+    "files, expected",
+    [
+        pytest.param(
+            {
+                "cpu.stat": "usage_usec 1234\nuser_usec 1000\nnr_throttled 7\n",
+                "memory.current": "2048\n",
+                "memory.peak": "4096\n",
+            },
+            CgroupUsage(cpu_usec=1234, memory=2048, memory_peak=4096, cpu_throttled=7),
+            id="cgroup v2",
+        ),
+        pytest.param({}, CgroupUsage(cpu_usec=None, memory=None, memory_peak=None), id="missing"),
+    ],
+)
+def test_read_usage(files, expected):
+    """
+    arrange: container with the given cgroup interface files.
+    act: read the usage.
+    assert: the usage is parsed from the files that can be read.
+    """
+    container = MagicMock()
+
+    def pull(path):
+        name = path.rsplit("/", 1)[-1]
+        if name not in files:
+            raise PathError("not-found", f"stat {path}: no such file or directory")
+        return io.StringIO(files[name])
+
+    container.pull.side_effect = pull
+
+    assert read_usage(container) == expected
+
+
+class TestCharmResources(CharmTestCase):
+    """Container resources of the charm unit tests."""
+
+    @patch.object(resources, "patch_statefulset")
+    def test_resources_patched_by_leader(self, mock_patch_statefulset):
+        """
+        arrange: leader unit
+        act: configure the workload requests and the charm limits
+        assert: the StatefulSet is patched with the requirements of both containers
+        """
+        mock_patch_statefulset.return_value = True
+        self.harness.set_leader(True)
+        self.harness.update_config(
+            {"workload_requests": "cpu=500m,memory=256Mi", "charm_limits": "memory=1Gi"}
+        )
+        self.harness.charm.__dict__.pop("_charm_state", None)
+
+        self.harness.charm.reconcile()
+
+        mock_patch_statefulset.assert_called_once_with(
+            "github-actions-exporter",
+            TEST_MODEL_NAME,
+            {
+                "github-actions-exporter": {
+                    "requests": {"cpu": "500m", "memory": "256Mi"},
+                    "limits": {},
+                },
+                "charm": {"requests": {}, "limits": {"memory": "1Gi"}},
+            },
+        )
+
+    @patch.object(resources, "patch_statefulset")
+    def test_resources_not_patched(self, mock_patch_statefulset):
+        """
+        arrange: leader unit without resources configured, and a unit not leader
+        act: reconcile the workload
+        assert: the StatefulSet is left untouched
+        """
+        self.harness.set_leader(True)
+        self.harness.charm.reconcile()
+        self.harness.set_leader(False)
+        self.harness.update_config({"workload_requests": "cpu=1"})
+        self.harness.charm.__dict__.pop("_charm_state", None)
+        self.harness.charm.reconcile()
+
+        mock_patch_statefulset.assert_not_called()
+
+    @patch.object(resources, "patch_statefulset")
+    def test_resources_patch_failure(self, mock_patch_statefulset):
+        """
+        arrange: leader unit of an application that is not trusted
+        act: configure the workload requests
+        assert: the unit reaches blocked status
+        """
+        mock_patch_statefulset.side_effect = resources.ResourcePatchError(
+            "failed to patch resources: forbidden"
+        )
+        self.harness.set_leader(True)
+        self.harness.update_config({"workload_requests": "cpu=500m"})
+        self.harness.charm.__dict__.pop("_charm_state", None)
+
+        self.harness.charm.reconcile()
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ops.BlockedStatus("failed to patch resources: forbidden"),
+        )
+
+    def test_invalid_resources(self):
+        """
+        arrange: charm created
+        act: configure malformed workload limits
+        assert: the unit reaches blocked status
+        """
+        self.harness.update_config({"workload_limits": "disk=1Gi"})
+        self.harness.charm.__dict__.pop("_charm_state", None)
+
+        self.harness.charm.reconcile()
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ops.BlockedStatus("invalid configuration: workload_limits"),
+        )
+
+    @patch.object(gh_exporter, "probe", return_value=gh_exporter.Probe(0.25, 4096))
+    def test_update_status_samples_usage(self, mock_probe):
+        """
+        arrange: workload container having used at most 100MiB of memory
+        act: trigger update-status twice, the exporter metrics getting slower in between
+        assert: the memory peak, the recommended memory request and the response time of the
+            exporter metrics are published as charm metrics, with the time of the probe, and
+            the probe is not recorded again before it is due
+        """
+        self.harness.set_can_connect("github-actions-exporter", True)
+        container = self.harness.model.unit.get_container("github-actions-exporter")
+        container.push("/sys/fs/cgroup/memory.current", f"{50 * 2**20}\n", make_dirs=True)
+        container.push("/sys/fs/cgroup/memory.peak", f"{100 * 2**20}\n")
+        self.harness.handle_exec("github-actions-exporter", [], result="")
+
+        self.harness.charm.on.update_status.emit()
+
+        metrics = container.pull("/srv/gh_exporter/charm-metrics/metrics.txt").read()
+        self.assertIn(f"charm_workload_memory_peak_bytes {100 * 2**20}", metrics)
+        self.assertIn("charm_workload_memory_recommended_bytes 125829120.0", metrics)
+        self.assertNotIn("charm_workload_cpu_peak_cores", metrics)
+        self.assertIn("charm_exporter_metrics_latency_seconds 0.25", metrics)
+        self.assertIn("charm_exporter_metrics_size_bytes 4096", metrics)
+        self.assertIn("charm_exporter_metrics_probe_timestamp_seconds", metrics)
+
+        # The unit now ready is reconciled, and its exporter probed again on the next hook.
+        self.harness.charm.__dict__.pop("_metrics_probe", None)
+        self.harness.charm.on.update_status.emit()
+        probes = mock_probe.call_count
+        metrics = container.pull("/srv/gh_exporter/charm-metrics/metrics.txt").read()
+        probe_lines = [line for line in metrics.splitlines() if "exporter_metrics" in line]
+        mock_probe.return_value = gh_exporter.Probe(2.5, 4096)
+        self.harness.charm.__dict__.pop("_metrics_probe", None)
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(mock_probe.call_count, probes)
+        metrics = container.pull("/srv/gh_exporter/charm-metrics/metrics.txt").read()
+        self.assertEqual(
+            [line for line in metrics.splitlines() if "exporter_metrics" in line], probe_lines
+        )
@@ -0,0 +1,147 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Series budget filter unit tests."""
+
+import http.client
+import http.server
+import json
+import threading
+import typing
+
+import cardinality
+import series_filter
+
+EXPOSITION = """\
+# HELP workflow_status_total Status of the workflows.
+# TYPE workflow_status_total counter
+workflow_status_total{repo="r00",status="ok"} 1
+workflow_status_total{repo="r01",status="ok"} 1
+workflow_status_total{repo="a\\"b",status="ok"} 1
+workflow_status_total{status="ok"} 1
+# HELP go_goroutines Number of goroutines.
+# TYPE go_goroutines gauge
+go_goroutines 12
+# TYPE go_gc_duration_seconds summary
+go_gc_duration_seconds_sum 0.5
+go_gc_duration_seconds_count 3
+"""
+PLAN = [
+    {"family": "workflow_status", "label": "repo", "keep": ["r00", 'a\\"b']},
+    {"family": "go_goroutines", "label": "", "keep": []},
+    {"family": "go_gc_duration_seconds", "label": "", "keep": []},
+]
+
+
+def filtered(plan: series_filter.Plan) -> typing.List[str]:
+    """Return the lines of the exposition kept by a plan.
+
+    Args:
+        plan: The plan.
+
+    Returns:
+        The lines kept.
+    """
+    return [line for line in EXPOSITION.splitlines(keepends=True) if plan.keep(line)]
+
+
+def test_plan_keep(tmp_path):
+    """
+    arrange: a plan file dropping two families and the tail of the repo label of another one.
+    act: filter an exposition.
+    assert: the samples and comments of the families dropped are dropped, and the series of
+        the other family are kept for the values kept, escaped, and without the label.
+    """
+    path = tmp_path / "plan.json"
+    path.write_text(json.dumps(PLAN), encoding="utf-8")
+    plan = series_filter.Plan(str(path))
+
+    plan.reload()
+
+    assert filtered(plan) == [
+        "# HELP workflow_status_total Status of the workflows.\n",
+        "# TYPE workflow_status_total counter\n",
+        'workflow_status_total{repo="r00",status="ok"} 1\n',
+        'workflow_status_total{repo="a\\"b",status="ok"} 1\n',
+        'workflow_status_total{status="ok"} 1\n',
+    ]
+
+
+def test_plan_reload(tmp_path):
+    """
+    arrange: a plan without a plan file.
+    act: write the plan file, then remove it, reloading the plan each time.
+    assert: every line is kept without the file, the plan applies once written.
+    """
+    path = tmp_path / "plan.json"
+    plan = series_filter.Plan(str(path))
+    plan.reload()
+    assert filtered(plan) == EXPOSITION.splitlines(keepends=True)
+
+    path.write_text(json.dumps(PLAN), encoding="utf-8")
+    plan.reload()
+    assert len(filtered(plan)) == 5
+
+    path.unlink()
+    plan.reload()
+    assert filtered(plan) == EXPOSITION.splitlines(keepends=True)
+
+
+def test_sample_suffixes():
+    """
+    arrange: the filter, shipped on its own to the workload container.
+    act: compare its sample suffixes with the ones of the cardinality measurement.
+    assert: the families are matched the same way by both.
+    """
+    assert series_filter.SAMPLE_SUFFIXES == cardinality.SAMPLE_SUFFIXES
+
+
+class _ExporterHandler(http.server.BaseHTTPRequestHandler):
+    """Exporter stub serving the exposition."""
+
+    def do_GET(self) -> None:  # noqa: N802 pylint: disable=invalid-name
+        """Serve the exposition."""
+        body = EXPOSITION.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve(server: http.server.HTTPServer) -> None:
+    """Serve requests in a background thread until the server is shut down.
+
+    Args:
+        server: The server.
+    """
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def test_filter_server(tmp_path):
+    """
+    arrange: an exporter stub and the filter in front of it, with a plan file.
+    act: scrape the filter.
+    assert: the exposition of the exporter is served without the series dropped.
+    """
+    path = tmp_path / "plan.json"
+    path.write_text(json.dumps(PLAN), encoding="utf-8")
+    with http.server.HTTPServer(("127.0.0.1", 0), _ExporterHandler) as exporter:
+        _serve(exporter)
+        plan = series_filter.Plan(str(path))
+        with series_filter.FilterServer(0, exporter.server_address[1], plan) as server:
+            _serve(server)
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+            try:
+                connection.request("GET", "/metrics")
+                response = connection.getresponse()
+                body = response.read().decode()
+            finally:
+                connection.close()
+            server.shutdown()
+        exporter.shutdown()
+
+    assert response.status == 200
+    assert response.getheader("content-type") == "text/plain; version=0.0.4"
+    assert body.splitlines(keepends=True) == filtered(plan)
+    assert "go_goroutines" not in body
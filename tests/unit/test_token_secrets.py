@@ -0,0 +1,134 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Token secrets unit tests."""
+
+# pylint: disable=protected-access
+
+from unittest.mock import patch
+
+import ops
+import pytest
+from ops.testing import Harness
+from unit.charm_harness import CharmTestCase
+
+import token_secrets
+from charm import GithubActionsExporterCharm
+from exceptions import CharmConfigInvalidError
+
+
+@pytest.mark.parametrize(
+    "uri", ["secret:cs1a2b3c", "secret://8f6e2a5c-2bd6-4c6d-9b4e-1e7d3a9c5f00/cs1a2b3c"]
+)
+def test_unique_id(uri):
+    """
+    arrange: a secret URI with or without the model UUID.
+    act: get the unique identifier of the secret.
+    assert: the identifier is the same.
+    """
+    assert token_secrets._unique_id(uri) == "cs1a2b3c"
+
+
+def test_token_without_key():
+    """
+    arrange: a secret granted to the application without a token key.
+    act: resolve the tokens of the configuration.
+    assert: the secret option is reported as invalid.
+    """
+    harness = Harness(GithubActionsExporterCharm)
+    harness.begin()
+    secret_id = harness.add_user_secret({"password": "first"})
+    harness.grant_secret(secret_id, harness.charm.app.name)
+
+    with pytest.raises(CharmConfigInvalidError) as exc_info:
+        harness.charm.token_secrets.resolve({"github_api_token_secret": secret_id})
+
+    assert exc_info.value.msg == "secret has no token key: github_api_token_secret"
+    harness.cleanup()
+
+
+class TestCharmTokenSecrets(CharmTestCase):
+    """Token secrets of the charm unit tests."""
+
+    def test_webhook_token_secret(self):
+        """
+        arrange: webhook token stored in a user secret granted to the application
+        act: configure the secret, then rotate the token
+        assert: the exporter uses the token of the secret, reading the secret once per hook,
+            and is restarted with the rotated token when the secret changes
+        """
+        app_name = "github-actions-exporter"
+        self.harness.set_can_connect(app_name, True)
+        self.harness.handle_exec(app_name, [], result="")
+        secret_id = self.harness.add_user_secret({"token": "first"})
+        self.harness.grant_secret(secret_id, app_name)
+
+        with patch.object(
+            ops.Model, "get_secret", autospec=True, side_effect=ops.Model.get_secret
+        ) as get_secret:
+            self.harness.update_config({"github_webhook_token_secret": secret_id})
+
+        plan = self.harness.get_container_pebble_plan(app_name).to_dict()
+        environment = plan["services"]["github-actions-exporter"]["environment"]
+        self.assertEqual(environment["GITHUB_WEBHOOK_TOKEN"], "first")
+        get_secret.assert_called_once()
+
+        self.harness.charm.__dict__.pop("_charm_state", None)
+        self.harness.charm.__dict__.pop("_pebble_layer", None)
+
+        self.harness.set_secret_content(secret_id, {"token": "second"})
+
+        plan = self.harness.get_container_pebble_plan(app_name).to_dict()
+        environment = plan["services"]["github-actions-exporter"]["environment"]
+        self.assertEqual(environment["GITHUB_WEBHOOK_TOKEN"], "second")
+
+    def test_webhook_token_secret_not_granted(self):
+        """
+        arrange: webhook token stored in a user secret not granted to the application
+        act: configure the secret
+        assert: the unit is blocked on the secret option
+        """
+        secret_id = self.harness.add_user_secret({"token": "first"})
+
+        self.harness.update_config({"github_webhook_token_secret": secret_id})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ops.BlockedStatus("secret not granted: github_webhook_token_secret"),
+        )
+
+    def test_organization_token_secret(self):
+        """
+        arrange: API token of an additional organization stored in a user secret granted to
+            the application, and one not granted
+        act: configure the organizations with the secrets
+        assert: the exporter of the organization uses the token of the secret, and the unit is
+            blocked on the organizations once one of the secrets is not granted
+        """
+        app_name = "github-actions-exporter"
+        self.harness.set_can_connect(app_name, True)
+        self.harness.handle_exec(app_name, [], result="")
+        secret_id = self.harness.add_user_secret({"token": "token-a"})
+        self.harness.grant_secret(secret_id, app_name)
+        denied_id = self.harness.add_user_secret({"token": "token-c"})
+
+        self.harness.update_config({"github_orgs": f"org-a={secret_id},org-b=token-b"})
+
+        plan = self.harness.get_container_pebble_plan(app_name).to_dict()
+        services = plan["services"]
+        self.assertEqual(
+            services["github-actions-exporter-org-a"]["environment"]["GITHUB_API_TOKEN"],
+            "token-a",
+        )
+        self.assertEqual(
+            services["github-actions-exporter-org-b"]["environment"]["GITHUB_API_TOKEN"],
+            "token-b",
+        )
+
+        self.harness.charm.__dict__.pop("_charm_state", None)
+        self.harness.update_config({"github_orgs": f"org-a={secret_id},org-c={denied_id}"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ops.BlockedStatus("secret not granted: github_orgs"),
+        )
@@ -0,0 +1,474 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Webhook gateway unit tests."""
+
+import asyncio
+import contextlib
+import hmac
+import os
+import socket
+import subprocess  # nosec B404
+import sys
+import time
+import typing
+from unittest.mock import patch
+
+import pytest
+
+import gateway_admission
+import gateway_http
+import gateway_spool
+import webhook_gateway
+
+SEGMENT_SIZE = 4096
+
+
+async def request(
+    port: int, method: str, path: str, body: bytes = b"", headers: str = ""
+) -> typing.Tuple[int, bytes]:
+    """Send a request on a new connection.
+
+    Args:
+        port: The local port of the server.
+        method: The request method.
+        path: The request path.
+        body: The request body.
+        headers: Additional request headers, each followed by CRLF.
+
+    Returns:
+        The status and body of the response.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n{headers}\r\n".encode() + body
+    )
+    head = await reader.readuntil(b"\r\n\r\n")
+    (_, status, *_), response_headers = gateway_http.parse_head(head)
+    content = await reader.readexactly(int(response_headers["content-length"]))
+    writer.close()
+    return int(status), content
+
+
+async def stub_exporter(
+    statuses: typing.List[int], received: typing.List[typing.Tuple[str, str, bytes]]
+) -> asyncio.AbstractServer:
+    """Start an exporter stub answering the deliveries with the given statuses.
+
+    Args:
+        statuses: The statuses of the responses, in order.
+        received: The path, event and body of the deliveries received.
+
+    Returns:
+        The server of the stub.
+    """
+
+    async def handle(reader, writer):
+        while not reader.at_eof():
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            (_, path, _), headers = gateway_http.parse_head(head)
+            body = await reader.readexactly(int(headers["content-length"]))
+            received.append((path, headers["x-github-event"], body))
+            writer.write(f"HTTP/1.1 {statuses.pop(0)} -\r\nContent-Length: 0\r\n\r\n".encode())
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def test_spool_recovered(tmp_path):
+    """
+    arrange: a spool with three records, the first one acknowledged, then closed.
+    act: open the spool again.
+    assert: the records not acknowledged are recovered in order, and acknowledged together.
+    """
+    spool = gateway_spool.Spool(str(tmp_path), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+    for payload in (b"first", b"second", b"third"):
+        spool.append(payload[:2], payload[2:])
+    spool.ack(spool.read())
+    del spool
+
+    spool = gateway_spool.Spool(str(tmp_path), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+
+    assert (spool.depth, spool.size) == (2, len(b"secondthird"))
+    entry = spool.read()
+    assert bytes(entry[0].payload) == b"second"
+    assert bytes(spool.read(entry[1])[0].payload) == b"third"
+    spool.ack(entry, spool.read(entry[1]))
+    assert spool.read() is None
+    assert spool.oldest_age() == 0
+
+
+def test_spool_torn_record(tmp_path):
+    """
+    arrange: a spool whose last record is corrupted, as if torn by a crash.
+    act: open the spool again and append a record.
+    assert: the corrupted record is discarded and overwritten.
+    """
+    spool = gateway_spool.Spool(str(tmp_path), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+    spool.append(b"kept")
+    spool.append(b"torn")
+    del spool
+    (segment,) = tmp_path.glob(f"*{gateway_spool.SEGMENT_SUFFIX}")
+    with open(segment, "r+b") as segment_file:
+        segment_file.seek(2 * gateway_spool.RECORD_HEADER.size + len(b"kept") + 1)
+        segment_file.write(b"x")
+
+    spool = gateway_spool.Spool(str(tmp_path), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+    spool.append(b"new")
+
+    assert spool.depth == 2
+    entry = spool.read()
+    assert bytes(entry[0].payload) == b"kept"
+    spool.ack(entry)
+    assert bytes(spool.read()[0].payload) == b"new"
+
+
+def test_spool_full_and_compacted(tmp_path):
+    """
+    arrange: a spool of two segments.
+    act: append records until it is full, then acknowledge them.
+    assert: records larger than a segment and records over the size cap are refused, and the
+        segments consumed are deleted.
+    """
+    spool = gateway_spool.Spool(str(tmp_path), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+    payload = b"x" * 1000
+
+    with pytest.raises(gateway_spool.SpoolFullError):
+        spool.append(b"x" * SEGMENT_SIZE)
+    for _ in range(8):
+        spool.append(payload)
+    with pytest.raises(gateway_spool.SpoolFullError):
+        spool.append(payload)
+
+    assert spool.segments == 2
+    for _ in range(5):
+        spool.ack(spool.read())
+    assert spool.segments == 1
+    assert len(list(tmp_path.glob(f"*{gateway_spool.SEGMENT_SUFFIX}"))) == 1
+    assert spool.depth == 3
+    spool.append(payload)
+
+
+def test_gateway_replays_deliveries(tmp_path):
+    """
+    arrange: a gateway in front of an exporter failing the first delivery, then accepting it.
+    act: post a delivery to the gateway and replay the spool.
+    assert: the delivery is acknowledged once spooled, then retried until forwarded with its
+        GitHub headers, and the spool metrics are updated.
+    """
+    received: typing.List[typing.Tuple[str, str, bytes]] = []
+    body = b'{"action": "completed"}'
+
+    async def scenario():
+        exporter = await stub_exporter([503, 202], received)
+        spool = gateway_spool.Spool(str(tmp_path), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+        gateway = webhook_gateway.Gateway(spool, exporter.sockets[0].getsockname())
+        deliveries = await asyncio.start_server(gateway.serve_deliveries, "127.0.0.1", 0)
+        metrics = await asyncio.start_server(gateway.serve_metrics, "127.0.0.1", 0)
+        port = deliveries.sockets[0].getsockname()[1]
+        metrics_port = metrics.sockets[0].getsockname()[1]
+
+        status = await request(
+            port,
+            "POST",
+            "/gh_event",
+            body,
+            "X-GitHub-Event: workflow_job\r\nContent-Type: application/json\r\n",
+        )
+        assert status == (202, b"")
+        assert (await request(port, "POST", "/gh_event", b"x" * SEGMENT_SIZE))[0] == 413
+        _, content = await request(metrics_port, "GET", "/metrics")
+        assert b'webhook_gateway_spool_depth{worker="0"} 1\n' in content
+
+        with patch.object(webhook_gateway, "RETRY_BACKOFF", 0):
+            replay = asyncio.ensure_future(gateway.replay())
+            while spool.depth:
+                await asyncio.sleep(0.01)
+            replay.cancel()
+        gateway.close()
+        for server in (deliveries, metrics, exporter):
+            server.close()
+        return gateway
+
+    gateway = asyncio.run(scenario())
+
+    assert received == [("/gh_event", "workflow_job", body)] * 2
+    assert gateway.stats.counters["received"] == gateway.stats.counters["forwarded"] == 1
+    assert gateway.stats.counters["retries"] == 1
+    assert 'webhook_gateway_spool_depth{worker="0"} 0\n' in webhook_gateway.render(
+        gateway.snapshots()
+    )
+    assert os.path.exists(tmp_path / gateway_spool.CURSOR_NAME)
+
+
+def test_orphan_spools_adopted(tmp_path):
+    """
+    arrange: the spool of a single process gateway, and the spool of a third worker, each
+        with a delivery.
+    act: adopt the orphan spools of two workers.
+    assert: the deliveries are forwarded, and the orphan spools are deleted.
+    """
+    received: typing.List[typing.Tuple[str, str, bytes]] = []
+    for directory in (tmp_path, tmp_path / "2"):
+        spool = gateway_spool.Spool(str(directory), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+        spool.append(gateway_spool.encode("/gh_event", {"x-github-event": "ping"}), b"{}")
+    (tmp_path / "1").mkdir()
+
+    async def scenario():
+        exporter = await stub_exporter([202, 202], received)
+        with patch.object(webhook_gateway, "STATS_INTERVAL", 0.01):
+            await webhook_gateway.adopt(
+                str(tmp_path), 2, exporter.sockets[0].getsockname(), 2 * SEGMENT_SIZE
+            )
+        exporter.close()
+
+    asyncio.run(scenario())
+
+    assert received == [("/gh_event", "ping", b"{}")] * 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["1"]
+
+
+def test_orphan_spool_adopted_once_stopped(tmp_path):
+    """
+    arrange: the spool of a third worker with a delivery, and a fresh snapshot of its metrics.
+    act: adopt the orphan spools of two workers, then expire the snapshot.
+    assert: the spool is only replayed and deleted once the snapshot expired.
+    """
+    received: typing.List[typing.Tuple[str, str, bytes]] = []
+    spools, stats = tmp_path / "spool", tmp_path / "stats"
+    spool = gateway_spool.Spool(str(spools / "2"), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+    spool.append(gateway_spool.encode("/gh_event", {"x-github-event": "ping"}), b"{}")
+    stats.mkdir()
+    (stats / f"2{webhook_gateway.STATS_SUFFIX}").write_text("{}", encoding="utf-8")
+
+    async def scenario():
+        exporter = await stub_exporter([202], received)
+        with patch.object(webhook_gateway, "STATS_INTERVAL", 0.01):
+            adopt = asyncio.ensure_future(
+                webhook_gateway.adopt(
+                    str(spools), 2, exporter.sockets[0].getsockname(), 2 * SEGMENT_SIZE, str(stats)
+                )
+            )
+            await asyncio.sleep(0.1)
+            assert not received and (spools / "2").exists()
+            expired = time.time() - 2 * webhook_gateway.STATS_EXPIRY
+            os.utime(stats / f"2{webhook_gateway.STATS_SUFFIX}", (expired, expired))
+            await adopt
+        exporter.close()
+
+    asyncio.run(scenario())
+
+    assert received == [("/gh_event", "ping", b"{}")]
+    assert not (spools / "2").exists()
+
+
+def _free_port() -> int:
+    """Return a local port free at the time of the call.
+
+    Returns:
+        The port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_workers_share_ports(tmp_path):
+    """
+    arrange: two gateway worker processes sharing the webhook and metrics ports.
+    act: post deliveries on new connections, then scrape the metrics.
+    assert: the deliveries are spread between the workers, and the metrics of both workers
+        are rendered by the worker answering the scrape.
+    """
+    port, metrics_port = _free_port(), _free_port()
+    with contextlib.ExitStack() as workers:
+        for worker in range(2):
+            process = workers.enter_context(
+                subprocess.Popen(  # nosec B603
+                    [
+                        sys.executable,
+                        webhook_gateway.__file__,
+                        f"--listen=127.0.0.1:{port}",
+                        f"--metrics=127.0.0.1:{metrics_port}",
+                        f"--exporter=127.0.0.1:{_free_port()}",
+                        f"--spool={tmp_path / 'spool'}",
+                        f"--max-bytes={4 * gateway_spool.SEGMENT_SIZE}",
+                        f"--stats={tmp_path / 'stats'}",
+                        "--workers=2",
+                        f"--worker={worker}",
+                    ],
+                    stderr=subprocess.DEVNULL,
+                )
+            )
+            # Popen waits for the process on exit.
+            workers.callback(process.terminate)
+        deadline = time.monotonic() + 10
+        while len(list((tmp_path / "stats").glob("*.json"))) < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        async def scenario():
+            for _ in range(32):
+                assert (await request(port, "POST", "/gh_event", b"{}"))[0] == 202
+            await asyncio.sleep(2 * webhook_gateway.STATS_INTERVAL)
+            return await request(metrics_port, "GET", "/metrics")
+
+        _, content = asyncio.run(scenario())
+
+    samples = dict(
+        line.rsplit(" ", 1)
+        for line in content.decode().splitlines()
+        if line.startswith("webhook_gateway_deliveries_received_total")
+    )
+    counts = [
+        int(samples[f'webhook_gateway_deliveries_received_total{{worker="{worker}"}}'])
+        for worker in range(2)
+    ]
+    assert sum(counts) == 32
+    assert all(counts)
+
+
+def test_deduplicator(tmp_path):
+    """
+    arrange: two deduplicators sharing a Bloom filter, with an LRU cache of one ID.
+    act: add delivery IDs to the first one, and look them up in both, before and after the
+        window.
+    assert: the IDs are found in the LRU cache, then in the shared Bloom filter, until the
+        window has passed, and the lookups are counted.
+    """
+    path = str(tmp_path / "deliveries.bloom")
+    first = gateway_admission.Deduplicator(path, capacity=1024, window=60, lru_size=1)
+    second = gateway_admission.Deduplicator(path, capacity=1024, window=60, lru_size=1)
+
+    with patch.object(gateway_admission.time, "time", return_value=1000):
+        first.add("a")
+        first.add("b")
+        assert first.duplicate("b")
+        assert first.duplicate("a")
+        assert second.duplicate("b")
+        assert not second.duplicate("c")
+        assert 0 < first.false_positive_ratio() < 1e-5
+    with patch.object(gateway_admission.time, "time", return_value=1000 + 60):
+        assert not second.duplicate("a")
+        assert second.false_positive_ratio() == 0
+
+    assert (first.lookups, first.lru_hits, first.bloom_hits) == (2, 1, 1)
+    assert (second.lookups, second.lru_hits, second.bloom_hits) == (3, 0, 1)
+
+
+def test_gateway_verifies_signatures(tmp_path):
+    """
+    arrange: a gateway with a webhook secret.
+    act: post deliveries with valid and invalid signatures, a large one, and a duplicate.
+    assert: the deliveries with an invalid signature are refused, the large one is verified
+        too, and the duplicate is acknowledged without being spooled.
+    """
+    (tmp_path / "secret").write_text("secret\n", encoding="utf-8")
+    body = b'{"action": "queued"}'
+
+    def headers(delivery: str, content: bytes, key: bytes = b"secret") -> str:
+        """Return the GitHub headers of a delivery.
+
+        Args:
+            delivery: The delivery ID.
+            content: The body of the delivery.
+            key: The key of the signature.
+
+        Returns:
+            The headers, each followed by CRLF.
+        """
+        signature = hmac.new(key, content, "sha256").hexdigest()
+        return f"X-GitHub-Delivery: {delivery}\r\nX-Hub-Signature-256: sha256={signature}\r\n"
+
+    async def scenario():
+        spool = gateway_spool.Spool(str(tmp_path / "spool"), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+        verifier = gateway_admission.Verifier(str(tmp_path / "secret"))
+        gateway = webhook_gateway.Gateway(spool, ("127.0.0.1", 1), verifier=verifier)
+        server = await asyncio.start_server(gateway.serve_deliveries, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        large = b"x" * 2048
+
+        statuses = [
+            (await request(port, "POST", "/gh_event", body, headers("1", body)))[0],
+            (await request(port, "POST", "/gh_event", body, headers("2", body, b"bad")))[0],
+            (await request(port, "POST", "/gh_event", body))[0],
+            (await request(port, "POST", "/gh_event", body, headers("1", body)))[0],
+        ]
+        with patch.object(webhook_gateway, "VERIFY_INLINE_SIZE", 1024):
+            statuses.append(
+                (await request(port, "POST", "/gh_event", large, headers("3", large)))[0]
+            )
+        gateway.close()
+        server.close()
+        return gateway, statuses
+
+    gateway, statuses = asyncio.run(scenario())
+
+    assert statuses == [202, 401, 401, 200, 202]
+    assert gateway.spool.depth == 2
+    assert gateway.stats.counters["unauthorized"] == 2
+    assert gateway.stats.counters["duplicated"] == 1
+    assert 'webhook_gateway_dedup_lru_hits_total{worker="0"} 1\n' in webhook_gateway.render(
+        gateway.snapshots()
+    )
+
+
+def test_gateway_refuses_without_secret(tmp_path):
+    """
+    arrange: a gateway verifying the signatures, with no webhook secret written yet.
+    act: post a delivery, write the secret and reload it, then post the delivery again.
+    assert: the delivery is refused until the secret is loaded.
+    """
+    body = b'{"action": "queued"}'
+    signature = hmac.new(b"secret", body, "sha256").hexdigest()
+    headers = f"X-GitHub-Delivery: 1\r\nX-Hub-Signature-256: sha256={signature}\r\n"
+
+    async def scenario():
+        spool = gateway_spool.Spool(str(tmp_path / "spool"), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+        verifier = gateway_admission.Verifier(str(tmp_path / "secret"))
+        gateway = webhook_gateway.Gateway(spool, ("127.0.0.1", 1), verifier=verifier)
+        server = await asyncio.start_server(gateway.serve_deliveries, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        statuses = [(await request(port, "POST", "/gh_event", body, headers))[0]]
+        (tmp_path / "secret").write_text("secret\n", encoding="utf-8")
+        verifier.load()
+        statuses.append((await request(port, "POST", "/gh_event", body, headers))[0])
+        gateway.close()
+        server.close()
+        return statuses
+
+    assert asyncio.run(scenario()) == [401, 202]
+
+
+def test_gateway_flush_failure_not_deduplicated(tmp_path):
+    """
+    arrange: a gateway whose spool fails to flush once.
+    act: post a delivery, then post it again once the spool flushes.
+    assert: the first delivery is refused, and its retry is spooled rather than dropped as a
+        duplicate.
+    """
+    body = b'{"action": "queued"}'
+
+    async def scenario():
+        spool = gateway_spool.Spool(str(tmp_path / "spool"), 2 * SEGMENT_SIZE, SEGMENT_SIZE)
+        gateway = webhook_gateway.Gateway(spool, ("127.0.0.1", 1))
+        server = await asyncio.start_server(gateway.serve_deliveries, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        headers = "X-GitHub-Delivery: 1\r\n"
+
+        with patch.object(spool, "flush", side_effect=OSError("no space left")):
+            statuses = [(await request(port, "POST", "/gh_event", body, headers))[0]]
+        statuses.append((await request(port, "POST", "/gh_event", body, headers))[0])
+        gateway.close()
+        server.close()
+        return gateway, statuses
+
+    gateway, statuses = asyncio.run(scenario())
+
+    assert statuses == [503, 202]
+    assert gateway.stats.counters["refused"] == 1
+    assert gateway.stats.counters["duplicated"] == 0
@@ -0,0 +1,128 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Throughput and latency budget of the webhook gateway against a local exporter stub."""
+
+import asyncio
+import hashlib
+import hmac
+import os
+import statistics
+import time
+import typing
+
+import pytest
+
+import gateway_admission
+import gateway_http
+import gateway_spool
+import webhook_gateway
+
+# Timing dependent, run on its own with `tox -e benchmark`.
+pytestmark = pytest.mark.benchmark
+
+# Deliveries acknowledged and forwarded per second required, on the single core running the
+# gateway, the exporter stub and the clients, which take about half of it.
+MIN_RATE = int(os.environ.get("WEBHOOK_GATEWAY_MIN_RATE", "1000"))
+# 99th percentile of the time to acknowledge a delivery allowed, in milliseconds.
+MAX_P99_MS = float(os.environ.get("WEBHOOK_GATEWAY_MAX_P99_MS", "10"))
+DELIVERIES = 5000
+CLIENTS = 8
+# Size of a typical workflow_job delivery.
+BODY = b"x" * 8192
+SECRET = b"secret"
+
+
+async def _exporter(
+    connections: typing.Set[asyncio.Task],
+) -> asyncio.Server:
+    """Start an exporter stub accepting the deliveries on persistent connections.
+
+    Args:
+        connections: The tasks serving the connections to the stub.
+
+    Returns:
+        The server of the stub.
+    """
+
+    async def handle(reader, writer):
+        connections.add(asyncio.current_task())
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                _, headers = gateway_http.parse_head(head)
+                await reader.readexactly(int(headers["content-length"]))
+                writer.write(b"HTTP/1.1 202 Accepted\r\nContent-Length: 0\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def _client(port: int, client: int, count: int, latencies: typing.List[float]) -> None:
+    """Post signed deliveries on a persistent connection, one at a time, like a GitHub worker.
+
+    Args:
+        port: The webhook port of the gateway.
+        client: The index of the client, making the delivery IDs unique.
+        count: The number of deliveries.
+        latencies: The time to acknowledge each delivery, in seconds.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    signature = hmac.new(SECRET, BODY, hashlib.sha256).hexdigest().encode()
+    for delivery in range(count):
+        request = (
+            b"POST /gh_event HTTP/1.1\r\nX-GitHub-Event: workflow_job\r\n"
+            b"X-GitHub-Delivery: %d-%d\r\nX-Hub-Signature-256: sha256=%s\r\n"
+            b"Content-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+            % (client, delivery, signature, len(BODY), BODY)
+        )
+        start = time.perf_counter()
+        writer.write(request)
+        response = await reader.readuntil(b"\r\n\r\n")
+        latencies.append(time.perf_counter() - start)
+        assert response.startswith(b"HTTP/1.1 202")
+    writer.close()
+
+
+def test_gateway_throughput_budget(tmp_path):
+    """
+    arrange: a gateway verifying the signatures and spooling to the disk in front of an
+        exporter stub.
+    act: post signed deliveries from concurrent persistent connections.
+    assert: the deliveries are acknowledged and forwarded at the required rate, and the
+        99th percentile of the acknowledgement latency is within the budget.
+    """
+    latencies: typing.List[float] = []
+    connections: typing.Set[asyncio.Task] = set()
+
+    async def scenario() -> float:
+        exporter = await _exporter(connections)
+        spool = gateway_spool.Spool(str(tmp_path / "spool"), 512 * 2**20)
+        (tmp_path / "secret").write_bytes(SECRET)
+        verifier = gateway_admission.Verifier(str(tmp_path / "secret"))
+        gateway = webhook_gateway.Gateway(
+            spool, exporter.sockets[0].getsockname(), verifier=verifier
+        )
+        server = await asyncio.start_server(gateway.serve_deliveries, "127.0.0.1", 0)
+        replay = asyncio.ensure_future(gateway.replay())
+        port = server.sockets[0].getsockname()[1]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(_client(port, client, DELIVERIES // CLIENTS, latencies) for client in range(CLIENTS))
+        )
+        while gateway.stats.counters["forwarded"] < DELIVERIES:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        replay.cancel()
+        gateway.close()
+        await asyncio.wait(connections)
+        server.close()
+        exporter.close()
+        return elapsed
+
+    elapsed = asyncio.run(scenario())
+
+    p99 = statistics.quantiles(latencies, n=100)[98] * 1000
+    assert DELIVERIES / elapsed >= MIN_RATE
+    assert p99 <= MAX_P99_MS
@@ -0,0 +1,69 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Workload storage unit tests."""
+
+# pylint: disable=protected-access
+
+import os
+from unittest.mock import patch
+
+import ops
+from unit.charm_harness import CharmTestCase
+
+import github_actions_exporter as gh_exporter
+import workload_storage
+
+
+def test_usage(tmp_path):
+    """
+    arrange: a filesystem with 100 blocks of 4KiB, 30 free of which 5 are reserved.
+    act: measure its usage.
+    assert: the capacity, usage and available space are in bytes, and the space is low.
+    """
+    stat = os.statvfs_result((4096, 4096, 100, 30, 5, 0, 0, 0, 0, 255))
+    with patch.object(os, "statvfs", return_value=stat) as statvfs:
+        usage = workload_storage.usage(str(tmp_path))
+
+    statvfs.assert_called_once_with(str(tmp_path))
+    assert usage == workload_storage.StorageUsage(
+        capacity=100 * 4096, used=70 * 4096, available=5 * 4096
+    )
+    assert usage.low
+    assert not workload_storage.StorageUsage(capacity=100, used=80, available=20).low
+
+
+class TestCharmWorkloadStorage(CharmTestCase):
+    """Workload storage of the charm unit tests."""
+
+    @patch.object(gh_exporter, "probe", return_value=gh_exporter.Probe(0.25, 4096))
+    def test_storage_prepared_and_measured(self, _):
+        """
+        arrange: running workload container
+        act: attach the data storage, reconcile again, then trigger update-status
+        assert: the storage directories are created once for the workload user, and the
+            capacity and usage of the storage are published as charm metrics
+        """
+        app_name = "github-actions-exporter"
+        self.harness.set_can_connect(app_name, True)
+        self.harness.handle_exec(app_name, [], result="")
+        self.harness.update_config({"github_webhook_token": "foo"})
+        container = self.harness.model.unit.get_container(app_name)
+
+        with patch.object(
+            ops.Container, "make_dir", autospec=True, side_effect=ops.Container.make_dir
+        ) as make_dir:
+            self.harness.add_storage("data", attach=True)
+            self.harness.charm.reconcile()
+
+        files = container.list_files(workload_storage.MOUNT_PATH)
+        self.assertEqual(sorted(info.path for info in files), sorted(workload_storage.DIRECTORIES))
+        self.assertTrue(all(info.permissions == 0o750 for info in files))
+        self.assertEqual(make_dir.call_count, len(workload_storage.DIRECTORIES))
+        self.assertEqual(make_dir.call_args.kwargs["user"], "gh_exporter")
+
+        self.harness.charm.on.update_status.emit()
+
+        metrics = container.pull("/srv/gh_exporter/charm-metrics/metrics.txt").read()
+        self.assertIn("charm_storage_capacity_bytes ", metrics)
+        self.assertIn("charm_storage_available_bytes ", metrics)